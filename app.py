@@ -1,19 +1,35 @@
 """
 Flask backend API for the car search tool
 """
-from flask import Flask, render_template, request, jsonify, g, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, g, session, redirect, url_for, stream_with_context, send_file
 from flask_cors import CORS
 from search_coordinator import SearchCoordinator
+from search_jobs import SearchJobManager
+from saved_searches import SavedSearchScheduler, get_saved_search_store, DEFAULT_INTERVAL
+from listing_table import parse_sort
+from result_cache import make_cache_key
+from result_snapshots import get_snapshot_store, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from image_proxy import get_image_proxy, proxy_images, CACHE_CONTROL
+from scraper.metrics import get_metrics
+from scraper.tracing import span, tracing
+from dedup import DuplicateIndex
+from db import get_connection, release_connection
+from response_encoding import FastJSONProvider, dumps, encode_listings, iter_listings, iter_object, streamed_response
 import traceback
+import re
 import sqlite3
 import os
 from datetime import datetime
+from contextlib import nullcontext
 from functools import wraps
 
 DATABASE = 'notes.db'
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-12345')
+# Notes database; NOTES_DATABASE overrides the file, tests point this at a temp file
+app.config['DATABASE'] = os.environ.get('NOTES_DATABASE', DATABASE)
 CORS(app)  # Enable CORS for frontend
 
 # Password protection - password is "car"
@@ -28,17 +44,18 @@ def require_auth(f):
     return decorated
 
 def get_db():
+    """This thread's notes connection (WAL, busy timeout), reused across requests"""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        g._database_path = app.config['DATABASE']
+        db = g._database = get_connection(g._database_path)
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    # The connection stays open for the thread's next request
+    if getattr(g, '_database', None) is not None:
+        release_connection(g._database_path)
 
 def init_db():
     with app.app_context():
@@ -55,11 +72,91 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # One note per listing: keep the newest of any duplicates saved before url was unique
+        db.execute('DELETE FROM notes WHERE id NOT IN (SELECT MAX(id) FROM notes GROUP BY url)')
+        db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notes_url ON notes (url)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_notes_created ON notes (created_at, id)')
         db.commit()
 
+# Notes per page of GET /api/notes, and URLs per IN (...) lookup
+NOTE_PREVIEW_LENGTH = 80
+NOTES_PAGE_SIZE = 100
+NOTES_MAX_PAGE_SIZE = 500
+_LOOKUP_CHUNK = 500
+
+def find_notes(db, urls):
+    """url -> note row for the urls that have a note, using the unique url index"""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    found = {}
+    for start in range(0, len(urls), _LOOKUP_CHUNK):
+        chunk = urls[start:start + _LOOKUP_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        for row in db.execute(f'SELECT * FROM notes WHERE url IN ({placeholders})', chunk):
+            found[row['url']] = dict(row)
+    return found
+
+def annotate_notes(listings_data):
+    """
+    Set has_note and note_preview on listing dicts with one batched lookup.
+    A note saved on any of a listing's alternate URLs counts too.
+    """
+    if not listings_data:
+        return listings_data
+    urls_of = [[listing['url']] + list(listing.get('alternate_urls') or []) for listing in listings_data]
+    try:
+        found = find_notes(get_db(), (url for urls in urls_of for url in urls))
+    except sqlite3.Error as e:
+        print(f"[ERROR] Could not look up notes: {e}")
+        found = {}
+    for listing, urls in zip(listings_data, urls_of):
+        note = next((found[url] for url in urls if url in found), None)
+        listing['has_note'] = note is not None
+        if note is None:
+            listing['note_preview'] = None
+        else:
+            text = note['note'] or ''
+            listing['note_preview'] = text if len(text) <= NOTE_PREVIEW_LENGTH \
+                else text[:NOTE_PREVIEW_LENGTH - 1].rstrip() + '…'
+    return listings_data
+
 # Initialize DB on start
 init_db()
 
+# Background searches; each runs in the worker that started it, but any worker
+# can answer polls because job state is kept in a SQLite file they all share
+search_jobs = SearchJobManager(
+    coordinator_factory=lambda: SearchCoordinator(),
+    path=os.environ.get('SEARCH_JOBS_PATH', 'search_jobs.db'),
+    max_workers=int(os.environ.get('SEARCH_JOB_WORKERS', 2)),
+    ttl=float(os.environ.get('SEARCH_JOB_TTL', 600)),
+    max_age=float(os.environ.get('SEARCH_JOB_MAX_AGE', 1800))
+)
+
+saved_searches = get_saved_search_store()
+
+def start_saved_search_scheduler():
+    """
+    Refresh saved searches on a thread of this process, when SAVED_SEARCH_SCHEDULER=1.
+
+    Not started on import: gunicorn's post_worker_init hook and `python app.py`
+    call this, and `python saved_searches.py` runs the scheduler on its own
+    instead. Claims are atomic, so several schedulers never run the same search.
+    """
+    if saved_searches is None or \
+            os.environ.get('SAVED_SEARCH_SCHEDULER', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    scheduler = SavedSearchScheduler(saved_searches, SearchCoordinator,
+                                     tick=float(os.environ.get('SAVED_SEARCH_TICK', 30)))
+    scheduler.start()
+    return scheduler
+
+# Finished searches are kept as snapshots so results can be paged, re-sorted
+# and shared by link without scraping again
+result_snapshots = get_snapshot_store()
+
+# Listing images are served as cached thumbnails from /img/<key> instead of hotlinked
+image_proxy = get_image_proxy()
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -81,99 +178,202 @@ def index():
     """Serve the main page"""
     return render_template('index.html')
 
+def safe_int(value):
+    """Convert a form value to int, treating blanks and junk as None"""
+    if not value or value == '':
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+def parse_search_params(data):
+    """
+    Turn a search request body into SearchCoordinator.search_all keyword arguments.
+    Returns (params, error_message); params is None when the request is invalid.
+    """
+    if not data:
+        return None, 'No data provided'
+    
+    # Extract search parameters
+    make_input = data.get('make', '').strip() if data.get('make') else ''
+    model = data.get('model', '').strip() if data.get('model') else None
+    location = data.get('location', '').strip() if data.get('location') else None
+    
+    # Parse makes - can be comma-separated string or list
+    if isinstance(make_input, list):
+        makes = [m.strip() for m in make_input if m.strip()]
+    else:
+        makes = [m.strip() for m in make_input.split(',') if m.strip()]
+    
+    # Validate required fields
+    if not location:
+        return None, 'Location is required'
+    
+    return {
+        'makes': makes,
+        'model': model,
+        'year_min': safe_int(data.get('year_min')),
+        'year_max': safe_int(data.get('year_max')),
+        'price_min': safe_int(data.get('price_min')),
+        'price_max': safe_int(data.get('price_max')),
+        'location': location,
+        'max_results': safe_int(data.get('max_results', 20)) or 20,
+        'enable_facebook': data.get('enable_facebook', False),
+        'private_sellers_only': data.get('private_sellers_only', False),
+        'use_cache': not data.get('refresh', False),
+        'incremental': bool(data.get('incremental', False)),
+    }, None
+
+def parse_view_params(data):
+    """
+    Pull the result filters and ordering that apply after scraping out of a search request body.
+    Returns (view, error_message); view is None when the request is invalid.
+    """
+    data = data or {}
+    sources = data.get('sources') or None
+    if isinstance(sources, str):
+        sources = [s.strip() for s in sources.split(',') if s.strip()]
+    
+    sort = data.get('sort') or None
+    try:
+        parse_sort(sort)
+    except ValueError as e:
+        return None, str(e)
+    
+    limit = safe_int(data.get('limit'))
+    return {
+        'mileage_max': safe_int(data.get('mileage_max')),
+        'sources': sources,
+        'sort': sort,
+        'limit': limit if limit and limit > 0 else None,
+        'dedupe': data.get('dedupe', True) is not False,
+    }, None
+
+def listing_dicts(listings):
+    """Listings as API dicts: note flags added, images pointed at the thumbnail proxy"""
+    return proxy_images(image_proxy, annotate_notes([listing.to_dict() for listing in listings]))
+
+def parse_page_size(value):
+    """A requested page size capped at MAX_PAGE_SIZE, or None when absent or invalid"""
+    size = safe_int(value)
+    return min(size, MAX_PAGE_SIZE) if size and size > 0 else None
+
+def snapshot_results(listings, coordinator, params, view, summary):
+    """Store ordered listings as a result snapshot; None when snapshots are off or storing failed"""
+    if result_snapshots is None:
+        return None
+    try:
+        return result_snapshots.create(listings, meta={
+            'search': params,
+            'summary': summary,
+            'sort': view['sort'],
+            'dedup': coordinator.dedup_info,
+        }, seen_at=coordinator.seen_at)
+    except Exception as e:
+        print(f"[ERROR] Could not store result snapshot: {e}")
+        return None
+
+def trace_format(data):
+    """
+    How to return a trace of the search: 'tree' for "debug": true, 'chrome' for
+    "debug": "chrome" (Chrome trace-event JSON), or None to not trace at all
+    """
+    debug = (data or {}).get('debug')
+    if debug == 'chrome':
+        return 'chrome'
+    return 'tree' if debug else None
+
+def refresh_key(params):
+    """Identifies a store-mode background refresh, so identical ones can be coalesced"""
+    makes = ','.join(sorted(make.lower() for make in params['makes']))
+    source = 'refresh+facebook' if params['enable_facebook'] else 'refresh'
+    return make_cache_key(source, makes, params['model'], params['year_min'], params['year_max'],
+                          params['price_min'], params['price_max'], params['location'],
+                          params['max_results'], params['private_sellers_only'])
+
+def response_format(data):
+    """'columnar' when the client asked for the compact listing payload, else None (a plain list)"""
+    return 'columnar' if (data or {}).get('format') == 'columnar' else None
+
 @app.route('/api/search', methods=['POST'])
 def search():
     """API endpoint for car searches"""
     try:
         data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'error': 'No data provided',
-                'success': False
-            }), 400
-        
-        # Extract search parameters
-        make_input = data.get('make', '').strip() if data.get('make') else ''
-        model = data.get('model', '').strip() if data.get('model') else None
-        year_min = data.get('year_min')
-        year_max = data.get('year_max')
-        price_min = data.get('price_min')
-        price_max = data.get('price_max')
-        location = data.get('location', '').strip() if data.get('location') else None
-        max_results = data.get('max_results', 20)
-        enable_facebook = data.get('enable_facebook', False)
-        private_sellers_only = data.get('private_sellers_only', False)
-        
-        # Parse makes - can be comma-separated string or list
-        if isinstance(make_input, list):
-            makes = [m.strip() for m in make_input if m.strip()]
-        else:
-            makes = [m.strip() for m in make_input.split(',') if m.strip()]
-        
-        # Validate required fields
-        if not location:
+        params, error = parse_search_params(data)
+        if not error:
+            view, error = parse_view_params(data)
+        if error:
             return jsonify({
-                'error': 'Location is required',
+                'error': error,
                 'success': False
             }), 400
         
-        # Convert numeric fields safely
-        def safe_int(value):
-            if not value or value == '':
-                return None
-            try:
-                return int(value)
-            except (ValueError, TypeError):
-                return None
-        
-        year_min = safe_int(year_min)
-        year_max = safe_int(year_max)
-        price_min = safe_int(price_min)
-        price_max = safe_int(price_max)
-        max_results = safe_int(max_results) or 20
-        
-        # Initialize coordinator
-        coordinator = SearchCoordinator()
-        
-        # Search all sites
-        results = coordinator.search_all(
-            makes=makes,
-            model=model,
-            year_min=year_min,
-            year_max=year_max,
-            price_min=price_min,
-            price_max=price_max,
-            location=location,
-            max_results=max_results,
-            enable_facebook=enable_facebook,
-            private_sellers_only=private_sellers_only
-        )
-        
-        # Get all listings
-        all_listings = coordinator.get_all_listings(results)
-        
-        # Apply additional filtering
-        all_listings = coordinator.filter_listings(
-            all_listings,
-            year_min=year_min,
-            year_max=year_max,
-            price_min=price_min,
-            price_max=price_max
-        )
-        
-        # Convert to dictionaries
-        listings_data = [listing.to_dict() for listing in all_listings]
-        
-        # Create summary
-        summary = {source: len(listings) for source, listings in results.items()}
-        
-        return jsonify({
-            'success': True,
-            'summary': summary,
-            'total': len(listings_data),
-            'listings': listings_data
-        })
+        # "debug" records where the search spent its time and returns it with the results
+        fmt = trace_format(data)
+        with tracing('api_search') if fmt else nullcontext() as trace:
+            # Initialize coordinator
+            coordinator = SearchCoordinator()
+            
+            # "store" mode answers from previously scraped listings straight away
+            # and refreshes them in the background; poll refresh_job_id for news
+            mode = 'store' if data.get('mode') == 'store' and coordinator.store is not None else 'live'
+            refresh_job = None
+            if mode == 'store':
+                results = coordinator.stored_results(**params)
+                # Only new listings need scraping - the rest are already stored
+                # Identical store-mode searches share one pending refresh instead of each scraping
+                refresh_job = search_jobs.submit(dict(params, incremental=True),
+                                                 dedupe_key=refresh_key(params))
+            else:
+                # Search all sites
+                results = coordinator.search_all(**params)
+            
+            # Merge, filter and sort all listings
+            all_listings = coordinator.query_listings(
+                results,
+                year_min=params['year_min'],
+                year_max=params['year_max'],
+                price_min=params['price_min'],
+                price_max=params['price_max'],
+                **view
+            )
+            
+            # Create summary
+            summary = {source: len(listings) for source, listings in results.items()}
+            
+            response = {
+                'success': True,
+                'mode': mode,
+                'summary': summary,
+                'cache': coordinator.cache_info,
+                'dedup': coordinator.dedup_info,
+                'total': len(all_listings),
+            }
+            
+            # With page_size only the first page is sent; the rest is read from the snapshot
+            with span('snapshot'):
+                snapshot = snapshot_results(all_listings, coordinator, params, view, summary)
+            page_size = parse_page_size(data.get('page_size'))
+            if snapshot is not None:
+                response['snapshot'] = snapshot.describe()
+                if page_size:
+                    all_listings, _, next_offset = snapshot.page(limit=page_size)
+                    response['next_cursor'] = str(next_offset) if next_offset is not None else None
+            
+            # Convert to dictionaries, marking the ones that already have a note
+            with span('listing_dicts', listings=len(all_listings)):
+                listings_data = listing_dicts(all_listings)
+        if trace is not None:
+            response['trace'] = trace.chrome_trace() if fmt == 'chrome' else trace.to_dict()
+        if refresh_job is not None:
+            response['stored'] = coordinator.store_info
+            response['refresh_job_id'] = refresh_job.id
+        # Listings go last and are encoded a chunk at a time, compressed if the client accepts it
+        return streamed_response(
+            iter_object(response, 'listings', iter_listings(listings_data, response_format(data))),
+            request.headers.get('Accept-Encoding'))
         
     except ValueError as e:
         print(f"ValueError in search API: {e}")
@@ -194,15 +394,322 @@ def search():
             'traceback': traceback.format_exc() if app.debug else None
         }), 500
 
+@app.route('/api/search/stream', methods=['POST'])
+def search_stream():
+    """
+    Streaming variant of /api/search.
+    Responds with newline-delimited JSON: one "source" event per site as soon as
+    it finishes, then a final "summary" event (or an "error" event). When a sort
+    or limit is requested the summary also carries the final ordered listings.
+    """
+    data = request.get_json(silent=True)
+    params, error = parse_search_params(data)
+    if not error:
+        view, error = parse_view_params(data)
+    if error:
+        return jsonify({
+            'error': error,
+            'success': False
+        }), 400
+    
+    fmt = response_format(data)
+    page_size = parse_page_size(data.get('page_size'))
+
+    def generate():
+        coordinator = SearchCoordinator()
+        summary = {}
+        results = {}
+        total = 0
+        # Drops listings already sent from an earlier site (or earlier on the same page)
+        duplicates = DuplicateIndex() if view['dedupe'] else None
+        try:
+            for source_name, listings in coordinator.iter_search(**params):
+                summary[source_name] = len(listings)
+                results[source_name] = listings
+                filtered = coordinator.filter_listings(
+                    listings,
+                    year_min=params['year_min'],
+                    year_max=params['year_max'],
+                    price_min=params['price_min'],
+                    price_max=params['price_max'],
+                    mileage_max=view['mileage_max'],
+                    sources=view['sources']
+                )
+                repeated = []
+                if duplicates is not None:
+                    unique = []
+                    for listing in filtered:
+                        index = duplicates.add(listing)
+                        root = duplicates.find(index)
+                        if root == index:
+                            unique.append(listing)
+                        else:
+                            repeated.append({'url': listing.url,
+                                             'duplicate_of': duplicates.listings[root].url})
+                    filtered = unique
+                total += len(filtered)
+                yield dumps({
+                    'type': 'source',
+                    'source': source_name,
+                    'count': len(listings),
+                    'cache': coordinator.cache_info.get(source_name),
+                    'listings': encode_listings(
+                        listing_dicts(filtered), fmt),
+                    'duplicates': repeated
+                }) + b'\n'
+            
+            event = {
+                'type': 'summary',
+                'success': True,
+                'summary': summary,
+                'cache': coordinator.cache_info,
+                'total': total
+            }
+            if duplicates is not None:
+                seen = len(duplicates)
+                event['dedup'] = {
+                    'input': seen,
+                    'output': total,
+                    'ratio': round((seen - total) / seen, 3) if seen else 0.0,
+                }
+            if view['sort'] or view['limit'] or result_snapshots is not None:
+                ordered = coordinator.query_listings(
+                    results,
+                    year_min=params['year_min'],
+                    year_max=params['year_max'],
+                    price_min=params['price_min'],
+                    price_max=params['price_max'],
+                    **view
+                )
+                snapshot = snapshot_results(ordered, coordinator, params, view, summary)
+                if snapshot is not None:
+                    event['snapshot'] = snapshot.describe()
+                # The final listings: all of them when sorted or limited, the first page with page_size
+                listings = ordered if view['sort'] or view['limit'] else None
+                if snapshot is not None and page_size:
+                    listings, _, next_offset = snapshot.page(limit=page_size)
+                    event['next_cursor'] = str(next_offset) if next_offset is not None else None
+                if listings is not None:
+                    event['sort'] = view['sort']
+                    if view['dedupe']:
+                        event['dedup'] = coordinator.dedup_info
+                    event['total'] = len(ordered)
+                    event['listings'] = encode_listings(
+                        listing_dicts(listings), fmt)
+            yield dumps(event) + b'\n'
+        except Exception as e:
+            print(f"Error in streaming search API: {e}")
+            traceback.print_exc()
+            yield dumps({
+                'type': 'error',
+                'success': False,
+                'error': f'{type(e).__name__}: {e}'
+            }) + b'\n'
+    
+    # Each event is flushed through the compressor so the client can render it immediately
+    return streamed_response(stream_with_context(generate()), request.headers.get('Accept-Encoding'),
+                             mimetype='application/x-ndjson', flush_each=True,
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/results/<snapshot_id>', methods=['GET'])
+def get_result_page(snapshot_id):
+    """
+    One page of a stored search's results, without scraping again.
+    ?limit= page size (default 20), ?cursor= the previous page's next_cursor,
+    ?sort= re-orders (default: the search's own order), ?sources= narrows to some sites.
+    """
+    snapshot = result_snapshots.get(snapshot_id) if result_snapshots is not None else None
+    if snapshot is None:
+        return jsonify({'success': False, 'error': 'Results not found or expired'}), 404
+    
+    sort = request.args.get('sort') or None
+    try:
+        parse_sort(sort)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    cursor = request.args.get('cursor') or '0'
+    if not cursor.isdigit():
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    sources = [s.strip() for value in request.args.getlist('sources')
+               for s in value.split(',') if s.strip()] or None
+    limit = parse_page_size(request.args.get('limit')) or DEFAULT_PAGE_SIZE
+    
+    listings, total, next_offset = snapshot.page(sort, sources, int(cursor), limit)
+    return jsonify({
+        'success': True,
+        'snapshot': snapshot.describe(),
+        'search': snapshot.meta.get('search'),
+        'summary': snapshot.meta.get('summary'),
+        'sort': sort or snapshot.meta.get('sort'),
+        'total': total,
+        'listings': encode_listings(listing_dicts(listings),
+                                    response_format(request.args)),
+        'next_cursor': str(next_offset) if next_offset is not None else None,
+    })
+
+
+@app.route('/img/<key>', methods=['GET'])
+def proxied_image(key):
+    """A listing image as a cached thumbnail; redirects to the original if it can't be fetched"""
+    if image_proxy is None or not re.fullmatch(r'[0-9a-f]{64}', key):
+        return jsonify({'success': False, 'error': 'Image not found'}), 404
+    found = image_proxy.get(key)
+    if found is None:
+        url = image_proxy.source_url(key)
+        if url is None:
+            return jsonify({'success': False, 'error': 'Image not found'}), 404
+        return redirect(url)
+    path, content_type = found
+    response = send_file(path, mimetype=content_type, conditional=True, etag=key)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Scraper metrics of every worker sharing METRICS_PATH, in Prometheus text format"""
+    registry = get_metrics()
+    if registry is None:
+        return jsonify({'success': False, 'error': 'Metrics are disabled'}), 404
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/search/jobs', methods=['POST'])
+def create_search_job():
+    """Start a search in the background and return its job id immediately"""
+    params, error = parse_search_params(request.get_json(silent=True))
+    if error:
+        return jsonify({
+            'error': error,
+            'success': False
+        }), 400
+    
+    job = search_jobs.submit(params)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status
+    }), 202
+
+@app.route('/api/search/jobs/<job_id>', methods=['GET'])
+def get_search_job(job_id):
+    """
+    Poll a search job.
+    ?since=N returns only listings after the first N; ?wait=S long-polls up to S seconds for news.
+    """
+    job = search_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    
+    since = max(request.args.get('since', 0, type=int), 0)
+    wait = min(request.args.get('wait', 0.0, type=float), 25)
+    if wait > 0 and job.total <= since:
+        job = search_jobs.wait(job, job.version, wait)
+    
+    described = search_jobs.describe(job, since)
+    # Copies, so the job keeps the original image URLs
+    described['listings'] = proxy_images(image_proxy, [dict(l) for l in described['listings']])
+    return jsonify({'success': True, 'job': described})
+
+@app.route('/api/saved-searches', methods=['GET'])
+def list_saved_searches():
+    """Saved searches with their count of unchecked changes"""
+    if saved_searches is None:
+        return jsonify({'success': False, 'error': 'Saved searches are disabled'}), 404
+    return jsonify({'success': True, 'searches': saved_searches.list_all()})
+
+@app.route('/api/saved-searches', methods=['POST'])
+def create_saved_search():
+    """Save a search body (as for /api/search) plus a name and interval_minutes"""
+    if saved_searches is None:
+        return jsonify({'success': False, 'error': 'Saved searches are disabled'}), 404
+    data = request.get_json(silent=True)
+    params, error = parse_search_params(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    # Refreshes always reuse the cache and crawl incrementally
+    params = {k: v for k, v in params.items() if k not in ('use_cache', 'incremental')}
+    
+    interval = safe_int(data.get('interval_minutes'))
+    name = (data.get('name') or '').strip() or ', '.join(params['makes']) or params['location']
+    search = saved_searches.create(name, params,
+                                   interval * 60 if interval else DEFAULT_INTERVAL)
+    return jsonify({'success': True, 'search': search}), 201
+
+@app.route('/api/saved-searches/<int:search_id>', methods=['DELETE'])
+def delete_saved_search(search_id):
+    if saved_searches is None or not saved_searches.delete(search_id):
+        return jsonify({'success': False, 'error': 'Saved search not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/saved-searches/<int:search_id>/changes', methods=['GET'])
+def get_saved_search_changes(search_id):
+    """
+    New listings, price changes and removals recorded by the refreshes.
+    Defaults to the changes not checked yet; ?since=ID pages through older ones without marking them.
+    """
+    search = saved_searches.get(search_id) if saved_searches is not None else None
+    if search is None:
+        return jsonify({'success': False, 'error': 'Saved search not found'}), 404
+    since = request.args.get('since', type=int)
+    changes = saved_searches.changes(search_id, since=since, mark_seen=since is None)
+    return jsonify({'success': True, 'search': search, 'changes': changes})
+
+@app.route('/api/saved-searches/<int:search_id>/refresh', methods=['POST'])
+def refresh_saved_search(search_id):
+    """Queue a saved search for the scheduler's next tick"""
+    if saved_searches is None or not saved_searches.run_now(search_id):
+        return jsonify({'success': False, 'error': 'Saved search not found'}), 404
+    return jsonify({'success': True}), 202
 
 @app.route('/api/notes', methods=['GET'])
 def get_notes():
-    """Get all saved notes"""
+    """
+    Get saved notes, newest first, a page at a time.
+    ?url=... (repeatable) returns just the notes of those listings.
+    Otherwise ?limit=N sets the page size and ?cursor= takes the next_cursor of the previous page.
+    """
     try:
         db = get_db()
-        cur = db.execute('SELECT * FROM notes ORDER BY created_at DESC')
+        urls = request.args.getlist('url')
+        if urls:
+            found = find_notes(db, urls)
+            notes = [found[u] for u in dict.fromkeys(urls) if u in found]
+            return jsonify({'success': True, 'notes': proxy_images(image_proxy, notes)})
+        
+        limit = request.args.get('limit', NOTES_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), NOTES_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            created_at, _, last_id = cursor.rpartition('|')
+            if not created_at or not last_id.isdigit():
+                return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+            cur = db.execute('''
+                SELECT * FROM notes WHERE (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC LIMIT ?
+            ''', (created_at, int(last_id), limit + 1))
+        else:
+            cur = db.execute('SELECT * FROM notes ORDER BY created_at DESC, id DESC LIMIT ?', (limit + 1,))
         notes = [dict(row) for row in cur.fetchall()]
-        return jsonify({'success': True, 'notes': notes})
+        
+        next_cursor = None
+        if len(notes) > limit:
+            notes = notes[:limit]
+            next_cursor = f"{notes[-1]['created_at']}|{notes[-1]['id']}"
+        return jsonify({'success': True, 'notes': proxy_images(image_proxy, notes), 'next_cursor': next_cursor})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/notes/lookup', methods=['POST'])
+def lookup_notes():
+    """Notes of many listings at once: {"urls": [...]} -> {"notes": {url: note}}"""
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list):
+        return jsonify({'success': False, 'error': 'urls must be a list'}), 400
+    try:
+        return jsonify({'success': True, 'notes': find_notes(get_db(), (u for u in urls if isinstance(u, str)))})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -219,26 +726,24 @@ def save_note():
             
         db = get_db()
         
-        # Check if note exists for this URL
-        cur = db.execute('SELECT id FROM notes WHERE url = ?', (url,))
-        existing = cur.fetchone()
-        
-        if existing:
-            db.execute('UPDATE notes SET note = ?, created_at = CURRENT_TIMESTAMP WHERE url = ?',
-                      (note_text, url))
-        else:
-            db.execute('''
-                INSERT INTO notes (url, title, price, source, image_url, note)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                url,
-                data.get('title', 'Unknown Car'),
-                data.get('price', 'N/A'),
-                data.get('source', 'Unknown'),
-                data.get('image_url', ''),
-                note_text
-            ))
-            
+        # One statement, so concurrent saves of the same listing can't both insert;
+        # an existing note keeps its listing details and gets the new text
+        db.execute('''
+            INSERT INTO notes (url, title, price, source, image_url, note)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                note = excluded.note,
+                created_at = CURRENT_TIMESTAMP
+        ''', (
+            url,
+            data.get('title', 'Unknown Car'),
+            data.get('price', 'N/A'),
+            data.get('source', 'Unknown'),
+            # The page sends the proxied /img/<key> URL; keep the original so the key can be pruned
+            image_proxy.original_url(data.get('image_url') or '') if image_proxy is not None
+            else data.get('image_url', ''),
+            note_text
+        ))
         db.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -256,5 +761,8 @@ def delete_note(note_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # Not in the reloader's watcher process, or the dev server would run two schedulers
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_saved_search_scheduler()
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -0,0 +1,35 @@
+"""
+Shared test setup: keeps the test run away from the app's real data files
+"""
+import os
+import shutil
+import tempfile
+
+# Every database and cache the app opens at import or on first use
+DATA_PATHS = {
+    'NOTES_DATABASE': 'notes.db',
+    'RESULT_SNAPSHOTS_PATH': 'result_snapshots.db',
+    'SAVED_SEARCHES_PATH': 'saved_searches.db',
+    'SEARCH_JOBS_PATH': 'search_jobs.db',
+    'LISTING_STORE_PATH': 'listings.db',
+    'RESULT_CACHE_PATH': 'result_cache.db',
+    'METRICS_PATH': 'metrics.db',
+    'IMAGE_PROXY_DIR': 'images',
+    'HTTP_CACHE_DIR': 'http-cache',
+}
+
+_data_dir = None
+
+
+def pytest_configure(config):
+    """Point the app at a temp directory before any test module imports it"""
+    global _data_dir
+    _data_dir = tempfile.mkdtemp(prefix='ibuycars-test-')
+    for name, filename in DATA_PATHS.items():
+        os.environ[name] = os.path.join(_data_dir, filename)
+    os.environ['SAVED_SEARCH_SCHEDULER'] = '0'
+
+
+def pytest_unconfigure(config):
+    if _data_dir is not None:
+        shutil.rmtree(_data_dir, ignore_errors=True)
@@ -0,0 +1,60 @@
+"""
+SQLite connections for the app database, reused per thread and tuned for several gunicorn workers
+"""
+from typing import Dict
+import os
+import sqlite3
+import threading
+
+# WAL lets readers run alongside a writer from another worker; NORMAL sync is
+# safe with WAL and avoids an fsync per commit; writers wait for the lock
+# instead of failing with "database is locked"
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', '5000'),
+    ('mmap_size', str(64 * 1024 * 1024)),
+)
+
+_local = threading.local()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a connection with the pragmas applied and rows addressable by column name"""
+    db = sqlite3.connect(path, timeout=5)
+    db.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        db.execute(f'PRAGMA {name}={value}')
+    return db
+
+
+def _connections() -> Dict[str, sqlite3.Connection]:
+    # Connections must not cross a fork, so forget any inherited from the parent
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+    return _local.connections
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """This thread's connection to path, opened on first use and kept for the thread's lifetime"""
+    connections = _connections()
+    db = connections.get(path)
+    if db is None:
+        db = connections[path] = connect(path)
+    return db
+
+
+def release_connection(path: str):
+    """End a request's use of the connection: roll back anything it left uncommitted"""
+    db = _connections().get(path)
+    if db is not None and db.in_transaction:
+        db.rollback()
+
+
+def close_connections():
+    """Close every connection this thread holds"""
+    connections = _connections()
+    for db in connections.values():
+        db.close()
+    connections.clear()
@@ -0,0 +1,243 @@
+"""
+Clusters duplicate listings - reposts and the same car on several sites
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import copy
+import math
+import random
+import re
+import zlib
+import numpy as np
+from scraper.base_scraper import CarListing
+from scraper.parsing import YEAR_RE
+
+# MinHash signature length, split into LSH bands of ROWS values each.
+# Titles sharing about 60% of their shingles land in a common bucket.
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# Estimated shingle similarity needed to call a bucket match a duplicate
+SIMILARITY = 0.6
+
+# LSH buckets are split further by log-scale price and mileage bands. A
+# bucket match only counts when price or mileage agree (see _similar), so
+# this loses no matches and stops identical titles at different prices from
+# piling into one bucket.
+_PRICE_STEP = math.log(1.03)
+_MILEAGE_STEP = math.log(1.02)
+_MILEAGE_FLOOR = 25000
+_NEIGHBOURS = (-2, -1, 0, 1, 2)
+
+_PRIME = 4294967311  # first prime above 2**32
+_rng = random.Random(1234)
+# a < 2**31 keeps a * hash below 2**63, so uint64 arithmetic never wraps
+_A = np.array([_rng.randrange(1, 1 << 31) for _ in range(NUM_PERM)], dtype=np.uint64)
+_B = np.array([_rng.randrange(0, 1 << 32) for _ in range(NUM_PERM)], dtype=np.uint64)
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_YEAR_WORD_RE = re.compile(r'^(19|20)\d{2}$')
+_FILLER_WORDS = {'used', 'new', 'certified', 'cpo', 'pre', 'owned', 'for', 'sale', 'obo', 'clean'}
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower()) if text else []
+
+
+def make_model_key(title: str) -> Tuple[str, ...]:
+    """First two words of the title that aren't a year or filler - usually make and model"""
+    words = [w for w in _words(title) if w not in _FILLER_WORDS and not _YEAR_WORD_RE.match(w)]
+    return tuple(words[:2])
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature over the character 4-grams of the normalized text"""
+    normalized = ' '.join(_words(text))
+    if len(normalized) < 4:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + 4] for i in range(len(normalized) - 3)}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    return tuple(((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).tolist())
+
+
+def _title_year(title: str) -> Optional[int]:
+    match = YEAR_RE.search(title) if title else None
+    return int(match.group()) if match else None
+
+
+def _numeric_bands(listing: CarListing) -> List[Tuple[str, int]]:
+    bands = []
+    if listing.price_cents:
+        bands.append(('price', int(math.log(listing.price_cents) / _PRICE_STEP)))
+    if listing.mileage_int is not None:
+        mileage = max(listing.mileage_int, _MILEAGE_FLOOR)
+        bands.append(('mileage', int(math.log(mileage) / _MILEAGE_STEP)))
+    return bands
+
+
+def _close(a: int, b: int, tolerance: float, slack: int = 0) -> bool:
+    return abs(a - b) <= max(a, b) * tolerance + slack
+
+
+class DuplicateIndex:
+    """
+    Incremental duplicate clustering.
+
+    Each listing is compared only with listings sharing its URL, its
+    year/make/model/price key or one of its LSH buckets (within a similar
+    price or mileage band), never with the whole set. A key match alone
+    needs agreeing mileage or near-identical text to merge. Matches are merged with
+    union-find; a cluster's root is always its earliest listing.
+    """
+
+    def __init__(self):
+        self.listings: List[CarListing] = []
+        self._parent: List[int] = []
+        self._signatures: List[Tuple[int, ...]] = []
+        self._years: List[Optional[int]] = []
+        self._by_url: Dict[str, int] = {}
+        self._by_key: Dict[Tuple, List[int]] = {}
+        self._buckets: Dict[Tuple, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def add(self, listing: CarListing) -> int:
+        """Index a listing, merging it into any cluster it duplicates; returns its index"""
+        index = len(self.listings)
+        self.listings.append(listing)
+        self._parent.append(index)
+        signature = minhash(f"{listing.title} {listing.description[:200]}")
+        self._signatures.append(signature)
+        self._years.append(listing.year_int if listing.year_int is not None
+                           else _title_year(listing.title))
+
+        # Some cards carry no link; an empty URL says nothing about identity
+        if listing.url:
+            same_url = self._by_url.get(listing.url)
+            if same_url is not None:
+                self._union(same_url, index)
+            else:
+                self._by_url[listing.url] = index
+
+        if listing.year_int is not None and listing.price_cents is not None:
+            key = (listing.year_int, listing.price_cents) + make_model_key(listing.title)
+            for other in self._by_key.get(key, ()):
+                if self._key_match(other, index):
+                    self._union(other, index)
+            self._by_key.setdefault(key, []).append(index)
+
+        numeric = _numeric_bands(listing)
+        candidates = set()
+        for band in range(BANDS):
+            rows = (band,) + signature[band * ROWS:(band + 1) * ROWS]
+            for kind, value in numeric:
+                for offset in _NEIGHBOURS:
+                    candidates.update(self._buckets.get(rows + (kind, value + offset), ()))
+                self._buckets.setdefault(rows + (kind, value), []).append(index)
+        for other in sorted(candidates):
+            if other != index and self.find(other) != self.find(index) and self._similar(other, index):
+                self._union(other, index)
+
+        return index
+
+    def find(self, index: int) -> int:
+        parent = self._parent
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def clusters(self) -> List[List[int]]:
+        """Index lists of each cluster, ordered by their first listing"""
+        groups: Dict[int, List[int]] = {}
+        for index in range(len(self.listings)):
+            groups.setdefault(self.find(index), []).append(index)
+        return list(groups.values())
+
+    def _union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self._parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def _compatible(self, a: int, b: int) -> bool:
+        """False when known year, price or mileage clearly disagree"""
+        first, second = self.listings[a], self.listings[b]
+        if self._years[a] is not None and self._years[b] is not None and self._years[a] != self._years[b]:
+            return False
+        if first.price_cents is not None and second.price_cents is not None and \
+                not _close(first.price_cents, second.price_cents, 0.03):
+            return False
+        if first.mileage_int is not None and second.mileage_int is not None and \
+                not _close(first.mileage_int, second.mileage_int, 0.02, 500):
+            return False
+        return True
+
+    def _text_similar(self, a: int, b: int) -> bool:
+        matching = sum(x == y for x, y in zip(self._signatures[a], self._signatures[b]))
+        return matching >= SIMILARITY * NUM_PERM
+
+    def _key_match(self, a: int, b: int) -> bool:
+        """
+        Same year, price and make/model words: only a duplicate when mileage is
+        known on both and agrees, or the text is near-identical too - plenty of
+        different cars share a year, a round price and a model name
+        """
+        if not self._compatible(a, b):
+            return False
+        if self.listings[a].mileage_int is not None and self.listings[b].mileage_int is not None:
+            return True
+        return self._text_similar(a, b)
+
+    def _similar(self, a: int, b: int) -> bool:
+        """Near-identical text plus agreeing price or mileage"""
+        first, second = self.listings[a], self.listings[b]
+        # Identical titles alone don't make two cars the same car
+        if not ((first.price_cents is not None and second.price_cents is not None) or
+                (first.mileage_int is not None and second.mileage_int is not None)):
+            return False
+        return self._compatible(a, b) and self._text_similar(a, b)
+
+
+def _completeness(listing: CarListing) -> Tuple:
+    return (listing.price_cents is not None, listing.year_int is not None,
+            listing.mileage_int is not None, bool(listing.image_url), len(listing.description))
+
+
+def dedupe_listings(listings: Sequence[CarListing]) -> Tuple[List[CarListing], Dict]:
+    """
+    Collapse duplicate listings into one canonical listing each.
+
+    The most complete listing of a cluster is kept, carrying the other URLs
+    in alternate_urls, at the position of the cluster's first listing. The
+    input listings aren't modified - they may be shared with the result cache -
+    so a listing that gains alternate URLs is returned as a copy.
+    Returns (listings, stats) where stats has input/output counts and the
+    ratio of listings removed.
+    """
+    index = DuplicateIndex()
+    for listing in listings:
+        index.add(listing)
+
+    canonical = []
+    for cluster in index.clusters():
+        members = [index.listings[i] for i in cluster]
+        best = max(members, key=_completeness)
+        alternates = []
+        for listing in members:
+            for url in [listing.url] + list(listing.alternate_urls):
+                if url and url != best.url and url not in alternates:
+                    alternates.append(url)
+        if tuple(alternates) != best.alternate_urls:
+            best = copy.copy(best)
+            best.alternate_urls = tuple(alternates)
+        canonical.append(best)
+
+    total = len(listings)
+    stats = {
+        'input': total,
+        'output': len(canonical),
+        'ratio': round((total - len(canonical)) / total, 3) if total else 0.0,
+    }
+    return canonical, stats
@@ -27,6 +27,9 @@ def clear_chromedriver_cache():
     
     print("\nCache cleared! ChromeDriver will be re-downloaded on next run.")
     print("Make sure Chrome browser is installed before running the scraper.")
+    print("Restart the server - the ChromeDriver path is resolved once per process.")
+    print("To skip downloads entirely, set CHROMEDRIVER_PATH to a local chromedriver")
+    print("binary and CHROMEDRIVER_OFFLINE=1.")
 
 if __name__ == "__main__":
     print("="*60)
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for the car search app (picked up automatically by `gunicorn app:app`)
+"""
+import os
+
+# Threaded workers, so job polling and streamed responses don't each need a whole process.
+# Background search jobs keep their state in search_jobs.db, so any number of workers can
+# answer job polls.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def worker_exit(server, worker):
+    """Quit the worker's pooled Chrome browsers and flush its metrics before it exits"""
+    from scraper.driver_pool import shutdown_driver_pool
+    from scraper.metrics import get_metrics
+    shutdown_driver_pool()
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.forget_process()
+
+
+def post_worker_init(worker):
+    """Start the saved search scheduler in the worker when SAVED_SEARCH_SCHEDULER=1"""
+    from app import start_saved_search_scheduler
+    start_saved_search_scheduler()
+
+
+def on_starting(server):
+    """Resolve ChromeDriver once in the master so forked workers inherit the path"""
+    from scraper.chromedriver import resolve_chromedriver_path
+    resolve_chromedriver_path()
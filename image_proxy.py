@@ -0,0 +1,341 @@
+"""
+Listing images fetched once, shrunk to thumbnails and served from an on-disk LRU cache
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from db import get_connection
+import hashlib
+import io
+import os
+import requests
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Thumbnails fit in this box; cards show images at most this large
+THUMBNAIL_SIZE = (480, 360)
+# Images larger than this are not downloaded
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Proxied URLs are named after the source URL, so they can be cached for good
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# An image that failed to download isn't tried again for this many seconds
+RETRY_AFTER = 300
+# A key handed out again is re-stamped in the database at most this often per process
+TOUCH_INTERVAL = 3600
+
+
+def image_key(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def make_thumbnail(body: bytes, content_type: str) -> Tuple[bytes, str]:
+    """
+    Shrink an image to THUMBNAIL_SIZE as WebP (JPEG if Pillow lacks WebP support).
+    Without Pillow, or for anything Pillow can't read, the original is kept.
+    """
+    if Image is None:
+        return body, content_type
+    try:
+        with Image.open(io.BytesIO(body)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            try:
+                image.save(out, 'WEBP', quality=75, method=4)
+                return out.getvalue(), 'image/webp'
+            except (KeyError, OSError):
+                out = io.BytesIO()
+                image.save(out, 'JPEG', quality=80, optimize=True)
+                return out.getvalue(), 'image/jpeg'
+    except Exception as e:
+        print(f"[ERROR] Could not resize image: {e}")
+        return body, content_type
+
+
+def fetch_image(url: str, timeout: float = 10) -> Optional[Tuple[bytes, str]]:
+    """(body, content type) of an image URL, or None if it isn't a reachable image"""
+    try:
+        with requests.get(url, timeout=timeout, stream=True,
+                          headers={'User-Agent': 'Mozilla/5.0', 'Accept': 'image/*'}) as response:
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if response.status_code != 200 or not content_type.startswith('image/'):
+                return None
+            body = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                body.extend(chunk)
+                if len(body) > MAX_IMAGE_BYTES:
+                    return None
+            return bytes(body), content_type
+    except requests.RequestException as e:
+        print(f"[ERROR] Could not fetch image {url}: {e}")
+        return None
+
+
+class ImageProxy:
+    """
+    Thumbnails of listing images, one file per source URL in a size-bounded directory.
+
+    Only URLs handed out through register() are fetched, so the proxy can't be
+    pointed at arbitrary hosts. The key -> URL map lives in SQLite next to the
+    files and outlives eviction, so saved notes keep working after their
+    thumbnail is dropped; it is simply fetched again. Keys not handed out for
+    `retention` seconds are pruned, with their files, at most every
+    prune_interval; notes store the source URL (see original_url), so
+    listing them hands their keys out again. Each image is fetched once however many requests ask for
+    it at the same time, and at most `concurrency` fetches run at once per
+    process. Like HTTPCache, the directory is trimmed to max_bytes by file
+    access time.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024, concurrency: int = 4,
+                 fetch: Callable[[str], Optional[Tuple[bytes, str]]] = fetch_image,
+                 retention: Optional[float] = None, prune_interval: float = 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self.db_path = os.path.join(directory, 'sources.db')
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        # key -> [lock, number of requests holding or waiting for it]
+        self._fetching: Dict[str, list] = {}
+        self._failed: Dict[str, float] = {}
+        # key -> when this process last stamped it as handed out
+        self._known: Dict[str, float] = {}
+        os.makedirs(directory, exist_ok=True)
+        db = get_connection(self.db_path)
+        with db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS image_sources (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    content_type TEXT,
+                    registered_at REAL
+                )
+            ''')
+            columns = {row['name'] for row in db.execute('PRAGMA table_info(image_sources)')}
+            if 'registered_at' not in columns:
+                db.execute('ALTER TABLE image_sources ADD COLUMN registered_at REAL')
+            db.execute('UPDATE image_sources SET registered_at = ? WHERE registered_at IS NULL',
+                       (time.time(),))
+            db.execute('CREATE INDEX IF NOT EXISTS idx_image_sources_registered_at '
+                       'ON image_sources (registered_at)')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.img')
+
+    def register(self, urls: Iterable[str]) -> Dict[str, str]:
+        """Allow urls to be proxied; returns {url: key}"""
+        keys = {url: image_key(url) for url in urls}
+        now = time.time()
+        # Keys still being handed out are re-stamped now and then, so prune() keeps them
+        new = [(key, url, now) for url, key in keys.items()
+               if now - self._known.get(key, 0) >= TOUCH_INTERVAL]
+        if new:
+            db = get_connection(self.db_path)
+            with db:
+                db.executemany('''
+                    INSERT INTO image_sources (key, url, registered_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET registered_at = excluded.registered_at
+                ''', new)
+            with self._lock:
+                # Only spares repeat writes; forgetting is harmless
+                if len(self._known) > 100000:
+                    self._known.clear()
+                self._known.update((key, now) for key, _, _ in new)
+        return keys
+
+    def source_url(self, key: str) -> Optional[str]:
+        row = get_connection(self.db_path).execute(
+            'SELECT url FROM image_sources WHERE key = ?', (key,)).fetchone()
+        return row['url'] if row else None
+
+    def original_url(self, url: str) -> str:
+        """The source URL behind a proxied /img/<key> URL; any other URL (or an unknown key) is returned as is"""
+        if not url.startswith('/img/'):
+            return url
+        return self.source_url(url[len('/img/'):]) or url
+
+    def _cached(self, key: str) -> Optional[Tuple[str, str]]:
+        row = get_connection(self.db_path).execute(
+            'SELECT content_type FROM image_sources WHERE key = ?', (key,)).fetchone()
+        path = self._path(key)
+        if row is None or not row['content_type'] or not os.path.exists(path):
+            return None
+        try:
+            # mtime doubles as the last-access time for LRU eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return path, row['content_type']
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """(file path, content type) of the thumbnail for key, fetching it on a miss; None if unavailable"""
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        url = self.source_url(key)
+        if url is None or time.time() - self._failed.get(key, 0) < RETRY_AFTER:
+            return None
+
+        with self._lock:
+            entry = self._fetching.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # Another request may have fetched it while this one waited
+                cached = self._cached(key)
+                if cached is not None or time.time() - self._failed.get(key, 0) < RETRY_AFTER:
+                    return cached
+                with self._slots:
+                    fetched = self.fetch(url)
+                if fetched is None:
+                    with self._lock:
+                        if len(self._failed) > 10000:
+                            self._failed.clear()
+                        self._failed[key] = time.time()
+                    return None
+                body, content_type = make_thumbnail(*fetched)
+                self._write_atomic(self._path(key), body)
+                db = get_connection(self.db_path)
+                with db:
+                    db.execute('UPDATE image_sources SET content_type = ? WHERE key = ?',
+                               (content_type, key))
+                self._evict()
+                return self._cached(key)
+        finally:
+            with self._lock:
+                # Dropped by the last request out, so latecomers can't get a second lock
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._fetching[key]
+
+    def _write_atomic(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def prune(self, older_than: float) -> int:
+        """Forget keys not handed out for older_than seconds and delete their thumbnails; returns the keys removed"""
+        cutoff = time.time() - older_than
+        db = get_connection(self.db_path)
+        with db:
+            keys = [row['key'] for row in db.execute(
+                'SELECT key FROM image_sources WHERE registered_at < ?', (cutoff,))]
+            db.execute('DELETE FROM image_sources WHERE registered_at < ?', (cutoff,))
+        with self._lock:
+            for key in keys:
+                self._known.pop(key, None)
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+        return len(keys)
+
+    def _prune_if_due(self):
+        now = time.time()
+        if not self.retention or now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        try:
+            removed = self.prune(self.retention)
+            if removed:
+                print(f"[OK] Pruned {removed} images not shown in {self.retention / 86400:g} days")
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not prune images: {e}")
+
+    def _evict(self):
+        """Drop least recently used thumbnails until the directory fits in max_bytes"""
+        self._prune_if_due()
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.img'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+
+def proxy_images(proxy: Optional[ImageProxy], items: Optional[List[Dict]]) -> Optional[List[Dict]]:
+    """Point the image_url of listing (or note) dicts at /img/<key>; unchanged without a proxy"""
+    if proxy is None or not items:
+        return items
+    try:
+        # Notes saved with an already proxied URL are registered again by their source,
+        # so prune() doesn't forget images that are still on screen
+        for item in items:
+            if (item.get('image_url') or '').startswith('/img/'):
+                item['image_url'] = proxy.original_url(item['image_url'])
+        urls = [item['image_url'] for item in items
+                if (item.get('image_url') or '').startswith(('http://', 'https://'))]
+        if not urls:
+            return items
+        keys = proxy.register(urls)
+    except Exception as e:
+        print(f"[ERROR] Could not register images: {e}")
+        return items
+    for item in items:
+        key = keys.get(item.get('image_url'))
+        if key is not None:
+            item['image_url'] = '/img/' + key
+    return items
+
+
+_proxy: Optional[ImageProxy] = None
+_proxy_configured = False
+_proxy_lock = threading.Lock()
+
+
+def get_image_proxy() -> Optional[ImageProxy]:
+    """
+    Return the process-wide image proxy, or None when IMAGE_PROXY_ENABLED=0.
+
+    IMAGE_PROXY_DIR and IMAGE_PROXY_MAX_MB set the thumbnail directory and its
+    size; IMAGE_PROXY_CONCURRENCY caps simultaneous image downloads per worker.
+    IMAGE_PROXY_RETENTION_DAYS is how long an image no response has pointed
+    at is remembered (default 30, 0 keeps them forever).
+    """
+    global _proxy, _proxy_configured
+    with _proxy_lock:
+        if not _proxy_configured:
+            if os.environ.get('IMAGE_PROXY_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                directory = os.environ.get('IMAGE_PROXY_DIR',
+                                           os.path.join(tempfile.gettempdir(), 'ibuycars-images'))
+                max_mb = float(os.environ.get('IMAGE_PROXY_MAX_MB', 200))
+                days = float(os.environ.get('IMAGE_PROXY_RETENTION_DAYS', 30))
+                _proxy = ImageProxy(directory, max_bytes=int(max_mb * 1024 * 1024),
+                                    concurrency=int(os.environ.get('IMAGE_PROXY_CONCURRENCY', 4)),
+                                    retention=days * 86400 if days > 0 else None)
+            _proxy_configured = True
+        return _proxy
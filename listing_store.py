@@ -0,0 +1,254 @@
+"""
+Persistent store of every listing scraped, for answering searches without scraping
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from scraper.base_scraper import CarListing
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def normalize_location(location: Optional[str]) -> str:
+    return ' '.join((location or '').lower().split())
+
+
+class ListingStore:
+    """
+    SQLite (WAL) table of listings keyed by URL.
+
+    Each row records the make and location it was searched under, the parsed
+    year, price and mileage for indexed lookups, the full listing as JSON, and
+    when it was first and last seen. With a retention, writes also prune
+    listings (and crawl marks) not seen for that long.
+    """
+
+    def __init__(self, path: str, retention: Optional[float] = None, prune_interval: float = 3600):
+        self.path = path
+        # Listings not seen for `retention` seconds are pruned at most every prune_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS listings (
+                    url TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    make TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    year INTEGER,
+                    price_cents INTEGER,
+                    mileage INTEGER,
+                    title TEXT,
+                    data TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_listings_make_year ON listings (make, year)')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_listings_make_price ON listings (make, price_cents)')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_listings_location ON listings (location, make)')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_listings_last_seen ON listings (last_seen)')
+            # Newest-first result URLs of the last crawl of each (source, query)
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_marks (
+                    source TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    urls TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (source, query)
+                )
+            ''')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def upsert(self, listings_by_make: Dict[str, List[CarListing]], location: Optional[str],
+               seen_at: Optional[float] = None) -> int:
+        """
+        Insert or refresh listings in one transaction; returns the number of rows written.
+
+        first_seen is kept for listings already stored, everything else is updated.
+        """
+        now = seen_at or time.time()
+        location_key = normalize_location(location)
+        rows = [
+            (listing.url, listing.source, make.lower(), location_key, listing.year_int,
+             listing.price_cents, listing.mileage_int, listing.title,
+             json.dumps(listing.to_dict()), now, now)
+            for make, listings in listings_by_make.items()
+            for listing in listings
+            if listing.url
+        ]
+        if not rows:
+            return 0
+        with self._connect() as db:
+            db.executemany('''
+                INSERT INTO listings (url, source, make, location, year, price_cents, mileage,
+                                      title, data, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    source = excluded.source,
+                    make = excluded.make,
+                    location = excluded.location,
+                    year = excluded.year,
+                    price_cents = excluded.price_cents,
+                    mileage = excluded.mileage,
+                    title = excluded.title,
+                    data = excluded.data,
+                    last_seen = excluded.last_seen
+            ''', rows)
+        self._prune_if_due()
+        return len(rows)
+
+    def _prune_if_due(self):
+        now = time.time()
+        if not self.retention or now - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = now
+        try:
+            removed = self.prune(self.retention)
+            if removed:
+                print(f"[OK] Pruned {removed} listings not seen in {self.retention / 86400:g} days")
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not prune listings: {e}")
+
+    def _select_by_url(self, column: str, urls: Iterable[str]) -> Dict[str, object]:
+        urls = list(urls)
+        found = {}
+        with self._connect() as db:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                for url, value in db.execute(
+                        f'SELECT url, {column} FROM listings WHERE url IN ({placeholders})', chunk):
+                    found[url] = value
+        return found
+
+    def first_seen(self, urls: Iterable[str]) -> Dict[str, float]:
+        """url -> first_seen for the stored ones among urls"""
+        return self._select_by_url('first_seen', urls)
+
+    def get_listings(self, urls: Iterable[str]) -> Dict[str, CarListing]:
+        """url -> listing for the stored ones among urls"""
+        return {url: CarListing.from_dict(json.loads(data))
+                for url, data in self._select_by_url('data', urls).items()}
+
+    def crawl_mark(self, source: str, query: str) -> List[str]:
+        """URLs the last crawl of this source and query returned, newest first"""
+        with self._connect() as db:
+            row = db.execute('SELECT urls FROM crawl_marks WHERE source = ? AND query = ?',
+                             (source, query)).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def set_crawl_mark(self, source: str, query: str, urls: List[str]):
+        with self._connect() as db:
+            db.execute('''
+                INSERT INTO crawl_marks (source, query, urls, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(source, query) DO UPDATE SET
+                    urls = excluded.urls,
+                    updated_at = excluded.updated_at
+            ''', (source, query, json.dumps(urls), time.time()))
+
+    def search(self, makes: List[str], model: Optional[str] = None,
+               year_min: Optional[int] = None, year_max: Optional[int] = None,
+               price_min: Optional[int] = None, price_max: Optional[int] = None,
+               location: Optional[str] = None, max_age: Optional[float] = None,
+               limit: int = 1000, per_make: Optional[int] = None) -> List[Tuple[CarListing, float, float]]:
+        """
+        Stored listings matching a search, newest first, as (listing, first_seen, last_seen).
+
+        Like filter_listings, rows with an unknown year or price are kept.
+        max_age drops listings not seen in that many seconds; per_make keeps
+        only the newest that many of each source and make, like max_results
+        does when scraping.
+        """
+        clauses = ['make IN ({})'.format(','.join('?' * len(makes)))]
+        args: List = [make.lower() for make in makes]
+        if location:
+            clauses.append('location = ?')
+            args.append(normalize_location(location))
+        if model:
+            clauses.append('title LIKE ?')
+            args.append(f'%{model}%')
+        if year_min:
+            clauses.append('(year IS NULL OR year >= ?)')
+            args.append(year_min)
+        if year_max:
+            clauses.append('(year IS NULL OR year <= ?)')
+            args.append(year_max)
+        if price_min:
+            clauses.append('(price_cents IS NULL OR price_cents >= ?)')
+            args.append(price_min * 100)
+        if price_max:
+            clauses.append('(price_cents IS NULL OR price_cents <= ?)')
+            args.append(price_max * 100)
+        if max_age:
+            clauses.append('last_seen >= ?')
+            args.append(time.time() - max_age)
+        where = ' AND '.join(clauses)
+        if per_make:
+            query = f'''
+                SELECT data, first_seen, last_seen FROM (
+                    SELECT data, first_seen, last_seen,
+                           ROW_NUMBER() OVER (PARTITION BY source, make ORDER BY last_seen DESC) AS rank
+                    FROM listings WHERE {where}
+                ) WHERE rank <= ?
+                ORDER BY last_seen DESC
+                LIMIT ?
+            '''
+            args.append(per_make)
+        else:
+            query = f'''
+                SELECT data, first_seen, last_seen FROM listings
+                WHERE {where}
+                ORDER BY last_seen DESC
+                LIMIT ?
+            '''
+        args.append(limit)
+
+        with self._connect() as db:
+            rows = db.execute(query, args).fetchall()
+        return [(CarListing.from_dict(json.loads(data)), first, last) for data, first, last in rows]
+
+    def prune(self, older_than: float) -> int:
+        """Delete listings, and crawl marks, not seen for older_than seconds; returns the listings removed"""
+        cutoff = time.time() - older_than
+        with self._connect() as db:
+            cur = db.execute('DELETE FROM listings WHERE last_seen < ?', (cutoff,))
+            db.execute('DELETE FROM crawl_marks WHERE updated_at < ?', (cutoff,))
+            return cur.rowcount
+
+
+_store: Optional[ListingStore] = None
+_store_configured = False
+_store_lock = threading.Lock()
+
+
+def get_listing_store() -> Optional[ListingStore]:
+    """
+    Return the process-wide listing store, or None when disabled.
+
+    LISTING_STORE_ENABLED=0 turns it off; LISTING_STORE_PATH sets the
+    database file (default listings.db) and LISTING_STORE_RETENTION_DAYS how
+    long unseen listings are kept (default 30, 0 keeps them forever).
+    """
+    global _store, _store_configured
+    with _store_lock:
+        if not _store_configured:
+            if os.environ.get('LISTING_STORE_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                days = float(os.environ.get('LISTING_STORE_RETENTION_DAYS', 30))
+                _store = ListingStore(os.environ.get('LISTING_STORE_PATH', 'listings.db'),
+                                      retention=days * 86400 if days > 0 else None)
+            _store_configured = True
+        return _store
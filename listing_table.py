@@ -0,0 +1,133 @@
+"""
+Columnar view of merged search results for vectorized filtering and sorting
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scraper.base_scraper import CarListing
+
+# Sort keys accepted by ListingTable.query; prefix with '-' for descending
+SORT_KEYS = ('price', 'year', 'mileage', 'recency')
+
+
+def parse_sort(sort: Optional[str]) -> List[Tuple[str, bool]]:
+    """
+    'price,-year' -> [('price', False), ('year', True)]
+
+    Raises ValueError for unknown keys. Empty or 'relevance' keeps the source order.
+    """
+    keys = []
+    for part in (sort or '').split(','):
+        part = part.strip().lower()
+        if not part or part == 'relevance':
+            continue
+        descending = part.startswith('-')
+        name = part.lstrip('-')
+        if name not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{name}' (expected one of {', '.join(SORT_KEYS)})")
+        keys.append((name, descending))
+    return keys
+
+
+class ListingTable:
+    """
+    Listings held as NumPy columns: year, price (cents), mileage, source id and recency.
+
+    Missing numbers are NaN. Like filter_listings, filters keep listings with
+    a missing value, and sorts put them last whichever the direction.
+    """
+
+    def __init__(self, listings: Sequence[CarListing], seen_at: Optional[Dict[str, float]] = None):
+        self.listings = list(listings)
+        seen_at = seen_at or {}
+
+        self.sources: List[str] = []
+        source_ids: Dict[str, int] = {}
+        ids = []
+        for listing in self.listings:
+            source_id = source_ids.get(listing.source)
+            if source_id is None:
+                source_id = source_ids[listing.source] = len(self.sources)
+                self.sources.append(listing.source)
+            ids.append(source_id)
+        self._source_ids = source_ids
+
+        count = len(self.listings)
+        self.source_id = np.array(ids, dtype=np.int32)
+        self.year = np.fromiter(
+            (np.nan if l.year_int is None else l.year_int for l in self.listings),
+            dtype=np.float64, count=count)
+        self.price = np.fromiter(
+            (np.nan if l.price_cents is None else l.price_cents for l in self.listings),
+            dtype=np.float64, count=count)
+        self.mileage = np.fromiter(
+            (np.nan if l.mileage_int is None else l.mileage_int for l in self.listings),
+            dtype=np.float64, count=count)
+        self.recency = np.fromiter(
+            (seen_at.get(l.url, np.nan) for l in self.listings),
+            dtype=np.float64, count=count)
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def mask(self, year_min: Optional[int] = None, year_max: Optional[int] = None,
+             price_min: Optional[int] = None, price_max: Optional[int] = None,
+             mileage_max: Optional[int] = None,
+             sources: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Boolean mask of rows passing the filters; prices are in dollars"""
+        keep = np.ones(len(self), dtype=bool)
+        # NaN comparisons are False, so `~(col < bound)` keeps missing values
+        with np.errstate(invalid='ignore'):
+            if year_min:
+                keep &= ~(self.year < year_min)
+            if year_max:
+                keep &= ~(self.year > year_max)
+            if price_min:
+                keep &= ~(self.price < price_min * 100)
+            if price_max:
+                keep &= ~(self.price > price_max * 100)
+            if mileage_max:
+                keep &= ~(self.mileage > mileage_max)
+        if sources:
+            wanted = [self._source_ids[s] for s in sources if s in self._source_ids]
+            keep &= np.isin(self.source_id, wanted)
+        return keep
+
+    def order(self, rows: np.ndarray, sort: Sequence[Tuple[str, bool]],
+              limit: Optional[int] = None) -> np.ndarray:
+        """
+        Sort row indices by the (key, descending) pairs, keeping source order for ties.
+
+        With a limit below the row count, only rows that can reach the top
+        `limit` by the primary key are fully sorted.
+        """
+        if not sort or len(rows) == 0:
+            return rows[:limit] if limit is not None else rows
+
+        columns = []
+        for name, descending in sort:
+            column = getattr(self, name)[rows]
+            if descending:
+                column = -column
+            # Missing values sort last in either direction
+            columns.append(np.where(np.isnan(column), np.inf, column))
+
+        if limit is not None and limit < len(rows):
+            primary = columns[0]
+            cutoff = np.partition(primary, limit - 1)[limit - 1] if limit > 0 else -np.inf
+            candidates = np.flatnonzero(primary <= cutoff)
+            rows = rows[candidates]
+            columns = [column[candidates] for column in columns]
+
+        # lexsort treats the last key as primary; row index breaks ties
+        ordering = np.lexsort([rows] + columns[::-1])
+        return rows[ordering][:limit] if limit is not None else rows[ordering]
+
+    def query(self, year_min: Optional[int] = None, year_max: Optional[int] = None,
+              price_min: Optional[int] = None, price_max: Optional[int] = None,
+              mileage_max: Optional[int] = None, sources: Optional[Sequence[str]] = None,
+              sort: Optional[str] = None, limit: Optional[int] = None) -> List[CarListing]:
+        """Filter, sort and truncate in one pass; sort uses the parse_sort format"""
+        rows = np.flatnonzero(self.mask(year_min, year_max, price_min, price_max,
+                                        mileage_max, sources))
+        rows = self.order(rows, parse_sort(sort), limit)
+        return [self.listings[i] for i in rows]
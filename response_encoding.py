@@ -0,0 +1,214 @@
+"""
+Fast JSON encoding, compact listing payloads and negotiated compression for API responses
+"""
+from typing import Dict, Iterable, Iterator, List, Optional
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+import itertools
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+# Listings encoded per chunk of a streamed array
+CHUNK_SIZE = 200
+# Columnar payloads store these fields as indexes into a per-response string table
+INTERNED_FIELDS = ('source', 'location')
+
+
+def dumps(obj) -> bytes:
+    """Compact JSON as UTF-8 bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson when available"""
+
+    # Key order means nothing to the clients; sorting every response only costs time
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        # jsonify() always asks for compact separators or indent=2; both map onto orjson
+        option = orjson.OPT_NON_STR_KEYS
+        options = dict(kwargs)
+        if options.pop('separators', (',', ':')) != (',', ':'):
+            return super().dumps(obj, **kwargs)
+        indent = options.pop('indent', None)
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        elif indent is not None:
+            return super().dumps(obj, **kwargs)
+        if options.pop('sort_keys', False):
+            option |= orjson.OPT_SORT_KEYS
+        if options:
+            # Anything else orjson can't express goes through the json module
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+
+def columnar(listings: List[Dict]) -> Dict:
+    """
+    Pack listing dicts as field names once plus one value array per listing.
+
+    source and location become indexes into `strings`, so each distinct value
+    is sent once. The inverse is decodeListings in static/js/app.js.
+    """
+    fields: List[str] = []
+    known = set()
+    for listing in listings:
+        for name in listing:
+            if name not in known:
+                known.add(name)
+                fields.append(name)
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    interned = [name in INTERNED_FIELDS for name in fields]
+    rows = []
+    for listing in listings:
+        row = []
+        for name, intern in zip(fields, interned):
+            value = listing.get(name)
+            if intern and isinstance(value, str):
+                index = string_ids.get(value)
+                if index is None:
+                    index = string_ids[value] = len(strings)
+                    strings.append(value)
+                value = index
+            row.append(value)
+        rows.append(row)
+    return {
+        'format': 'columnar',
+        'fields': fields,
+        'interned': [name for name, intern in zip(fields, interned) if intern],
+        'strings': strings,
+        'rows': rows,
+    }
+
+
+def encode_listings(listings: List[Dict], fmt: Optional[str] = None):
+    """Listings as the requested payload format: a plain list, or columnar"""
+    return columnar(listings) if fmt == 'columnar' else listings
+
+
+def iter_array(items: List) -> Iterator[bytes]:
+    """Encode a JSON array CHUNK_SIZE elements at a time rather than as one string"""
+    yield b'['
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = dumps(items[start:start + CHUNK_SIZE])[1:-1]
+        yield (b',' if start else b'') + chunk
+    yield b']'
+
+
+def iter_object(head: Dict, key: str, value: Iterable[bytes]) -> Iterator[bytes]:
+    """Encode {**head, key: value} where value is already-encoded JSON arriving in pieces"""
+    body = dumps(head)
+    yield body[:-1] + (b',' if len(body) > 2 else b'') + dumps(key) + b':'
+    yield from value
+    yield b'}'
+
+
+def iter_listings(listings: List[Dict], fmt: Optional[str] = None) -> Iterator[bytes]:
+    """Encoded listings in the requested payload format, a chunk at a time"""
+    if fmt != 'columnar':
+        return iter_array(listings)
+    packed = columnar(listings)
+    rows = packed.pop('rows')
+    return iter_object(packed, 'rows', iter_array(rows))
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick br (when the brotli package is installed) or gzip from an Accept-Encoding header"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: Optional[str],
+                    flush_each: bool = False) -> Iterator[bytes]:
+    """
+    Compress a stream of chunks with one compressor.
+
+    flush_each pushes every chunk out as soon as it is compressed, for
+    streams the client reads event by event.
+    """
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            out = compressor.process(chunk)
+            if flush_each:
+                out += compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if flush_each:
+            out += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def streamed_response(chunks: Iterable[bytes], accept_encoding: Optional[str],
+                      mimetype: str = 'application/json', flush_each: bool = False,
+                      headers: Optional[Dict] = None) -> Response:
+    """
+    Response sending chunks as they are produced, compressed when the client accepts it.
+
+    Unless flush_each marks an event stream, chunks are read ahead up to
+    MIN_COMPRESS_SIZE first so small bodies go out uncompressed.
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    chunks = iter(chunks)
+    if encoding is not None and not flush_each:
+        ahead = []
+        size = 0
+        for chunk in chunks:
+            ahead.append(chunk)
+            size += len(chunk)
+            if size >= MIN_COMPRESS_SIZE:
+                break
+        if size < MIN_COMPRESS_SIZE:
+            encoding = None
+        chunks = itertools.chain(ahead, chunks)
+
+    response = Response(compress_chunks(chunks, encoding, flush_each), mimetype=mimetype,
+                        headers=headers)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,183 @@
+"""
+TTL/LRU cache of scraped search results, keyed per source and per make
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_cache_key(source: str, make: str, model: Optional[str] = None,
+                   year_min: Optional[int] = None, year_max: Optional[int] = None,
+                   price_min: Optional[int] = None, price_max: Optional[int] = None,
+                   location: Optional[str] = None, max_results: int = 20,
+                   private_sellers_only: bool = False) -> str:
+    """Build a normalized cache key for one source/make search"""
+    def norm(value) -> str:
+        if value is None:
+            return ''
+        return ' '.join(str(value).lower().split())
+
+    return '|'.join([
+        source,
+        norm(make),
+        norm(model),
+        norm(year_min),
+        norm(year_max),
+        norm(price_min),
+        norm(price_max),
+        norm(location),
+        str(max_results),
+        '1' if private_sellers_only else '0',
+    ])
+
+
+class ResultCache(ABC):
+    """Base class for result cache backends"""
+
+    def __init__(self, ttl: float = 600, max_entries: int = 500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        """Return (listing dicts, stored_at timestamp) or None on a miss"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, listings: List[Dict]):
+        """Store listing dicts under key"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Drop every entry"""
+        pass
+
+
+class MemoryResultCache(ResultCache):
+    """In-process cache, private to each worker"""
+
+    def __init__(self, ttl: float = 600, max_entries: int = 500):
+        super().__init__(ttl, max_entries)
+        self._entries: 'OrderedDict[str, Tuple[List[Dict], float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, listings: List[Dict]):
+        with self._lock:
+            self._entries[key] = (listings, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResultCache(ResultCache):
+    """Cache stored in a SQLite file, shared by all workers and kept across restarts"""
+
+    def __init__(self, path: str, ttl: float = 600, max_entries: int = 500):
+        super().__init__(ttl, max_entries)
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    listings TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_last_used ON result_cache (last_used)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict], float]]:
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute('SELECT listings, stored_at FROM result_cache WHERE key = ?',
+                             (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                db.execute('DELETE FROM result_cache WHERE key = ?', (key,))
+                return None
+            db.execute('UPDATE result_cache SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, listings: List[Dict]):
+        now = time.time()
+        with self._connect() as db:
+            db.execute('''
+                INSERT INTO result_cache (key, listings, stored_at, last_used)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    listings = excluded.listings,
+                    stored_at = excluded.stored_at,
+                    last_used = excluded.last_used
+            ''', (key, json.dumps(listings), now, now))
+            db.execute('DELETE FROM result_cache WHERE stored_at < ?', (now - self.ttl,))
+            db.execute('''
+                DELETE FROM result_cache WHERE key IN (
+                    SELECT key FROM result_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+
+    def clear(self):
+        with self._connect() as db:
+            db.execute('DELETE FROM result_cache')
+
+
+_cache: Optional[ResultCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Return the process-wide result cache configured from the environment.
+
+    RESULT_CACHE_BACKEND is 'memory' (default), 'sqlite' or 'none';
+    RESULT_CACHE_TTL, RESULT_CACHE_SIZE and RESULT_CACHE_PATH tune it.
+    """
+    global _cache, _cache_configured
+    with _cache_lock:
+        if not _cache_configured:
+            backend = os.environ.get('RESULT_CACHE_BACKEND', 'memory').lower()
+            ttl = float(os.environ.get('RESULT_CACHE_TTL', 600))
+            size = int(os.environ.get('RESULT_CACHE_SIZE', 500))
+            if backend == 'sqlite':
+                path = os.environ.get('RESULT_CACHE_PATH', 'result_cache.db')
+                _cache = SQLiteResultCache(path, ttl=ttl, max_entries=size)
+            elif backend == 'memory':
+                _cache = MemoryResultCache(ttl=ttl, max_entries=size)
+            else:
+                _cache = None
+            _cache_configured = True
+        return _cache
@@ -0,0 +1,192 @@
+"""
+Search results kept server-side under an id, served a page at a time in any order
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+from listing_table import ListingTable, parse_sort
+from scraper.base_scraper import CarListing
+import json
+import numpy as np
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+
+class ResultSnapshot:
+    """
+    One stored result set, loaded as a ListingTable.
+
+    Snapshots never change, so an offset into a given ordering is a stable
+    cursor; each ordering is computed once and reused for every page.
+    """
+
+    def __init__(self, snapshot_id: str, listings: List[CarListing], seen_at: Dict[str, float],
+                 meta: Dict, created_at: float, expires_at: float):
+        self.id = snapshot_id
+        self.meta = meta
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.table = ListingTable(listings, seen_at)
+        self._orders: Dict[Tuple, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _order(self, sort: Optional[str], sources: Optional[Sequence[str]]) -> List[int]:
+        key = (sort or '', tuple(sources or ()))
+        with self._lock:
+            rows = self._orders.get(key)
+            if rows is None:
+                rows = np.flatnonzero(self.table.mask(sources=sources))
+                rows = self._orders[key] = self.table.order(rows, parse_sort(sort)).tolist()
+            return rows
+
+    def page(self, sort: Optional[str] = None, sources: Optional[Sequence[str]] = None,
+             offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[CarListing], int, Optional[int]]:
+        """
+        (listings, total, next_offset) for one page; next_offset is None on the last page.
+        Without a sort the listings keep the order they were stored in.
+        """
+        rows = self._order(sort, sources)
+        end = offset + limit
+        listings = [self.table.listings[i] for i in rows[offset:end]]
+        return listings, len(rows), end if end < len(rows) else None
+
+    def describe(self) -> Dict:
+        return {
+            'id': self.id,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+            'total': len(self.table),
+        }
+
+
+class ResultSnapshotStore:
+    """
+    Snapshots in a SQLite file shared by all workers, so a shared link works whichever worker answers.
+
+    Recently used snapshots stay loaded in each worker; expired ones are
+    deleted as new ones are stored, as are the oldest beyond max_snapshots.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, max_snapshots: int = 500, loaded: int = 16):
+        self.path = path
+        self.ttl = ttl
+        self.max_snapshots = max_snapshots
+        self.loaded = loaded
+        self._snapshots: 'OrderedDict[str, ResultSnapshot]' = OrderedDict()
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS result_snapshots (
+                    id TEXT PRIMARY KEY,
+                    listings TEXT NOT NULL,
+                    seen_at TEXT NOT NULL,
+                    meta TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_result_snapshots_expires ON result_snapshots (expires_at)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _keep(self, snapshot: ResultSnapshot):
+        with self._lock:
+            self._snapshots[snapshot.id] = snapshot
+            self._snapshots.move_to_end(snapshot.id)
+            while len(self._snapshots) > self.loaded:
+                self._snapshots.popitem(last=False)
+
+    def create(self, listings: Sequence[CarListing], meta: Optional[Dict] = None,
+               seen_at: Optional[Dict[str, float]] = None) -> ResultSnapshot:
+        """Store listings in their current order and return the new snapshot"""
+        now = time.time()
+        listings = list(listings)
+        seen_at = {l.url: seen_at[l.url] for l in listings if seen_at and l.url in seen_at}
+        snapshot = ResultSnapshot(secrets.token_urlsafe(12), listings, seen_at, meta or {},
+                                  now, now + self.ttl)
+        with self._connect() as db:
+            db.execute('''
+                INSERT INTO result_snapshots (id, listings, seen_at, meta, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (snapshot.id, json.dumps([l.to_dict() for l in listings]), json.dumps(seen_at),
+                  json.dumps(snapshot.meta), now, snapshot.expires_at))
+            db.execute('DELETE FROM result_snapshots WHERE expires_at < ?', (now,))
+            db.execute('''
+                DELETE FROM result_snapshots WHERE id IN (
+                    SELECT id FROM result_snapshots ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_snapshots,))
+        self._keep(snapshot)
+        return snapshot
+
+    def get(self, snapshot_id: str) -> Optional[ResultSnapshot]:
+        """The snapshot, or None when it never existed or has expired"""
+        now = time.time()
+        with self._lock:
+            snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is not None:
+            if snapshot.expires_at >= now:
+                with self._lock:
+                    self._snapshots.move_to_end(snapshot_id)
+                return snapshot
+            with self._lock:
+                self._snapshots.pop(snapshot_id, None)
+            return None
+
+        with self._connect() as db:
+            row = db.execute('''
+                SELECT listings, seen_at, meta, created_at, expires_at
+                FROM result_snapshots WHERE id = ? AND expires_at >= ?
+            ''', (snapshot_id, now)).fetchone()
+        if row is None:
+            return None
+        snapshot = ResultSnapshot(snapshot_id, [CarListing.from_dict(d) for d in json.loads(row[0])],
+                                  json.loads(row[1]), json.loads(row[2]), row[3], row[4])
+        self._keep(snapshot)
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+        with self._connect() as db:
+            db.execute('DELETE FROM result_snapshots')
+
+
+_store: Optional[ResultSnapshotStore] = None
+_store_configured = False
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> Optional[ResultSnapshotStore]:
+    """
+    Return the process-wide snapshot store, or None when disabled.
+
+    RESULT_SNAPSHOTS_ENABLED=0 turns it off; RESULT_SNAPSHOTS_PATH sets the
+    database file (default result_snapshots.db), RESULT_SNAPSHOT_TTL how many
+    seconds a snapshot and its links last (default a day) and
+    RESULT_SNAPSHOT_LIMIT how many are kept at most.
+    """
+    global _store, _store_configured
+    with _store_lock:
+        if not _store_configured:
+            if os.environ.get('RESULT_SNAPSHOTS_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                _store = ResultSnapshotStore(
+                    os.environ.get('RESULT_SNAPSHOTS_PATH', 'result_snapshots.db'),
+                    ttl=float(os.environ.get('RESULT_SNAPSHOT_TTL', 86400)),
+                    max_snapshots=int(os.environ.get('RESULT_SNAPSHOT_LIMIT', 500)))
+            _store_configured = True
+        return _store
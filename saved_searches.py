@@ -0,0 +1,422 @@
+"""
+Saved searches refreshed in the background, keeping only what changed between runs
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from scraper.base_scraper import CarListing
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+# Shortest refresh interval; below the result cache TTL overlapping searches couldn't share scrapes
+MIN_INTERVAL = 600
+DEFAULT_INTERVAL = 3600
+# Each run is rescheduled up to this fraction of its interval early or late
+JITTER = 0.1
+# Changes older than this are dropped
+CHANGE_TTL = 30 * 86400
+
+
+def query_key(params: Dict) -> str:
+    """Identical searches share a key, so one scrape can serve them all"""
+    normalized = {k: v for k, v in params.items() if v not in (None, '', [], False)}
+    if isinstance(normalized.get('makes'), list):
+        normalized['makes'] = sorted(m.lower() for m in normalized['makes'])
+    for name in ('model', 'location'):
+        if isinstance(normalized.get(name), str):
+            normalized[name] = ' '.join(normalized[name].lower().split())
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def jittered(interval: float) -> float:
+    return interval * (1 + random.uniform(-JITTER, JITTER))
+
+
+class SavedSearchStore:
+    """
+    SQLite tables of saved searches, their last results and the changes between runs.
+
+    Only URL (and duplicates' URLs), price, title and source of the last run
+    are kept per search. Every run records its differences from the previous
+    one - new listings, price changes and removals - so checking a saved
+    search reads a few rows instead of scraping.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS saved_searches (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    query_key TEXT NOT NULL,
+                    interval REAL NOT NULL,
+                    next_run REAL NOT NULL,
+                    last_run REAL,
+                    last_error TEXT,
+                    seen_change_id INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_saved_searches_next_run ON saved_searches (next_run)')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS saved_search_results (
+                    search_id INTEGER NOT NULL,
+                    url TEXT NOT NULL,
+                    price_cents INTEGER,
+                    title TEXT,
+                    source TEXT,
+                    alternate_urls TEXT,
+                    PRIMARY KEY (search_id, url)
+                )
+            ''')
+            columns = {row[1] for row in db.execute('PRAGMA table_info(saved_search_results)')}
+            for column in ('source', 'alternate_urls'):
+                if column not in columns:
+                    db.execute(f'ALTER TABLE saved_search_results ADD COLUMN {column} TEXT')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS saved_search_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    search_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    old_price_cents INTEGER,
+                    new_price_cents INTEGER,
+                    listing TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_saved_search_changes ON saved_search_changes (search_id, id)')
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _describe(row: sqlite3.Row, unseen: int = 0) -> Dict:
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'params': json.loads(row['params']),
+            'interval': row['interval'],
+            'next_run': row['next_run'],
+            'last_run': row['last_run'],
+            'last_error': row['last_error'],
+            'unseen': unseen,
+        }
+
+    def create(self, name: str, params: Dict, interval: float = DEFAULT_INTERVAL) -> Dict:
+        """Save a search; its first run starts at a random point within a minute"""
+        interval = max(float(interval), MIN_INTERVAL)
+        now = time.time()
+        with self._connect() as db:
+            cur = db.execute('''
+                INSERT INTO saved_searches (name, params, query_key, interval, next_run, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, json.dumps(params), query_key(params), interval,
+                  now + random.uniform(0, 60), now))
+            row = db.execute('SELECT * FROM saved_searches WHERE id = ?', (cur.lastrowid,)).fetchone()
+        return self._describe(row)
+
+    def delete(self, search_id: int) -> bool:
+        with self._connect() as db:
+            cur = db.execute('DELETE FROM saved_searches WHERE id = ?', (search_id,))
+            db.execute('DELETE FROM saved_search_results WHERE search_id = ?', (search_id,))
+            db.execute('DELETE FROM saved_search_changes WHERE search_id = ?', (search_id,))
+            return cur.rowcount > 0
+
+    def get(self, search_id: int) -> Optional[Dict]:
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM saved_searches WHERE id = ?', (search_id,)).fetchone()
+        return self._describe(row) if row else None
+
+    def list_all(self) -> List[Dict]:
+        """Every saved search with its count of changes not yet checked"""
+        with self._connect() as db:
+            rows = db.execute('''
+                SELECT s.*, (SELECT COUNT(*) FROM saved_search_changes c
+                             WHERE c.search_id = s.id AND c.id > s.seen_change_id) AS unseen
+                FROM saved_searches s ORDER BY s.created_at DESC
+            ''').fetchall()
+        return [self._describe(row, row['unseen']) for row in rows]
+
+    def run_now(self, search_id: int) -> bool:
+        """Make a search due at the scheduler's next tick"""
+        with self._connect() as db:
+            cur = db.execute('UPDATE saved_searches SET next_run = ? WHERE id = ?',
+                             (time.time(), search_id))
+            return cur.rowcount > 0
+
+    def claim_due(self, now: Optional[float] = None, lease: float = 900) -> List[Dict]:
+        """
+        Take the searches that are due, pushing their next run `lease` seconds out.
+
+        The update is one IMMEDIATE transaction, so schedulers in several
+        processes never claim the same search twice.
+        """
+        now = now or time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            rows = db.execute('SELECT * FROM saved_searches WHERE next_run <= ? ORDER BY next_run',
+                              (now,)).fetchall()
+            db.executemany('UPDATE saved_searches SET next_run = ? WHERE id = ?',
+                           [(now + lease, row['id']) for row in rows])
+        return [self._describe(row) for row in rows]
+
+    def record_run(self, search_id: int, listings: Sequence[CarListing],
+                   now: Optional[float] = None, sources: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """
+        Diff a run's listings against the previous run and store the changes.
+
+        Returns counts of new, price-changed and removed listings. The first
+        run of a search reports every listing as new. Listings are matched on
+        any of their URLs, so a duplicate group whose canonical URL changed
+        between runs is the same listing.
+
+        sources is the run's per-site listing count. A site that returned
+        nothing was most likely blocked or timed out, so its previous listings
+        aren't reported as removed; they are kept for the next run to compare
+        against instead.
+        """
+        now = now or time.time()
+        current = {listing.url: listing for listing in listings if listing.url}
+        counts = {'new': 0, 'price': 0, 'removed': 0}
+        with self._connect() as db:
+            row = db.execute('SELECT interval FROM saved_searches WHERE id = ?', (search_id,)).fetchone()
+            if row is None:
+                return counts
+            previous = [(r['url'], r['price_cents'], r['title'], r['source'],
+                         json.loads(r['alternate_urls'] or '[]')) for r in db.execute(
+                'SELECT url, price_cents, title, source, alternate_urls '
+                'FROM saved_search_results WHERE search_id = ?', (search_id,))]
+            previous_by_url: Dict[str, Tuple] = {}
+            for entry in previous:
+                for url in [entry[0]] + entry[4]:
+                    previous_by_url.setdefault(url, entry)
+            current_urls = {url for listing in current.values()
+                            for url in (listing.url,) + tuple(listing.alternate_urls)}
+
+            changes = []
+            for url, listing in current.items():
+                match = next((previous_by_url[u] for u in (url,) + tuple(listing.alternate_urls)
+                              if u in previous_by_url), None)
+                if match is None:
+                    changes.append(('new', url, listing.title, None, listing.price_cents,
+                                    json.dumps(listing.to_dict())))
+                    continue
+                old_price = match[1]
+                if old_price is not None and listing.price_cents is not None and \
+                        old_price != listing.price_cents:
+                    changes.append(('price', url, listing.title, old_price, listing.price_cents,
+                                    json.dumps(listing.to_dict())))
+
+            def answered(source: Optional[str]) -> bool:
+                if sources is None:
+                    return True
+                if source is None:
+                    # Stored before sources were recorded - only trust a run where every site answered
+                    return all(sources.values())
+                return sources.get(source, 0) > 0
+
+            kept = []
+            for entry in previous:
+                url, old_price, title, source, alternates = entry
+                if any(u in current_urls for u in [url] + alternates):
+                    continue
+                if answered(source):
+                    changes.append(('removed', url, title, old_price, None, None))
+                else:
+                    kept.append(entry)
+            for change in changes:
+                counts[change[0]] += 1
+
+            db.executemany('''
+                INSERT INTO saved_search_changes
+                    (search_id, kind, url, title, old_price_cents, new_price_cents, listing, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(search_id,) + change + (now,) for change in changes])
+            db.execute('DELETE FROM saved_search_results WHERE search_id = ?', (search_id,))
+            db.executemany('''
+                INSERT OR IGNORE INTO saved_search_results
+                    (search_id, url, price_cents, title, source, alternate_urls)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(search_id, url, listing.price_cents, listing.title, listing.source,
+                   json.dumps(list(listing.alternate_urls)))
+                  for url, listing in current.items()] +
+                [(search_id, url, price, title, source, json.dumps(alternates))
+                 for url, price, title, source, alternates in kept])
+            db.execute('DELETE FROM saved_search_changes WHERE search_id = ? AND created_at < ?',
+                       (search_id, now - CHANGE_TTL))
+            db.execute('''
+                UPDATE saved_searches SET last_run = ?, last_error = NULL, next_run = ?
+                WHERE id = ?
+            ''', (now, now + jittered(row['interval']), search_id))
+        return counts
+
+    def record_error(self, search_id: int, error: str, now: Optional[float] = None):
+        """Note a failed run and retry at the next interval"""
+        now = now or time.time()
+        with self._connect() as db:
+            db.execute('''
+                UPDATE saved_searches SET last_error = ?, next_run = ? + interval * ?
+                WHERE id = ?
+            ''', (error, now, 1 + random.uniform(-JITTER, JITTER), search_id))
+
+    def changes(self, search_id: int, since: Optional[int] = None, limit: int = 200,
+                mark_seen: bool = True) -> List[Dict]:
+        """
+        Changes of a search after change id `since` (default: the last checked one), oldest first.
+
+        With mark_seen the returned changes stop counting as unseen.
+        """
+        with self._connect() as db:
+            if since is None:
+                row = db.execute('SELECT seen_change_id FROM saved_searches WHERE id = ?',
+                                 (search_id,)).fetchone()
+                since = row['seen_change_id'] if row else 0
+            rows = db.execute('''
+                SELECT * FROM saved_search_changes WHERE search_id = ? AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (search_id, since, limit)).fetchall()
+            if mark_seen and rows:
+                db.execute('''
+                    UPDATE saved_searches SET seen_change_id = MAX(seen_change_id, ?) WHERE id = ?
+                ''', (rows[-1]['id'], search_id))
+        return [{
+            'id': row['id'],
+            'kind': row['kind'],
+            'url': row['url'],
+            'title': row['title'],
+            'old_price_cents': row['old_price_cents'],
+            'new_price_cents': row['new_price_cents'],
+            'listing': json.loads(row['listing']) if row['listing'] else None,
+            'created_at': row['created_at'],
+        } for row in rows]
+
+
+class SavedSearchScheduler:
+    """
+    Background thread that refreshes due saved searches.
+
+    Due searches with the same query are scraped once and the result is
+    diffed into each of them. Runs go one after another through the shared
+    result cache, so searches overlapping on a make reuse that make's fresh
+    results instead of scraping it again.
+    """
+
+    def __init__(self, store: SavedSearchStore, coordinator_factory: Callable, tick: float = 30):
+        self.store = store
+        self.coordinator_factory = coordinator_factory
+        self.tick = tick
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='saved-searches', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        # Spread the first tick of several workers and restarts
+        self._stop.wait(random.uniform(0, self.tick))
+        while not self._stop.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"[ERROR] Saved search scheduler: {e}")
+                traceback.print_exc()
+            self._stop.wait(self.tick)
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """Refresh every due search; returns how many scrapes ran"""
+        groups: Dict[str, List[Dict]] = {}
+        for search in self.store.claim_due(now):
+            groups.setdefault(query_key(search['params']), []).append(search)
+
+        for searches in groups.values():
+            try:
+                listings, sources = self._search(searches[0]['params'])
+            except Exception as e:
+                print(f"[ERROR] Saved search {searches[0]['name']!r} failed: {e}")
+                for search in searches:
+                    self.store.record_error(search['id'], f'{type(e).__name__}: {e}')
+                continue
+            for search in searches:
+                counts = self.store.record_run(search['id'], listings, sources=sources)
+                print(f"[OK] Saved search {search['name']!r}: {counts['new']} new, "
+                      f"{counts['price']} price changes, {counts['removed']} removed")
+        return len(groups)
+
+    def _search(self, params: Dict) -> Tuple[List[CarListing], Dict[str, int]]:
+        """The search's listings, plus how many each site returned (0 for a failed site)"""
+        coordinator = self.coordinator_factory()
+        # Only new listings need scraping; the store fills in the rest
+        results = coordinator.search_all(**dict(params, incremental=True))
+        listings = coordinator.query_listings(
+            results,
+            year_min=params.get('year_min'),
+            year_max=params.get('year_max'),
+            price_min=params.get('price_min'),
+            price_max=params.get('price_max'),
+        )
+        return listings, {source: len(found) for source, found in results.items()}
+
+
+_store: Optional[SavedSearchStore] = None
+_store_configured = False
+_store_lock = threading.Lock()
+
+
+def get_saved_search_store() -> Optional[SavedSearchStore]:
+    """
+    Return the process-wide saved search store, or None when disabled.
+
+    SAVED_SEARCHES_ENABLED=0 turns saved searches off; SAVED_SEARCHES_PATH
+    sets the database file (default saved_searches.db, next to notes.db).
+    """
+    global _store, _store_configured
+    with _store_lock:
+        if not _store_configured:
+            if os.environ.get('SAVED_SEARCHES_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                _store = SavedSearchStore(os.environ.get('SAVED_SEARCHES_PATH', 'saved_searches.db'))
+            _store_configured = True
+        return _store
+
+
+def main():
+    """Run the scheduler as its own process (the web app only runs one with SAVED_SEARCH_SCHEDULER=1)"""
+    from search_coordinator import SearchCoordinator
+    store = get_saved_search_store()
+    if store is None:
+        print("Saved searches are disabled (SAVED_SEARCHES_ENABLED=0)")
+        return
+    scheduler = SavedSearchScheduler(store, SearchCoordinator,
+                                     tick=float(os.environ.get('SAVED_SEARCH_TICK', 30)))
+    print("Refreshing saved searches - press Ctrl+C to stop")
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
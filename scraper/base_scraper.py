@@ -2,86 +2,395 @@
 Base scraper class for all car listing scrapers
 """
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
+from contextlib import contextmanager
+from typing import Callable, List, Dict, Optional, Set
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from fake_useragent import UserAgent
-import time
+import concurrent.futures
+import math
+import re
+import threading
 import urllib.parse
+from scraper.driver_pool import get_driver_pool
+from scraper.http_cache import HTTPCache, get_http_cache
+from scraper.metrics import MetricsRegistry, get_metrics, timed
+from scraper.parsing import looks_blocked, parse_html
+from scraper.rate_limiter import RateLimiter, get_rate_limiter
+from scraper.tracing import bind, span
+
+
+_PRICE_RE = re.compile(r'^\$?\s*(\d[\d,]*)(?:\.(\d{1,2}))?$')
+_MILEAGE_RE = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*(k\b)?', re.IGNORECASE)
+
+
+def parse_price_cents(price: str) -> Optional[int]:
+    """'$15,500' -> 1550000; None for 'N/A', 'Call' and other non-prices"""
+    match = _PRICE_RE.match(price.strip()) if price else None
+    if not match:
+        return None
+    cents = match.group(2) or '0'
+    return int(match.group(1).replace(',', '')) * 100 + int(cents.ljust(2, '0'))
+
+
+def parse_year(year: str) -> Optional[int]:
+    try:
+        return int(year) if year else None
+    except ValueError:
+        return None
+
+
+def parse_mileage(mileage: str) -> Optional[int]:
+    """'42,000 mi.' -> 42000, '85k miles' -> 85000"""
+    match = _MILEAGE_RE.search(mileage) if mileage else None
+    if not match:
+        return None
+    miles = float(match.group(1).replace(',', ''))
+    if match.group(2):
+        miles *= 1000
+    return int(miles)
+
+
+def format_price(price_cents: Optional[int]) -> str:
+    if price_cents is None:
+        return "N/A"
+    if price_cents % 100:
+        return f"${price_cents / 100:,.2f}"
+    return f"${price_cents // 100:,}"
+
+
+def format_mileage(mileage_int: Optional[int]) -> str:
+    return f"{mileage_int:,} mi" if mileage_int is not None else ""
 
 
 class CarListing:
-    """Data class for car listings"""
-    def __init__(self, title: str, price: str, location: str, url: str, 
-                 source: str, description: str = "", year: str = "", 
-                 mileage: str = "", image_url: str = ""):
+    """
+    Data class for car listings.
+    
+    Price, year and mileage are parsed once into price_cents, year_int and
+    mileage_int. The display strings are kept as scraped; a listing built
+    from the numbers alone derives them on first access.
+    """
+    __slots__ = ('title', 'location', 'url', 'source', 'description', 'image_url',
+                 'price_cents', 'year_int', 'mileage_int', 'alternate_urls',
+                 '_price', '_year', '_mileage')
+    
+    def __init__(self, title: str, price: Optional[str], location: str, url: str, 
+                 source: str, description: str = "", year: Optional[str] = None, 
+                 mileage: Optional[str] = None, image_url: str = "",
+                 price_cents: Optional[int] = None, year_int: Optional[int] = None,
+                 mileage_int: Optional[int] = None, alternate_urls: Optional[List[str]] = None):
         self.title = title
-        self.price = price
         self.location = location
         self.url = url
         self.source = source
         self.description = description
-        self.year = year
-        self.mileage = mileage
         self.image_url = image_url
+        # URLs of duplicate listings merged into this one
+        self.alternate_urls = tuple(alternate_urls) if alternate_urls else ()
+        
+        self.price_cents = price_cents if price_cents is not None else parse_price_cents(price)
+        self.year_int = year_int if year_int is not None else parse_year(year)
+        self.mileage_int = mileage_int if mileage_int is not None else parse_mileage(mileage)
+        
+        # None means not given: derived from the number on first access
+        self._price = price
+        self._year = year
+        self._mileage = mileage
+    
+    @property
+    def price(self) -> str:
+        if self._price is None:
+            self._price = format_price(self.price_cents)
+        return self._price
+    
+    @property
+    def year(self) -> str:
+        if self._year is None:
+            self._year = str(self.year_int) if self.year_int is not None else ""
+        return self._year
+    
+    @property
+    def mileage(self) -> str:
+        if self._mileage is None:
+            self._mileage = format_mileage(self.mileage_int)
+        return self._mileage
     
     def to_dict(self) -> Dict:
-        """Convert listing to dictionary"""
+        """Convert listing to dictionary, typed fields included so from_dict needn't re-parse"""
+        # The slots directly once the display strings are known, sparing three property calls
+        price, year, mileage = self._price, self._year, self._mileage
         return {
             'title': self.title,
-            'price': self.price,
+            'price': price if price is not None else self.price,
             'location': self.location,
             'url': self.url,
             'source': self.source,
             'description': self.description,
-            'year': self.year,
-            'mileage': self.mileage,
-            'image_url': self.image_url
+            'year': year if year is not None else self.year,
+            'mileage': mileage if mileage is not None else self.mileage,
+            'image_url': self.image_url,
+            'price_cents': self.price_cents,
+            'year_int': self.year_int,
+            'mileage_int': self.mileage_int,
+            'alternate_urls': list(self.alternate_urls)
         }
     
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CarListing':
+        """Rebuild a listing from the output of to_dict without parsing anything again"""
+        if 'price_cents' not in data:
+            # Written before to_dict carried the typed fields
+            return cls(**data)
+        listing = cls.__new__(cls)
+        listing.title = data['title']
+        listing.location = data['location']
+        listing.url = data['url']
+        listing.source = data['source']
+        listing.description = data.get('description', "")
+        listing.image_url = data.get('image_url', "")
+        listing.alternate_urls = tuple(data.get('alternate_urls') or ())
+        listing.price_cents = data['price_cents']
+        listing.year_int = data.get('year_int')
+        listing.mileage_int = data.get('mileage_int')
+        listing._price = data.get('price')
+        listing._year = data.get('year')
+        listing._mileage = data.get('mileage')
+        return listing
+    
     def __str__(self):
         return f"{self.title} - {self.price} - {self.location} ({self.source})"
 
 
+class SeenListings:
+    """
+    Tells an incremental crawl when it has caught up with listings it already has.
+    
+    Pages are sorted newest first, so a run of `run` known URLs in a row means
+    the rest of the results are known too. A single known URL is skipped
+    rather than ending the crawl, since promoted listings can sit at the top.
+    """
+    
+    def __init__(self, urls: Optional[Set[str]] = None, run: int = 3):
+        self.urls = urls
+        self.run = run
+        self._consecutive = 0
+    
+    def seen(self, url: str) -> bool:
+        """True (and counted towards done) if url was already crawled"""
+        if not self.urls or url not in self.urls:
+            self._consecutive = 0
+            return False
+        self._consecutive += 1
+        return True
+    
+    @property
+    def done(self) -> bool:
+        return self._consecutive >= self.run
+
+
 class BaseScraper(ABC):
     """Base class for all car listing scrapers"""
     
-    def __init__(self, source_name: str):
+    # Seconds a cached page is served without revalidation; None follows the site's Cache-Control
+    cache_max_age: Optional[int] = None
+    # Makes searched at the same time on this site
+    max_concurrency: int = 2
+    # Token bucket shared by every worker: sustained requests per second and burst size per host
+    requests_per_second: float = 2.0
+    burst: float = 4
+    # Whether _search_make can sort newest-first and stop at already seen listings
+    supports_incremental: bool = False
+    # Result pages one make search may read, and how many are fetched at the same time.
+    # Concurrent pages still queue on the host's rate limit; they only overlap latency.
+    max_pages: int = 10
+    page_concurrency: int = 3
+    
+    def __init__(self, source_name: str, http_cache: Optional[HTTPCache] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 metrics: Optional[MetricsRegistry] = None):
         self.source_name = source_name
+        self.http_cache = http_cache if http_cache is not None else get_http_cache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter()
+        self.metrics = metrics if metrics is not None else get_metrics()
+        # Why the current thread's page request failed, if it did (see _collect_pages)
+        self._page_state = threading.local()
         self.ua = UserAgent()
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': self.ua.random
         })
     
-    def get_page(self, url: str, params: Optional[Dict] = None) -> Optional[BeautifulSoup]:
-        """Fetch and parse a webpage"""
+    @contextmanager
+    def timed(self, stage: str):
+        """Time a scraping stage of this source for /metrics and, when tracing, as a span"""
+        with span(stage, source=self.source_name), \
+                timed(self.metrics, 'scraper_stage_seconds', source=self.source_name, stage=stage):
+            yield
+    
+    def span(self, name: str, **attrs):
+        """A trace span of this source that isn't a metrics stage (see scraper.tracing)"""
+        return span(name, source=self.source_name, **attrs)
+    
+    def _report_driver_pool(self):
+        if self.metrics is not None:
+            stats = get_driver_pool().stats()
+            self.metrics.set_gauge('driver_pool_drivers', stats['idle'], state='idle')
+            self.metrics.set_gauge('driver_pool_drivers', stats['in_use'], state='in_use')
+            self.metrics.set_gauge('driver_pool_drivers', stats['size'], state='size')
+    
+    def _checkout_driver(self):
+        """Check out a Selenium WebDriver from the shared driver pool (None if unavailable)"""
+        # Includes waiting for a free driver and launching Chrome when the pool starts one
+        with self.timed('driver_start'):
+            driver = get_driver_pool().acquire()
+        self._report_driver_pool()
+        return driver
+    
+    def _release_driver(self, driver, pages: int = 1):
+        """Hand a checked-out WebDriver back to the pool"""
+        if driver:
+            get_driver_pool().release(driver, pages=pages)
+            self._report_driver_pool()
+    
+    def _throttle(self, url: str):
+        """Wait until the host's rate limit allows another request"""
+        if self.rate_limiter:
+            with self.timed('rate_limit'):
+                self.rate_limiter.acquire(url, self.requests_per_second, self.burst)
+    
+    def _count_bytes(self, size: int):
+        if self.metrics is not None:
+            self.metrics.inc('scraper_bytes_downloaded_total', size, source=self.source_name)
+    
+    def _page_failed(self, error: Exception):
+        """Note why this thread's page request failed, for the request outcome metrics"""
+        timeout = isinstance(error, (requests.Timeout, TimeoutError)) or 'Timeout' in type(error).__name__
+        self._page_state.outcome = 'timeout' if timeout else 'error'
+    
+    def _count_cache(self, result: str):
+        if self.metrics is not None:
+            self.metrics.inc('http_cache_requests_total', source=self.source_name, result=result)
+    
+    def fetch_page(self, url: str, params: Optional[Dict] = None) -> Optional[bytes]:
+        """Fetch a webpage's raw bytes, going through the HTTP cache and rate limiter"""
         try:
-            # Add delay to avoid rate limiting
-            time.sleep(0.5)
+            if params:
+                url = requests.Request('GET', url, params=params).prepare().url
+            
+            cached = self.http_cache.get(url) if self.http_cache else None
+            if cached and cached.is_fresh(self.cache_max_age):
+                self._count_cache('fresh')
+                return cached.body
+            
+            # Space requests out only as much as the host's limit requires
+            self._throttle(url)
             
-            # Update headers
-            self.session.headers.update({
+            # Per-request headers - the session is shared by concurrent make searches
+            headers = {
                 'User-Agent': self.ua.random,
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
                 'Accept-Language': 'en-US,en;q=0.5',
                 'Accept-Encoding': 'gzip, deflate',
                 'Connection': 'keep-alive',
                 'Upgrade-Insecure-Requests': '1',
-            })
+            }
             
-            response = self.session.get(url, params=params, timeout=15)
+            # Revalidate a stale cached copy instead of downloading it again
+            if cached:
+                headers.update(cached.validators())
+            with self.timed('page_load'):
+                response = self.session.get(url, headers=headers, timeout=15)
+            if cached and response.status_code == 304:
+                self._count_cache('revalidated')
+                self.http_cache.refresh(cached, response)
+                return cached.body
+            if self.http_cache:
+                self._count_cache('miss')
             response.raise_for_status()
+            self._count_bytes(len(response.content))
             
-            # Check if we got blocked
-            if 'blocked' in response.text.lower() or 'captcha' in response.text.lower():
+            # Check if we got blocked - scan the raw bytes rather than decoding the page twice
+            if looks_blocked(response.content):
                 print(f"Warning: Possible blocking detected on {self.source_name}")
+                self._page_state.outcome = 'blocked'
+            elif self.http_cache:
+                self.http_cache.store(url, response)
             
-            return BeautifulSoup(response.content, 'lxml')
+            return response.content
         except Exception as e:
             print(f"Error fetching {url}: {e}")
+            self._page_failed(e)
             return None
     
+    def get_page(self, url: str, params: Optional[Dict] = None,
+                 parse_only: Optional[SoupStrainer] = None) -> Optional[BeautifulSoup]:
+        """Fetch and parse a webpage, keeping only the parse_only elements if given"""
+        with self.span('get_page', url=url):
+            content = self.fetch_page(url, params)
+            if content is None:
+                return None
+            with self.timed('parse'):
+                return parse_html(content, parse_only)
+    
+    def _collect_pages(self, fetch: Callable[[int], Optional[List[CarListing]]], max_results: int,
+                       page_size: int, seen: Optional[SeenListings] = None,
+                       concurrency: Optional[int] = None) -> List[CarListing]:
+        """
+        Gather up to max_results unique listings from successive result pages
+        
+        fetch(n) returns the listings on page n (0-based), or None if the page
+        failed. Only as many pages as max_results needs are requested, up to
+        `concurrency` at once, and they are consumed in order. Reading stops
+        at the first page that adds nothing new (past the last page most sites
+        repeat one or return none), or once seen says the rest is known.
+        """
+        concurrency = max(1, concurrency or self.page_concurrency)
+        listings: List[CarListing] = []
+        urls = set()
+        page = 0
+        
+        def fetch_counted(n: int) -> Optional[List[CarListing]]:
+            # Whatever the page spends outside its nested stages is card extraction
+            self._page_state.outcome = None
+            with self.span('page', page=n), \
+                    timed(self.metrics, 'scraper_stage_seconds', source=self.source_name, stage='extract'):
+                found = fetch(n)
+            if self.metrics is not None:
+                outcome = self._page_state.outcome or ('error' if found is None else 'ok' if found else 'empty')
+                self.metrics.inc('scraper_requests_total', source=self.source_name, outcome=outcome)
+            return found
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while len(listings) < max_results and page < self.max_pages:
+                wanted = math.ceil((max_results - len(listings)) / page_size)
+                batch = range(page, min(page + min(wanted, concurrency), self.max_pages))
+                if concurrency == 1:
+                    pages = [fetch_counted(n) for n in batch]
+                else:
+                    pages = list(executor.map(bind(fetch_counted), batch))
+                page = batch.stop
+                
+                for found in pages:
+                    fresh = 0
+                    for listing in found or []:
+                        # A card without a link is told apart by its title
+                        key = listing.url or listing.title
+                        if key in urls:
+                            continue
+                        urls.add(key)
+                        fresh += 1
+                        if seen is not None and seen.seen(listing.url):
+                            if seen.done:
+                                return listings
+                            continue
+                        listings.append(listing)
+                        if len(listings) >= max_results:
+                            return listings
+                    if not fresh:
+                        return listings
+        return listings
+    
     def clean_price(self, price_str: str) -> str:
         """Clean and format price string"""
         if not price_str:
@@ -101,17 +410,67 @@ class BaseScraper(ABC):
             return ""
         return ' '.join(text.split())
     
-    @abstractmethod
     def search(self, makes: List[str], model: Optional[str] = None, year_min: Optional[int] = None,
                year_max: Optional[int] = None, price_min: Optional[int] = None,
                price_max: Optional[int] = None, location: Optional[str] = None,
-               max_results: int = 20) -> List[CarListing]:
+               max_results: int = 20, private_sellers_only: bool = False) -> List[CarListing]:
         """
         Search for cars based on parameters
         Args:
             makes: List of car makes to search for (e.g., ['Toyota', 'Honda'])
             model: Optional car model to filter by
-        Returns list of CarListing objects
+        Returns list of CarListing objects, in the order of makes
+        """
+        by_make = self.search_makes(makes, model, year_min, year_max, price_min, price_max,
+                                    location, max_results, private_sellers_only)
+        return [listing for make in makes for listing in by_make[make]]
+    
+    def search_makes(self, makes: List[str], model: Optional[str] = None, year_min: Optional[int] = None,
+                     year_max: Optional[int] = None, price_min: Optional[int] = None,
+                     price_max: Optional[int] = None, location: Optional[str] = None,
+                     max_results: int = 20, private_sellers_only: bool = False,
+                     stop_at: Optional[Dict[str, Set[str]]] = None) -> Dict[str, List[CarListing]]:
+        """
+        Search each make concurrently (up to max_concurrency at once) and return listings keyed by make
+        
+        stop_at maps a make to URLs already crawled for it. Those makes are
+        crawled incrementally (see _search_make) and return only new listings.
+        """
+        args = (model, year_min, year_max, price_min, price_max, location, max_results, private_sellers_only)
+        stop_at = stop_at or {}
+        
+        if len(makes) <= 1 or self.max_concurrency <= 1:
+            return {make: self._search_make_safely(make, *args, stop_at=stop_at.get(make)) for make in makes}
+        
+        workers = min(self.max_concurrency, len(makes))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            search_make = bind(self._search_make_safely)
+            futures = {make: executor.submit(search_make, make, *args, stop_at=stop_at.get(make))
+                       for make in makes}
+            return {make: future.result() for make, future in futures.items()}
+    
+    def _search_make_safely(self, make: str, *args, stop_at: Optional[Set[str]] = None) -> List[CarListing]:
+        """Run _search_make, turning a failure into an empty result for that make only"""
+        try:
+            with self.span('make', make=make):
+                if stop_at is not None:
+                    return self._search_make(make, *args, stop_at=stop_at)
+                return self._search_make(make, *args)
+        except Exception as e:
+            print(f"  Error searching {self.source_name} for {make}: {e}")
+            return []
+    
+    @abstractmethod
+    def _search_make(self, make: str, model: Optional[str] = None, year_min: Optional[int] = None,
+                     year_max: Optional[int] = None, price_min: Optional[int] = None,
+                     price_max: Optional[int] = None, location: Optional[str] = None,
+                     max_results: int = 20, private_sellers_only: bool = False,
+                     stop_at: Optional[Set[str]] = None) -> List[CarListing]:
+        """
+        Search for a single make. Returns list of CarListing objects
+        
+        Scrapers with supports_incremental treat a stop_at set as an
+        incremental crawl: sort newest first, skip URLs in stop_at and stop
+        once SeenListings says the rest is known.
         """
         pass
-
@@ -0,0 +1,79 @@
+"""
+Resolves the ChromeDriver binary once per process
+"""
+from typing import Optional
+from selenium.webdriver.chrome.service import Service
+import os
+import shutil
+import threading
+import time
+
+# How long to wait before asking webdriver-manager again after a failed lookup
+RETRY_AFTER_SECONDS = 300
+
+_UNRESOLVED = object()
+_driver_path = _UNRESOLVED
+_failed_at = 0.0
+_lock = threading.Lock()
+
+
+def _offline() -> bool:
+    return os.environ.get('CHROMEDRIVER_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def _lookup_driver_path() -> Optional[str]:
+    """Find a ChromeDriver binary: pinned path, then webdriver-manager, then PATH"""
+    pinned = os.environ.get('CHROMEDRIVER_PATH')
+    if pinned:
+        if os.path.isfile(pinned):
+            return pinned
+        print(f"Warning: CHROMEDRIVER_PATH {pinned} does not exist")
+
+    if not _offline():
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            return ChromeDriverManager().install()
+        except Exception as e:
+            print(f"Warning: webdriver-manager could not resolve ChromeDriver: {e}")
+
+    return shutil.which('chromedriver')
+
+
+def resolve_chromedriver_path() -> Optional[str]:
+    """
+    Return the ChromeDriver path, resolving it on first call.
+
+    Set CHROMEDRIVER_PATH to pin a local binary, and CHROMEDRIVER_OFFLINE=1
+    to never contact the webdriver-manager download endpoint.
+    """
+    global _driver_path, _failed_at
+    with _lock:
+        if _driver_path is not _UNRESOLVED:
+            if _driver_path is not None or time.monotonic() - _failed_at < RETRY_AFTER_SECONDS:
+                return _driver_path
+
+        _driver_path = _lookup_driver_path()
+        if _driver_path is None:
+            _failed_at = time.monotonic()
+        return _driver_path
+
+
+def chrome_service() -> Optional[Service]:
+    """
+    A Service for the resolved ChromeDriver, or None to let Selenium find one itself.
+
+    Every driver gets its own Service because a Service owns the chromedriver
+    subprocess; only the resolved binary path is shared.
+    """
+    driver_path = resolve_chromedriver_path()
+    if driver_path is None:
+        return None
+    return Service(driver_path)
+
+
+def reset_chromedriver_cache():
+    """Forget the resolved path so the next driver start looks it up again"""
+    global _driver_path, _failed_at
+    with _lock:
+        _driver_path = _UNRESOLVED
+        _failed_at = 0.0
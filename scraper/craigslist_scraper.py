@@ -1,29 +1,46 @@
 """
 Craigslist scraper for used cars
 """
-from typing import List, Optional
-from scraper.base_scraper import BaseScraper, CarListing
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
+from typing import List, Optional, Set
+from scraper.base_scraper import BaseScraper, CarListing, SeenListings
+from scraper.page_readiness import ReadinessProfile, wait_until_ready
+from scraper.parsing import YEAR_RE, parse_html
+from bs4 import SoupStrainer
 import re
-import time
+
+# Compiled once - these run against every card on every page
+_LISTING_LINK_RE = re.compile(r'/cto/|/ctd/')
+_OWNER_LINK_RE = re.compile(r'/cto/')
+_PRICE_TEXT_RE = re.compile(r'\$[\d,]+')
+_PRICE_CLASS_RE = re.compile(r'price|amount')
+_LOCATION_CLASS_RE = re.compile(r'location|nearby')
+_PARENS_RE = re.compile(r'\((.*?)\)')
+_PRICE_SPAN_RE = re.compile(r'price')
+_LOCATION_SPAN_RE = re.compile(r'location')
+
+# Only the result cards of a rendered search page are worth building a tree for
+_CARD_STRAINER = SoupStrainer('li', class_='cl-search-result')
+
+# Results per search page; later pages are requested with the `s` offset
+_PAGE_SIZE = 120
 
 
 class CraigslistScraper(BaseScraper):
     """Scraper for Craigslist car listings"""
     
+    # Serve cached search pages for 5 minutes before revalidating
+    cache_max_age = 300
+    # Craigslist blocks bursty clients quickly
+    requests_per_second = 1.0
+    burst = 2
+    readiness = ReadinessProfile('li.cl-search-result', timeout=10)
+    supports_incremental = True
+    
     def __init__(self, use_selenium: bool = True):
         super().__init__("Craigslist")
         self.base_url_all = "https://{location}.craigslist.org/search/cta"
         self.base_url_owner = "https://{location}.craigslist.org/search/cto"
         self.use_selenium = use_selenium
-        self.driver = None
         # Common location mappings
         self.location_map = {
             'new jersey': 'newjersey',
@@ -91,195 +108,192 @@ class CraigslistScraper(BaseScraper):
         # Return normalized version
         return normalized
     
-    def _setup_driver(self):
-        """Setup Selenium WebDriver"""
-        if self.driver:
-            return
+    def _search_make(self, make: str, model: Optional[str] = None, year_min: Optional[int] = None,
+                     year_max: Optional[int] = None, price_min: Optional[int] = None,
+                     price_max: Optional[int] = None, location: Optional[str] = None,
+                     max_results: int = 20, private_sellers_only: bool = False,
+                     stop_at: Optional[Set[str]] = None) -> List[CarListing]:
+        """Search Craigslist for a single make"""
+        # Normalize location
+        location_code = self._normalize_location(location)
         
-        chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        chrome_options.add_argument(f'user-agent={self.ua.random}')
+        # Build search query
+        query = make
+        if model:
+            query += f" {model}"
+        if year_min:
+            query += f" {year_min}"
         
-        try:
-            # Try with webdriver-manager first
-            from webdriver_manager.chrome import ChromeDriverManager
-            
-            # Clear cache and re-download if there's an issue
-            driver_path = ChromeDriverManager().install()
-            service = Service(driver_path)
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        except Exception as e:
-            # Try without webdriver-manager (if ChromeDriver is in PATH)
+        # Build URL
+        base_url = self.base_url_owner if private_sellers_only else self.base_url_all
+        url = base_url.format(location=location_code)
+        params = {
+            'query': query,
+            # Newest first lets an incremental crawl stop at the first known posts
+            'sort': 'date' if stop_at is not None else 'rel'
+        }
+        
+        if price_min:
+            params['min_price'] = price_min
+        if price_max:
+            params['max_price'] = price_max
+        
+        # Try Selenium first if enabled
+        if self.use_selenium:
             try:
-                self.driver = webdriver.Chrome(options=chrome_options)
-            except:
-                # Silently fail - will use regular scraping
-                self.driver = None
+                driver = self._checkout_driver()
+                if driver:
+                    seen = SeenListings(stop_at)
+                    listings = self._search_with_selenium(driver, url, params, location_code,
+                                                          max_results, seen)
+                    if listings or seen.done:
+                        return listings
+            except Exception as e:
+                print(f"  Selenium search failed, trying regular method: {e}")
+        
+        # Fallback to regular scraping
+        def fetch(page: int) -> Optional[List[CarListing]]:
+            soup = self.get_page(url, self._page_params(params, page))
+            return self._parse_results(soup, location_code) if soup else None
+        
+        return self._collect_pages(fetch, max_results, _PAGE_SIZE, SeenListings(stop_at))
+    
+    def _page_params(self, params: dict, page: int) -> dict:
+        """Query parameters for the given result page (0-based)"""
+        return dict(params, s=page * _PAGE_SIZE) if page else params
     
-    def search(self, makes: List[str], model: Optional[str] = None, year_min: Optional[int] = None,
-               year_max: Optional[int] = None, price_min: Optional[int] = None,
-               price_max: Optional[int] = None, location: Optional[str] = None,
-               max_results: int = 20, private_sellers_only: bool = False) -> List[CarListing]:
-        """Search Craigslist for cars"""
+    def _parse_results(self, soup, location_code: str) -> List[CarListing]:
+        """Listings on one server-rendered search page"""
         all_listings = []
         
-        # Normalize location
-        location_code = self._normalize_location(location)
+        # Find all listings - prioritize finding links directly as structure varies
+        # Look for owner (/cto/) and dealer (/ctd/) links
+        listing_links = soup.find_all('a', href=_LISTING_LINK_RE)
         
-        # Search for each make
-        for make in makes:
-            # Build search query
-            query = make
-            if model:
-                query += f" {model}"
-            if year_min:
-                query += f" {year_min}"
-            
-            # Build URL
-            base_url = self.base_url_owner if private_sellers_only else self.base_url_all
-            url = base_url.format(location=location_code)
-            params = {
-                'query': query,
-                'sort': 'rel'
-            }
-            
-            if price_min:
-                params['min_price'] = price_min
-            if price_max:
-                params['max_price'] = price_max
-            
-            # Try Selenium first if enabled
-            listings = []
-            if self.use_selenium:
-                try:
-                    self._setup_driver()
-                    if self.driver:
-                        listings = self._search_with_selenium(url, params, location_code, max_results)
-                        if listings:
-                            all_listings.extend(listings)
-                            continue
-                except Exception as e:
-                    print(f"  Selenium search failed, trying regular method: {e}")
-            
-            # Fallback to regular scraping
-            soup = self.get_page(url, params)
-            if not soup:
-                continue
-            
-            # Find all listings - prioritize finding links directly as structure varies
-            # Look for owner (/cto/) and dealer (/ctd/) links
-            listing_links = soup.find_all('a', href=re.compile(r'/cto/|/ctd/'))
-            
-            # Deduplicate by URL
-            seen_urls = set()
-            unique_links = []
-            for link in listing_links:
-                href = link.get('href')
-                if href and href not in seen_urls:
-                    seen_urls.add(href)
-                    unique_links.append(link)
-            
-            results = unique_links
-            
-            for link_elem in results[:max_results]:
-                try:
-                    # The link itself usually contains the title or is the main entry point
-                    title_elem = link_elem
-                    
-                    # Get parent container to find other details like price
-                    container = link_elem.find_parent(['li', 'div', 'p'])
-                    
-                    title = self.clean_text(title_elem.get_text())
-                    # If title is empty/short, it might be an image link, try to find a sibling link or text
-                    if len(title) < 3 and container:
-                        # Try to find another link in the container that might be the title
-                        other_link = container.find('a', string=lambda text: text and len(text) > 5)
-                        if other_link:
-                            title = self.clean_text(other_link.get_text())
-                        else:
-                            # Try to find text directly in container
-                            title = self.clean_text(container.get_text())
-                            # Truncate if too long (it might be the whole card text)
-                            if len(title) > 100:
-                                title = title[:100] + "..."
+        # Deduplicate by URL
+        seen_urls = set()
+        unique_links = []
+        for link in listing_links:
+            href = link.get('href')
+            if href and href not in seen_urls:
+                seen_urls.add(href)
+                unique_links.append(link)
+        
+        results = unique_links
+        
+        for link_elem in results:
+            try:
+                # The link itself usually contains the title or is the main entry point
+                title_elem = link_elem
+                
+                # Get parent container to find other details like price
+                container = link_elem.find_parent(['li', 'div', 'p'])
+                
+                title = self.clean_text(title_elem.get_text())
+                # If title is empty/short, it might be an image link, try to find a sibling link or text
+                if len(title) < 3 and container:
+                    # Try to find another link in the container that might be the title
+                    other_link = container.find('a', string=lambda text: text and len(text) > 5)
+                    if other_link:
+                        title = self.clean_text(other_link.get_text())
+                    else:
+                        # Try to find text directly in container
+                        title = self.clean_text(container.get_text())
+                        # Truncate if too long (it might be the whole card text)
+                        if len(title) > 100:
+                            title = title[:100] + "..."
 
-                    relative_url = title_elem.get('href', '')
-                    
-                    if relative_url.startswith('//'):
-                        url_full = 'https:' + relative_url
-                    elif relative_url.startswith('/'):
-                        url_full = f"https://{location_code}.craigslist.org{relative_url}"
+                relative_url = title_elem.get('href', '')
+                
+                if relative_url.startswith('//'):
+                    url_full = 'https:' + relative_url
+                elif relative_url.startswith('/'):
+                    url_full = f"https://{location_code}.craigslist.org{relative_url}"
+                else:
+                    url_full = relative_url
+                
+                # Extract price - look in container
+                price = "N/A"
+                if container:
+                    price_elem = container.find(string=_PRICE_TEXT_RE)
+                    if price_elem:
+                        price = self.clean_price(price_elem)
                     else:
-                        url_full = relative_url
-                    
-                    # Extract price - look in container
-                    price = "N/A"
-                    if container:
-                        price_elem = container.find(string=re.compile(r'\$[\d,]+'))
+                        # Try specific classes if generic text search fails
+                        price_elem = container.find(class_=_PRICE_CLASS_RE)
                         if price_elem:
-                            price = self.clean_price(price_elem)
-                        else:
-                            # Try specific classes if generic text search fails
-                            price_elem = container.find(class_=re.compile(r'price|amount'))
-                            if price_elem:
-                                price = self.clean_price(price_elem.get_text())
+                            price = self.clean_price(price_elem.get_text())
 
-                    # Extract location
-                    location_text = "N/A"
-                    if container:
-                        # Try to find location in parens or specific class
-                        loc_elem = container.find(class_=re.compile(r'location|nearby'))
-                        if loc_elem:
-                            location_text = self.clean_text(loc_elem.get_text())
-                        else:
-                            # Look for text in parens e.g. (New York)
-                            loc_match = re.search(r'\((.*?)\)', container.get_text())
-                            if loc_match:
-                                location_text = loc_match.group(1)
-                    
-                    # Extract year from title or text
-                    year = ""
-                    year_match = re.search(r'\b(19|20)\d{2}\b', title)
-                    if not year_match and container:
-                         year_match = re.search(r'\b(19|20)\d{2}\b', container.get_text())
-                    
-                    if year_match:
-                        year = year_match.group()
-                    
-                    # Extract image
-                    image_url = ""
-                    # Check if the link itself is an image or contains one
-                    img = link_elem.find('img')
-                    if not img and container:
-                        img = container.find('img')
-                    
-                    if img:
-                         image_url = img.get('src', '') or img.get('data-src', '')
-                    
-                    listing = CarListing(
-                        title=title,
-                        price=price,
-                        location=location_text,
-                        url=url_full,
-                        source=self.source_name,
-                        year=year,
-                        image_url=image_url
-                    )
-                    all_listings.append(listing)
-                    
-                except Exception as e:
-                    print(f"  Error parsing Craigslist listing: {e}")
-                    continue
+                # Extract location
+                location_text = "N/A"
+                if container:
+                    # Try to find location in parens or specific class
+                    loc_elem = container.find(class_=_LOCATION_CLASS_RE)
+                    if loc_elem:
+                        location_text = self.clean_text(loc_elem.get_text())
+                    else:
+                        # Look for text in parens e.g. (New York)
+                        loc_match = _PARENS_RE.search(container.get_text())
+                        if loc_match:
+                            location_text = loc_match.group(1)
+                
+                # Extract year from title or text
+                year = ""
+                year_match = YEAR_RE.search(title)
+                if not year_match and container:
+                     year_match = YEAR_RE.search(container.get_text())
+                
+                if year_match:
+                    year = year_match.group()
+                
+                # Extract image
+                image_url = ""
+                # Check if the link itself is an image or contains one
+                img = link_elem.find('img')
+                if not img and container:
+                    img = container.find('img')
+                
+                if img:
+                     image_url = img.get('src', '') or img.get('data-src', '')
+                
+                listing = CarListing(
+                    title=title,
+                    price=price,
+                    location=location_text,
+                    url=url_full,
+                    source=self.source_name,
+                    year=year,
+                    image_url=image_url
+                )
+                all_listings.append(listing)
+                
+            except Exception as e:
+                print(f"  Error parsing Craigslist listing: {e}")
+                continue
         
         return all_listings
     
-    def _search_with_selenium(self, url: str, params: dict, location_code: str, max_results: int) -> List[CarListing]:
-        """Search using Selenium for JavaScript-rendered content"""
+    def _search_with_selenium(self, driver, url: str, params: dict, location_code: str, max_results: int,
+                              seen: Optional[SeenListings] = None) -> List[CarListing]:
+        """Search using Selenium for JavaScript-rendered content, one page after another"""
+        pages = 0
+        
+        def render(page: int) -> Optional[List[CarListing]]:
+            nonlocal pages
+            pages += 1
+            return self._render_page(driver, url, self._page_params(params, page), location_code,
+                                     min(max_results, _PAGE_SIZE))
+        
+        try:
+            # The driver loads one page at a time
+            with self.span('selenium_search'):
+                return self._collect_pages(render, max_results, _PAGE_SIZE, seen, concurrency=1)
+        finally:
+            self._release_driver(driver, pages=max(pages, 1))
+    
+    def _render_page(self, driver, url: str, params: dict, location_code: str,
+                     expected: int) -> Optional[List[CarListing]]:
+        """Load one search page in the driver and parse its cards; None on failure"""
         listings = []
         
         try:
@@ -287,31 +301,33 @@ class CraigslistScraper(BaseScraper):
             from urllib.parse import urlencode
             full_url = f"{url}?{urlencode(params)}"
             
-            self.driver.get(full_url)
-            time.sleep(2)  # Wait for page to load
+            self._throttle(full_url)
+            with self.timed('page_load'):
+                driver.get(full_url)
+                
+                # Wait until enough cards are rendered or the page goes quiet
+                with self.span('wait_ready'):
+                    wait_until_ready(driver, self.readiness, expected)
             
-            # Wait for listings to appear
-            try:
-                WebDriverWait(self.driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'li.cl-search-result, a[href*="/cto/"]'))
-                )
-            except:
-                pass  # Continue even if timeout
-            
-            # Get page source and parse
-            page_source = self.driver.page_source
-            soup = BeautifulSoup(page_source, 'lxml')
+            # Get page source and parse just the result cards
+            page_source = driver.page_source
+            self._count_bytes(len(page_source))
+            with self.timed('parse'):
+                soup = parse_html(page_source, _CARD_STRAINER)
             
             # Find listings
             results = soup.find_all('li', class_='cl-search-result')
             
             if not results:
-                results = soup.find_all('a', href=re.compile(r'/cto/|/ctd/'))
+                # Climbing from links to their cards needs the whole document
+                with self.timed('parse'):
+                    soup = parse_html(page_source)
+                results = soup.find_all('a', href=_LISTING_LINK_RE)
                 results = [r.find_parent('li') or r.find_parent('div') for r in results if r]
             
-            for result in results[:max_results]:
+            for result in results:
                 try:
-                    title_elem = result.find('a', class_='cl-app-anchor') or result.find('a', href=re.compile(r'/cto/'))
+                    title_elem = result.find('a', class_='cl-app-anchor') or result.find('a', href=_OWNER_LINK_RE)
                     if not title_elem:
                         continue
                     
@@ -325,18 +341,18 @@ class CraigslistScraper(BaseScraper):
                     else:
                         url_full = relative_url
                     
-                    price_elem = result.find('span', class_='priceinfo') or result.find('span', class_=re.compile(r'price'))
+                    price_elem = result.find('span', class_='priceinfo') or result.find('span', class_=_PRICE_SPAN_RE)
                     price = "N/A"
                     if price_elem:
                         price = self.clean_price(price_elem.get_text())
                     
-                    location_elem = result.find('span', class_='meta') or result.find('span', class_=re.compile(r'location'))
+                    location_elem = result.find('span', class_='meta') or result.find('span', class_=_LOCATION_SPAN_RE)
                     location_text = "N/A"
                     if location_elem:
                         location_text = self.clean_text(location_elem.get_text())
                     
                     year = ""
-                    year_match = re.search(r'\b(19|20)\d{2}\b', title)
+                    year_match = YEAR_RE.search(title)
                     if year_match:
                         year = year_match.group()
                     
@@ -362,10 +378,8 @@ class CraigslistScraper(BaseScraper):
                     
         except Exception as e:
             print(f"  Error in Selenium search: {e}")
-        finally:
-            if self.driver:
-                self.driver.quit()
-                self.driver = None
+            self._page_failed(e)
+            return None
         
         return listings
 
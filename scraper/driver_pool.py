@@ -0,0 +1,242 @@
+"""
+Process-wide pool of long-lived headless Chrome drivers shared by the Selenium scrapers
+"""
+from typing import Dict, List, Optional
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from fake_useragent import UserAgent
+from scraper.chromedriver import chrome_service, reset_chromedriver_cache
+import atexit
+import os
+import threading
+import time
+
+
+def build_chrome_options(user_agent: str) -> Options:
+    """Chrome options used for every pooled driver"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    chrome_options.add_argument(f'user-agent={user_agent}')
+    return chrome_options
+
+
+def _process_tree_rss_mb(root_pid: int) -> Optional[float]:
+    """Resident memory of a process and all its descendants, in MB (Linux only)"""
+    if not os.path.isdir('/proc'):
+        return None
+
+    children: Dict[int, List[int]] = {}
+    rss_pages: Dict[int, int] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after the closing paren
+                fields = f.read().rsplit(')', 1)[1].split()
+            pid = int(entry)
+            children.setdefault(int(fields[1]), []).append(pid)
+            rss_pages[pid] = int(fields[21])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    if root_pid not in rss_pages:
+        return None
+
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class DriverPool:
+    """
+    Bounded pool of warm Chrome drivers.
+
+    Drivers are checked out with acquire() and handed back with release().
+    A driver is recycled once it has served max_pages page loads or its
+    browser process tree grows past max_rss_mb, and idle drivers are
+    health-checked before being handed out again.
+    """
+
+    def __init__(self, size: int = 3, max_pages: int = 50, max_rss_mb: float = 1024,
+                 acquire_timeout: float = 30):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.acquire_timeout = acquire_timeout
+        self.ua = UserAgent()
+        self._idle: List[webdriver.Chrome] = []
+        self._pages: Dict[int, int] = {}
+        self._live = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[webdriver.Chrome]:
+        """Check out a driver, starting one if the pool has room. Returns None if none is available."""
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            driver = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return None
+                    if self._idle:
+                        # Most recently used first - it is the warmest
+                        driver = self._idle.pop()
+                        break
+                    if self._live < self.size:
+                        self._live += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._cond.wait(remaining)
+
+            if driver is None:
+                driver = self._start_driver()
+                if driver is None:
+                    self._forget(None)
+                return driver
+
+            if self._is_healthy(driver):
+                return driver
+            self._discard(driver)
+
+    def release(self, driver: Optional[webdriver.Chrome], pages: int = 1):
+        """Return a driver to the pool after it served the given number of page loads"""
+        if driver is None:
+            return
+
+        with self._cond:
+            served = self._pages.get(id(driver), 0) + pages
+            self._pages[id(driver)] = served
+            closed = self._closed
+
+        if closed or served >= self.max_pages or self._over_memory_limit(driver):
+            self._discard(driver)
+            return
+
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    def shutdown(self):
+        """Quit all idle drivers; drivers still checked out are quit when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+    def stats(self) -> Dict[str, int]:
+        """Current pool occupancy"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'live': self._live,
+                'idle': len(self._idle),
+                'in_use': self._live - len(self._idle),
+            }
+
+    def _start_driver(self) -> Optional[webdriver.Chrome]:
+        """Launch a new headless Chrome"""
+        chrome_options = build_chrome_options(self.ua.random)
+        service = chrome_service()
+        if service is not None:
+            try:
+                return webdriver.Chrome(service=service, options=chrome_options)
+            except Exception as e:
+                # The resolved binary may be stale or broken - look it up again next
+                # time, and meanwhile fall back to whatever ChromeDriver is on PATH
+                print(f"Warning: ChromeDriver at {service.path} failed to start: {e}")
+                reset_chromedriver_cache()
+        try:
+            # Let Selenium locate ChromeDriver itself (e.g. on PATH)
+            return webdriver.Chrome(options=chrome_options)
+        except Exception:
+            # Silently fail - scrapers will use regular scraping
+            return None
+
+    def _is_healthy(self, driver: webdriver.Chrome) -> bool:
+        """Cheap round-trip to make sure the browser is still responsive"""
+        try:
+            driver.execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def _over_memory_limit(self, driver: webdriver.Chrome) -> bool:
+        if not self.max_rss_mb:
+            return False
+        try:
+            rss = _process_tree_rss_mb(driver.service.process.pid)
+        except Exception:
+            return False
+        return rss is not None and rss > self.max_rss_mb
+
+    def _discard(self, driver: webdriver.Chrome):
+        """Quit a driver and free its slot"""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        self._forget(driver)
+
+    def _forget(self, driver: Optional[webdriver.Chrome]):
+        with self._cond:
+            if driver is not None:
+                self._pages.pop(id(driver), None)
+            self._live -= 1
+            self._cond.notify()
+
+
+_pool: Optional[DriverPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """Return the process-wide driver pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(
+                size=int(os.environ.get('DRIVER_POOL_SIZE', 3)),
+                max_pages=int(os.environ.get('DRIVER_MAX_PAGES', 50)),
+                max_rss_mb=float(os.environ.get('DRIVER_MAX_RSS_MB', 1024)),
+                acquire_timeout=float(os.environ.get('DRIVER_ACQUIRE_TIMEOUT', 30)),
+            )
+        return _pool
+
+
+def shutdown_driver_pool():
+    """Quit every pooled browser. Safe to call more than once."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _reset_after_fork():
+    # Browsers started by the parent belong to the parent; a forked worker starts its own
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+atexit.register(shutdown_driver_pool)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
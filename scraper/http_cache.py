@@ -0,0 +1,190 @@
+"""
+On-disk HTTP cache with conditional revalidation for BaseScraper.fetch_page
+"""
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+_MAX_AGE_RE = re.compile(r'max-age\s*=\s*(\d+)')
+
+
+class CacheEntry:
+    """A cached response body and the headers needed to revalidate it"""
+
+    def __init__(self, url: str, body: bytes, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, max_age: int = 0,
+                 stored_at: Optional[float] = None):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.max_age = max_age
+        self.stored_at = stored_at if stored_at is not None else time.time()
+
+    def is_fresh(self, max_age_override: Optional[int] = None) -> bool:
+        """True if the entry may be served without contacting the server"""
+        max_age = self.max_age if max_age_override is None else max_age_override
+        return time.time() - self.stored_at < max_age
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating this entry"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """
+    Size-bounded on-disk cache of page bodies.
+
+    Entries are stored as a body file plus a JSON metadata file named after
+    the SHA-256 of the full request URL. Files are written atomically, so
+    several worker processes can share one directory. When the directory
+    grows past max_bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, digest)
+        return base + '.body', base + '.json'
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Return the cached entry for url, if any"""
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            # Body mtime doubles as the last-access time for LRU eviction
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(url, body, meta.get('etag'), meta.get('last_modified'),
+                          meta.get('max_age', 0), meta.get('stored_at'))
+
+    def store(self, url: str, response) -> Optional[CacheEntry]:
+        """Cache a 200 response unless its Cache-Control forbids it"""
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return None
+
+        max_age = 0
+        if 'no-cache' not in cache_control:
+            match = _MAX_AGE_RE.search(cache_control)
+            if match:
+                max_age = int(match.group(1))
+
+        entry = CacheEntry(url, response.content, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'), max_age)
+        self._write(entry)
+        self._evict()
+        return entry
+
+    def refresh(self, entry: CacheEntry, response) -> CacheEntry:
+        """Record a 304 Not Modified: keep the body, update validators and age"""
+        entry.etag = response.headers.get('ETag', entry.etag)
+        entry.last_modified = response.headers.get('Last-Modified', entry.last_modified)
+        match = _MAX_AGE_RE.search(response.headers.get('Cache-Control', '').lower())
+        if match:
+            entry.max_age = int(match.group(1))
+        entry.stored_at = time.time()
+        self._write(entry, body=False)
+        return entry
+
+    def clear(self):
+        """Remove every cached entry"""
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _write(self, entry: CacheEntry, body: bool = True):
+        body_path, meta_path = self._paths(entry.url)
+        meta = {
+            'url': entry.url,
+            'etag': entry.etag,
+            'last_modified': entry.last_modified,
+            'max_age': entry.max_age,
+            'stored_at': entry.stored_at,
+        }
+        if body:
+            self._write_atomic(body_path, entry.body)
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def _write_atomic(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.body'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                for stale in (path, path[:-len('.body')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                total -= size
+
+
+_cache: Optional[HTTPCache] = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[HTTPCache]:
+    """
+    Return the process-wide HTTP cache, or None when HTTP_CACHE_ENABLED=0.
+
+    HTTP_CACHE_DIR and HTTP_CACHE_MAX_MB configure its location and size.
+    """
+    global _cache, _cache_configured
+    with _cache_lock:
+        if not _cache_configured:
+            if os.environ.get('HTTP_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                directory = os.environ.get('HTTP_CACHE_DIR',
+                                           os.path.join(tempfile.gettempdir(), 'ibuycars-http-cache'))
+                max_mb = float(os.environ.get('HTTP_CACHE_MAX_MB', 200))
+                _cache = HTTPCache(directory, max_bytes=int(max_mb * 1024 * 1024))
+            _cache_configured = True
+        return _cache
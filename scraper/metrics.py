@@ -0,0 +1,294 @@
+"""
+Scraper metrics in Prometheus text format, aggregated across threads and worker processes
+"""
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Tuple
+import atexit
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# A worker's gauges count only while it keeps reporting them
+GAUGE_TTL = 60
+
+# name -> (type, help); histograms are stored as their _bucket, _sum and _count counters
+METRICS = {
+    'scraper_stage_seconds': ('histogram', 'Time spent in each scraping stage, excluding nested stages'),
+    'scraper_requests_total': ('counter', 'Result pages requested, by outcome (ok, empty, blocked, timeout, error)'),
+    'scraper_bytes_downloaded_total': ('counter', 'Bytes of pages downloaded over HTTP or rendered in Chrome'),
+    'scraper_listings_total': ('counter', 'Listings returned per source'),
+    'scraper_searches_total': ('counter', 'Source searches, by outcome (ok, empty, timeout, error)'),
+    'http_cache_requests_total': ('counter', 'HTTP cache lookups (fresh, revalidated, miss)'),
+    'result_cache_requests_total': ('counter', 'Result cache lookups per make (hit, miss)'),
+    'driver_pool_drivers': ('gauge', 'Chrome drivers per state (idle, in_use) and the pool size'),
+}
+# Ratios derived from counters when rendering: name -> (counter, label, values counted as hits)
+RATIOS = {
+    'http_cache_hit_ratio': ('http_cache_requests_total', 'result', ('fresh', 'revalidated')),
+    'result_cache_hit_ratio': ('result_cache_requests_total', 'result', ('hit',)),
+}
+
+_timers = threading.local()
+# One name="value" pair of a format_labels string; values may hold escaped quotes and commas
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+_UNESCAPES = {'\\': '\\', 'n': '\n', '"': '"'}
+
+
+def format_labels(labels: Dict) -> str:
+    """{'source': 'Cars.com', 'stage': 'parse'} -> 'source="Cars.com",stage="parse"'"""
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    return ','.join(f'{name}="{escape(labels[name])}"' for name in sorted(labels))
+
+
+def parse_labels(text: str) -> Dict[str, str]:
+    """Inverse of format_labels: 'source="Cars.com",stage="parse"' -> {'source': 'Cars.com', 'stage': 'parse'}"""
+    return {name: re.sub(r'\\(.)', lambda m: _UNESCAPES.get(m.group(1), m.group(1)), value)
+            for name, value in _LABEL_RE.findall(text)}
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    Counters, histograms and gauges buffered in memory and flushed to a SQLite file.
+
+    Counters (and histogram buckets) are added to shared totals on flush, so
+    every gunicorn worker pointing at the same file contributes to the same
+    series. Gauges are stored per process and summed over the processes that
+    reported within GAUGE_TTL. A background thread flushes every
+    flush_interval seconds; render() flushes this process first.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._gauges: Dict[Tuple[str, str], float] = {}
+        self._flusher_pid = None
+        self._local = threading.local()
+        db = self._connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS metric_counters (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels)
+            )
+        ''')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS metric_gauges (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                value REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (name, labels, pid)
+            )
+        ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        # Per thread and per process - connections must not cross a fork
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA busy_timeout=5000')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, so each worker starts its own
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        # Whatever a forked worker inherited was already counted by the parent
+        self._counters = {}
+        self._gauges = {}
+        threading.Thread(target=self._flush_loop, daemon=True, name='metrics-flush').start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add value to a counter"""
+        key = (name, format_labels(labels))
+        with self._lock:
+            self._start_flusher()
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one histogram observation"""
+        # Every bucket gets a row, even at 0, so the exposition always lists the full histogram
+        updates = [((f'{name}_bucket', format_labels(dict(labels, le=_format_value(bound)))),
+                    1 if value <= bound else 0)
+                   for bound in LATENCY_BUCKETS + (math.inf,)]
+        updates.append(((f'{name}_count', format_labels(labels)), 1))
+        with self._lock:
+            self._start_flusher()
+            for key, count in updates:
+                self._counters[key] = self._counters.get(key, 0) + count
+            key = (f'{name}_sum', format_labels(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set this process's value of a gauge"""
+        with self._lock:
+            self._start_flusher()
+            self._gauges[(name, format_labels(labels))] = value
+
+    @contextmanager
+    def timed(self, name: str, **labels) -> Iterator[None]:
+        """
+        Observe the time spent in the block, minus time spent in timed blocks nested inside it
+        (on the same thread), so stages add up instead of overlapping.
+        """
+        stack = getattr(_timers, 'stack', None)
+        if stack is None:
+            stack = _timers.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.observe(name, max(elapsed - nested, 0.0), **labels)
+
+    def flush(self):
+        """Add this process's buffered counts to the shared totals and refresh its gauges"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges = dict(self._gauges)
+        if not counters and not gauges:
+            return
+        try:
+            db = self._connect()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.executemany('''
+                    INSERT INTO metric_counters (name, labels, value) VALUES (?, ?, ?)
+                    ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value
+                ''', [(name, labels, value) for (name, labels), value in counters.items()])
+                now = time.time()
+                db.executemany('''
+                    INSERT OR REPLACE INTO metric_gauges (name, labels, pid, value, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(name, labels, os.getpid(), value, now) for (name, labels), value in gauges.items()])
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not flush metrics: {e}")
+            # Keep the counts for the next attempt
+            with self._lock:
+                for key, value in counters.items():
+                    self._counters[key] = self._counters.get(key, 0) + value
+
+    def forget_process(self):
+        """Flush and drop this process's gauges, e.g. when a worker exits"""
+        self.flush()
+        self._flusher_pid = None
+        try:
+            self._connect().execute('DELETE FROM metric_gauges WHERE pid = ?', (os.getpid(),))
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not clear metrics: {e}")
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format"""
+        self.flush()
+        db = self._connect()
+        counters = db.execute('SELECT name, labels, value FROM metric_counters').fetchall()
+        gauges = db.execute('''
+            SELECT name, labels, SUM(value) FROM metric_gauges
+            WHERE updated_at >= ? GROUP BY name, labels
+        ''', (time.time() - GAUGE_TTL,)).fetchall()
+
+        series: Dict[str, List[Tuple[str, float]]] = {}
+        for name, labels, value in counters + gauges:
+            series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            names = [f'{name}_bucket', f'{name}_sum', f'{name}_count'] if kind == 'histogram' else [name]
+            if not any(n in series for n in names):
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for n in names:
+                for labels, value in sorted(series.get(n, []), key=_bucket_order):
+                    lines.append(f'{n}{{{labels}}} {_format_value(value)}' if labels
+                                 else f'{n} {_format_value(value)}')
+
+        for name, (counter, label, hits) in RATIOS.items():
+            totals: Dict[str, List[float]] = {}
+            for labels, value in series.get(counter, []):
+                parts = parse_labels(labels)
+                result = parts.pop(label, '')
+                entry = totals.setdefault(format_labels(parts), [0.0, 0.0])
+                entry[0] += value if result in hits else 0
+                entry[1] += value
+            if not totals:
+                continue
+            lines.append(f'# HELP {name} Share of {counter} that were hits')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, (hit, total) in sorted(totals.items()):
+                lines.append(f'{name}{{{labels}}} {_format_value(round(hit / total, 4) if total else 0.0)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _bucket_order(item: Tuple[str, float]):
+    # Keep histogram buckets in ascending `le` order, +Inf last
+    labels = item[0]
+    start = labels.find('le="')
+    if start < 0:
+        return (labels, 0.0)
+    end = labels.index('"', start + 4)
+    le = labels[start + 4:end]
+    return (labels[:start] + labels[end:], math.inf if le == '+Inf' else float(le))
+
+
+def timed(metrics: Optional[MetricsRegistry], name: str, **labels):
+    """metrics.timed(...), or a no-op when metrics are disabled"""
+    return metrics.timed(name, **labels) if metrics is not None else nullcontext()
+
+
+_metrics: Optional[MetricsRegistry] = None
+_metrics_configured = False
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Optional[MetricsRegistry]:
+    """
+    Return the process-wide metrics registry, or None when METRICS_ENABLED=0.
+
+    METRICS_PATH sets the SQLite file shared by the workers.
+    """
+    global _metrics, _metrics_configured
+    with _metrics_lock:
+        if not _metrics_configured:
+            if os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                path = os.environ.get('METRICS_PATH',
+                                      os.path.join(tempfile.gettempdir(), 'ibuycars-metrics.db'))
+                _metrics = MetricsRegistry(path)
+                atexit.register(_metrics.forget_process)
+            _metrics_configured = True
+        return _metrics
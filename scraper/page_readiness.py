@@ -0,0 +1,83 @@
+"""
+Waits for Selenium pages to become usable instead of sleeping for a fixed time
+"""
+import time
+
+# Counts DOM mutations since the observer was installed and reports the
+# signals the wait loop needs in a single round-trip.
+_PROBE_SCRIPT = """
+if (window.__ibcObserver === undefined) {
+    window.__ibcMutations = 0;
+    window.__ibcObserver = new MutationObserver(function (records) {
+        window.__ibcMutations += records.length;
+    });
+    window.__ibcObserver.observe(document.documentElement || document,
+                                 {childList: true, subtree: true, attributes: true});
+}
+return {
+    cards: document.querySelectorAll(arguments[0]).length,
+    mutations: window.__ibcMutations,
+    resources: performance.getEntriesByType('resource').length,
+    ready: document.readyState === 'complete'
+};
+"""
+
+
+class ReadinessProfile:
+    """
+    Per-source rules for deciding a results page is ready.
+
+    A page is ready as soon as card_selector matches the wanted number of
+    cards, or once the document has loaded and neither the DOM nor the
+    network (resource timing entries) has changed for quiet_period seconds.
+    timeout caps the wait; scroll_timeout caps the wait for lazy-loaded
+    cards after scrolling.
+    """
+
+    def __init__(self, card_selector: str, timeout: float = 10, scroll_timeout: float = 2,
+                 quiet_period: float = 0.75, poll_interval: float = 0.15):
+        self.card_selector = card_selector
+        self.timeout = timeout
+        self.scroll_timeout = scroll_timeout
+        self.quiet_period = quiet_period
+        self.poll_interval = poll_interval
+
+
+def wait_until_ready(driver, profile: ReadinessProfile, target_cards: int,
+                     timeout: float = None) -> str:
+    """
+    Block until the page is ready by the profile's rules.
+
+    Returns the signal that ended the wait: 'cards', 'quiet' or 'timeout'.
+    """
+    timeout = profile.timeout if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    last_activity = None
+    quiet_since = time.monotonic()
+
+    while True:
+        try:
+            probe = driver.execute_script(_PROBE_SCRIPT, profile.card_selector)
+        except Exception:
+            probe = None
+
+        now = time.monotonic()
+        if probe:
+            if probe['cards'] >= target_cards:
+                return 'cards'
+            activity = (probe['cards'], probe['mutations'], probe['resources'])
+            if activity != last_activity:
+                last_activity = activity
+                quiet_since = now
+            elif probe['ready'] and now - quiet_since >= profile.quiet_period:
+                return 'quiet'
+
+        if now >= deadline:
+            return 'timeout'
+        time.sleep(min(profile.poll_interval, max(0.0, deadline - now)))
+
+
+def scroll_and_wait(driver, profile: ReadinessProfile, target_cards: int) -> str:
+    """Scroll to the bottom to trigger lazy loading, then wait for the new cards to settle"""
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    return wait_until_ready(driver, profile, target_cards, timeout=profile.scroll_timeout)
@@ -0,0 +1,48 @@
+"""
+HTML parsing helpers shared by the scrapers
+"""
+from typing import Dict, Optional, Pattern, Union
+from bs4 import BeautifulSoup, SoupStrainer
+import re
+
+YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+
+_BLOCKED_RE = re.compile(rb'blocked|captcha', re.IGNORECASE)
+
+
+def looks_blocked(content: bytes) -> bool:
+    """Check raw page bytes for signs of a block page without decoding or lowercasing them"""
+    return _BLOCKED_RE.search(content) is not None
+
+
+def parse_html(markup: Union[bytes, str], parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """
+    Parse markup with lxml, optionally keeping only the elements parse_only matches.
+
+    Matching elements keep their complete subtrees, so searches inside a card
+    behave exactly as they would on the full document; only searches that
+    climb to a parent need the full tree.
+    """
+    return BeautifulSoup(markup, 'lxml', parse_only=parse_only)
+
+
+def card_strainer(tag: str, attr_patterns: Dict[str, Pattern]) -> SoupStrainer:
+    """
+    Strainer keeping `tag` elements where any attribute matches its pattern.
+
+    Lets one parse cover several alternative card selectors. Attribute values
+    are checked as the raw strings in the markup, so a class pattern matches
+    if it matches any one of the element's classes.
+    """
+    def matches(name, attrs) -> bool:
+        if name != tag or not attrs:
+            return False
+        for attr, pattern in attr_patterns.items():
+            value = attrs.get(attr)
+            if isinstance(value, list):
+                value = ' '.join(value)
+            if value and pattern.search(value):
+                return True
+        return False
+
+    return SoupStrainer(matches)
@@ -0,0 +1,126 @@
+"""
+Per-host token-bucket rate limiter shared across threads and worker processes
+"""
+from typing import Dict, Optional, Tuple
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+
+
+def bucket_key(url_or_host: str) -> str:
+    """Group subdomains under one bucket, e.g. newjersey.craigslist.org -> craigslist.org"""
+    host = urllib.parse.urlsplit(url_or_host).hostname if '//' in url_or_host else url_or_host
+    labels = (host or '').lower().split('.')
+    return '.'.join(labels[-2:])
+
+
+class RateLimiter:
+    """
+    Token buckets stored in a SQLite file.
+
+    Every reservation runs in an IMMEDIATE transaction, so threads and gunicorn
+    workers pointing at the same file draw from the same bucket. A caller that
+    finds the bucket empty still takes a token (the count goes negative) and is
+    told how long to wait for it, which spaces out concurrent callers evenly.
+    """
+
+    def __init__(self, path: str, overrides: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.path = path
+        self.overrides = overrides or {}
+        self._local = threading.local()
+        db = self._connect()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                host TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.db = db
+        return db
+
+    def reserve(self, host: str, rate: float, burst: float) -> float:
+        """Take one token for host and return the seconds to wait before using it"""
+        host = bucket_key(host)
+        rate, burst = self.overrides.get(host, (rate, burst))
+        if rate <= 0:
+            return 0.0
+
+        db = self._connect()
+        now = time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute('SELECT tokens, updated_at FROM buckets WHERE host = ?', (host,)).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            tokens -= 1
+            db.execute('''
+                INSERT INTO buckets (host, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(host) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (host, tokens, now))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+        return max(0.0, -tokens / rate)
+
+    def acquire(self, host: str, rate: float, burst: float):
+        """Block until a request to host is allowed"""
+        try:
+            wait = self.reserve(host, rate, burst)
+        except sqlite3.Error as e:
+            # Shared state unavailable - fall back to plain spacing for this request
+            print(f"Warning: rate limiter unavailable ({e})")
+            wait = 1.0 / rate if rate > 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def parse_overrides(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse 'craigslist.org=1:3,cars.com=0.5:2' into {host: (rate, burst)}"""
+    overrides = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        host, limits = item.split('=', 1)
+        rate, _, burst = limits.partition(':')
+        try:
+            overrides[bucket_key(host.strip())] = (float(rate), float(burst or 1))
+        except ValueError:
+            print(f"Warning: ignoring invalid RATE_LIMITS entry {item!r}")
+    return overrides
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_configured = False
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """
+    Return the process-wide rate limiter, or None when RATE_LIMIT_ENABLED=0.
+
+    RATE_LIMIT_PATH sets the shared state file and RATE_LIMITS overrides
+    per-host limits as host=rate:burst pairs.
+    """
+    global _limiter, _limiter_configured
+    with _limiter_lock:
+        if not _limiter_configured:
+            if os.environ.get('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no'):
+                path = os.environ.get('RATE_LIMIT_PATH',
+                                      os.path.join(tempfile.gettempdir(), 'ibuycars-ratelimit.db'))
+                _limiter = RateLimiter(path, parse_overrides(os.environ.get('RATE_LIMITS', '')))
+            _limiter_configured = True
+        return _limiter
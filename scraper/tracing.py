@@ -0,0 +1,169 @@
+"""
+Per-search traces: nested, timed spans recorded across the threads a search fans out to
+"""
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Spans beyond this many are counted but not kept, so a runaway crawl can't grow a trace without bound
+MAX_SPANS = 5000
+
+_trace: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('trace', default=None)
+_parent: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('trace_parent', default=None)
+
+
+class Span:
+    __slots__ = ('id', 'parent', 'name', 'attrs', 'thread', 'start', 'end')
+
+    def __init__(self, span_id: int, parent: Optional[int], name: str, attrs: Dict, start: float):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+        self.start = start
+        self.end: Optional[float] = None
+
+
+class Trace:
+    """
+    Spans of one traced operation. Only the code running inside tracing() (or
+    a function handed to another thread through bind()) records into it;
+    everywhere else span() costs one context variable lookup.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _open(self, name: str, parent: Optional[int], attrs: Dict) -> Optional[Span]:
+        with self._lock:
+            if len(self._spans) >= MAX_SPANS:
+                self.dropped += 1
+                return None
+            span = Span(len(self._spans), parent, name, attrs, time.perf_counter())
+            self._spans.append(span)
+            return span
+
+    def _ms(self, moment: float) -> float:
+        return round((moment - self._origin) * 1000, 3)
+
+    def to_dict(self) -> Dict:
+        """
+        The spans as a tree: {name, start_ms, duration_ms, attrs, children}, plus
+        `totals` - how often each span name occurred and its summed duration.
+        Spans on parallel threads overlap, so totals can exceed the wall time.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            spans = list(self._spans)
+        nodes: Dict[int, Dict] = {}
+        roots: List[Dict] = []
+        totals: Dict[str, Dict] = {}
+        for span in spans:
+            duration = self._ms(span.end if span.end is not None else now) - self._ms(span.start)
+            node = {'name': span.name, 'start_ms': self._ms(span.start),
+                    'duration_ms': round(duration, 3), 'thread': span.thread}
+            if span.attrs:
+                node['attrs'] = span.attrs
+            if span.end is None:
+                node['unfinished'] = True
+            node['children'] = []
+            nodes[span.id] = node
+            parent = nodes.get(span.parent) if span.parent is not None else None
+            (parent['children'] if parent is not None else roots).append(node)
+            total = totals.setdefault(span.name, {'count': 0, 'ms': 0.0})
+            total['count'] += 1
+            total['ms'] = round(total['ms'] + duration, 3)
+        return {'name': self.name, 'started_at': self.started_at, 'spans': roots,
+                'totals': totals, 'dropped': self.dropped}
+
+    def chrome_trace(self) -> Dict:
+        """The spans as Chrome trace-event JSON, for chrome://tracing or ui.perfetto.dev"""
+        now = time.perf_counter()
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self._spans)
+        threads: Dict[str, int] = {}
+        events = []
+        for span in spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            end = span.end if span.end is not None else now
+            events.append({
+                'name': span.name,
+                'cat': span.name,
+                'ph': 'X',
+                'ts': round((span.start - self._origin) * 1e6, 1),
+                'dur': round((end - span.start) * 1e6, 1),
+                'pid': pid,
+                'tid': tid,
+                'args': span.attrs,
+            })
+        for thread, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'name': self.name, 'started_at': self.started_at}}
+
+    def write_chrome_trace(self, path: str):
+        """Save chrome_trace() to a file"""
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def tracing(name: str, **attrs) -> Iterator[Trace]:
+    """Record spans opened in this block (and in functions bound to it) into a new Trace"""
+    trace = Trace(name)
+    trace_token = _trace.set(trace)
+    parent_token = _parent.set(None)
+    try:
+        with span(name, **attrs):
+            yield trace
+    finally:
+        _parent.reset(parent_token)
+        _trace.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    """Time the block as a child of the current span; a no-op outside tracing()"""
+    trace = _trace.get()
+    opened = trace._open(name, _parent.get(), attrs) if trace is not None else None
+    if opened is None:
+        yield
+        return
+    token = _parent.set(opened.id)
+    try:
+        yield
+    finally:
+        opened.end = time.perf_counter()
+        _parent.reset(token)
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    fn carrying the caller's trace and current span, for running on an
+    executor thread (threads don't inherit context variables). Returns fn
+    itself when nothing is being traced.
+    """
+    if _trace.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets a copy
+        return context.copy().run(fn, *args, **kwargs)
+    return run
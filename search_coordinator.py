@@ -1,65 +1,114 @@
 """
 Coordinates searches across multiple car listing websites
 """
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from scraper import (
     CraigslistScraper,
     AutoTraderScraper,
     CarsComScraper,
     FacebookScraper,
+    BaseScraper,
     CarListing
 )
+from result_cache import ResultCache, get_result_cache, make_cache_key
+from listing_table import ListingTable
+from dedup import dedupe_listings
+from listing_store import ListingStore, get_listing_store
+from scraper.metrics import get_metrics
+from scraper.tracing import bind, span
 import concurrent.futures
+import sqlite3
 import time
 
 
 class SearchCoordinator:
     """Coordinates searches across multiple websites"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[ResultCache] = None, store: Optional[ListingStore] = None):
         self.scrapers = [
             CraigslistScraper(),
             AutoTraderScraper(),
             CarsComScraper(),
             # FacebookScraper(),  # Commented out by default due to complexity
         ]
+        self.cache = cache if cache is not None else get_result_cache()
+        self.store = store if store is not None else get_listing_store()
+        # Search outcomes, listings returned and result cache hits, for /metrics
+        self.metrics = get_metrics()
+        # Per-source cache hits/misses and age of the last search_all call
+        self.cache_info: Dict[str, Dict] = {}
+        # When each listing of the last search was first seen (url -> timestamp), for recency sorts
+        self.seen_at: Dict[str, float] = {}
+        # Row count and age of the last stored_results answer
+        self.store_info: Dict = {}
+        # Listing counts before/after duplicate removal in the last query_listings call
+        self.dedup_info: Dict = {}
     
     def search_all(self, makes: List[str], model: Optional[str] = None, year_min: Optional[int] = None,
                    year_max: Optional[int] = None, price_min: Optional[int] = None,
                    price_max: Optional[int] = None, location: Optional[str] = None,
                    max_results: int = 20, enable_facebook: bool = False,
-                   private_sellers_only: bool = False) -> Dict[str, List[CarListing]]:
+                   private_sellers_only: bool = False, use_cache: bool = True,
+                   incremental: bool = False) -> Dict[str, List[CarListing]]:
         """
         Search all websites in parallel
         
         Args:
             makes: List of car makes to search for (e.g., ['Toyota', 'Honda'])
             model: Optional car model to filter by
+            use_cache: Reuse cached per-make results when available
+            incremental: Crawl newest-first and stop at listings the store already
+                has, topping the results up from the store
         
         Returns dictionary mapping source names to lists of listings
         """
         results = {}
+        with span('search_all'):
+            for source_name, listings in self.iter_search(
+                    makes, model, year_min, year_max, price_min, price_max, location,
+                    max_results, enable_facebook, private_sellers_only, use_cache, incremental):
+                results[source_name] = listings
+        return results
+    
+    def iter_search(self, makes: List[str], model: Optional[str] = None, year_min: Optional[int] = None,
+                    year_max: Optional[int] = None, price_min: Optional[int] = None,
+                    price_max: Optional[int] = None, location: Optional[str] = None,
+                    max_results: int = 20, enable_facebook: bool = False,
+                    private_sellers_only: bool = False,
+                    use_cache: bool = True,
+                    incremental: bool = False) -> Iterator[Tuple[str, List[CarListing]]]:
+        """
+        Search all websites in parallel, yielding (source name, listings) as each site finishes
+        
+        Takes the same arguments as search_all.
+        """
+        self.cache_info = {}
+        self.seen_at = {}
         
         # Normalize makes to list
         if isinstance(makes, str):
             makes = [m.strip() for m in makes.split(',') if m.strip()]
         
         if not makes:
-            return results
+            return
         
         # Enable Facebook if requested
         if enable_facebook:
             if not any(isinstance(s, FacebookScraper) for s in self.scrapers):
                 self.scrapers.append(FacebookScraper())
         
-        # Search all sites in parallel
+        def search_source(scraper: BaseScraper, *args) -> List[CarListing]:
+            with span('source', source=scraper.source_name):
+                return self._search_source(scraper, *args)
+        
+        # Search all sites in parallel, each thread recording into the caller's trace if any
         with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.scrapers)) as executor:
             future_to_scraper = {
                 executor.submit(
-                    scraper.search,
-                    makes, model, year_min, year_max,
+                    bind(search_source),
+                    scraper, makes, model, year_min, year_max,
                     price_min, price_max, location, max_results,
-                    private_sellers_only
+                    private_sellers_only, use_cache, incremental
                 ): scraper for scraper in self.scrapers
             }
             
@@ -68,12 +117,161 @@ class SearchCoordinator:
                 try:
                     # Set a timeout for each scraper to prevent hanging
                     listings = future.result(timeout=15)
-                    results[scraper.source_name] = listings
                     print(f"[OK] Found {len(listings)} listings on {scraper.source_name}")
+                    outcome = 'ok' if listings else 'empty'
                 except Exception as e:
                     print(f"[ERROR] Error searching {scraper.source_name}: {e}")
-                    results[scraper.source_name] = []
+                    listings = []
+                    outcome = 'timeout' if 'Timeout' in type(e).__name__ else 'error'
+                if self.metrics is not None:
+                    self.metrics.inc('scraper_searches_total', source=scraper.source_name, outcome=outcome)
+                    self.metrics.inc('scraper_listings_total', len(listings), source=scraper.source_name)
+                yield scraper.source_name, listings
+    
+    def _search_source(self, scraper: BaseScraper, makes: List[str], model: Optional[str],
+                       year_min: Optional[int], year_max: Optional[int],
+                       price_min: Optional[int], price_max: Optional[int],
+                       location: Optional[str], max_results: int,
+                       private_sellers_only: bool, use_cache: bool,
+                       incremental: bool = False) -> List[CarListing]:
+        """Search one site, serving makes from the result cache where possible"""
+        cache = self.cache if use_cache else None
+        incremental = incremental and self.store is not None and scraper.supports_incremental
+        keys = {
+            make: make_cache_key(scraper.source_name, make, model, year_min, year_max,
+                                 price_min, price_max, location, max_results,
+                                 private_sellers_only)
+            for make in makes
+        }
+        
+        by_make = {}
+        oldest = None
+        if cache is not None:
+            for make in makes:
+                entry = cache.get(keys[make])
+                if entry is None:
+                    continue
+                listing_dicts, stored_at = entry
+                by_make[make] = [CarListing.from_dict(d) for d in listing_dicts]
+                for listing in by_make[make]:
+                    self.seen_at.setdefault(listing.url, stored_at)
+                oldest = stored_at if oldest is None else min(oldest, stored_at)
         
+        missing = [make for make in makes if make not in by_make]
+        new_count = None
+        if missing:
+            marks = self._crawl_marks(scraper, missing, keys) if incremental else None
+            extra = {}
+            if marks is not None:
+                extra['stop_at'] = {make: set(urls) for make, urls in marks.items()}
+            fresh = scraper.search_makes(missing, model, year_min, year_max,
+                                         price_min, price_max, location, max_results,
+                                         private_sellers_only, **extra)
+            if marks is not None:
+                new_count = sum(len(listings) for listings in fresh.values())
+                fresh = self._add_known_listings(scraper, fresh, marks, keys, max_results)
+            scraped_at = time.time()
+            for make in missing:
+                listings = fresh.get(make, [])
+                by_make[make] = listings
+                for listing in listings:
+                    self.seen_at[listing.url] = scraped_at
+                # Empty results are usually blocking or a timeout - don't pin them
+                if cache is not None and listings:
+                    cache.set(keys[make], [listing.to_dict() for listing in listings])
+            with span('store_results'):
+                self._store_results(fresh, location, scraped_at)
+        
+        if cache is not None and self.metrics is not None:
+            self.metrics.inc('result_cache_requests_total', len(makes) - len(missing),
+                             source=scraper.source_name, result='hit')
+            self.metrics.inc('result_cache_requests_total', len(missing),
+                             source=scraper.source_name, result='miss')
+        self.cache_info[scraper.source_name] = {
+            'hits': len(makes) - len(missing),
+            'misses': len(missing),
+            'age': round(time.time() - oldest, 1) if oldest is not None else None,
+        }
+        if new_count is not None:
+            self.cache_info[scraper.source_name]['new'] = new_count
+        
+        return [listing for make in makes for listing in by_make[make]]
+    
+    def _crawl_marks(self, scraper: BaseScraper, makes: List[str],
+                     keys: Dict[str, str]) -> Optional[Dict[str, List[str]]]:
+        """URLs of each make's last crawl, or None to crawl in full if the store fails"""
+        try:
+            return {make: self.store.crawl_mark(scraper.source_name, keys[make]) for make in makes}
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not read crawl marks: {e}")
+            return None
+    
+    def _add_known_listings(self, scraper: BaseScraper, fresh: Dict[str, List[CarListing]],
+                            marks: Dict[str, List[str]], keys: Dict[str, str],
+                            max_results: int) -> Dict[str, List[CarListing]]:
+        """
+        Complete an incremental crawl: new listings first, then the previously
+        crawled ones from the store, and move each make's mark to the result
+        """
+        combined = {}
+        for make, new in fresh.items():
+            listings = list(new)
+            try:
+                new_urls = {listing.url for listing in new}
+                known = self.store.get_listings(url for url in marks[make] if url not in new_urls)
+                listings.extend(known[url] for url in marks[make] if url in known)
+                listings = listings[:max_results]
+                # An empty crawl is usually blocking - keep the old mark
+                if listings:
+                    self.store.set_crawl_mark(scraper.source_name, keys[make],
+                                              [listing.url for listing in listings])
+            except sqlite3.Error as e:
+                print(f"[ERROR] Could not complete incremental crawl: {e}")
+            combined[make] = listings
+        return combined
+    
+    def _store_results(self, by_make: Dict[str, List[CarListing]], location: Optional[str],
+                       scraped_at: float):
+        """Upsert freshly scraped listings and take their first_seen times for recency"""
+        if self.store is None:
+            return
+        try:
+            if self.store.upsert(by_make, location, scraped_at):
+                urls = [listing.url for listings in by_make.values() for listing in listings]
+                self.seen_at.update(self.store.first_seen(urls))
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not store listings: {e}")
+    
+    def stored_results(self, makes: List[str], model: Optional[str] = None,
+                       year_min: Optional[int] = None, year_max: Optional[int] = None,
+                       price_min: Optional[int] = None, price_max: Optional[int] = None,
+                       location: Optional[str] = None, max_age: Optional[float] = None,
+                       max_results: Optional[int] = None, **ignored) -> Dict[str, List[CarListing]]:
+        """
+        Answer a search from the listing store without scraping
+        
+        Takes the search_all arguments (options only scraping uses are
+        ignored) and returns the same source -> listings mapping, with at
+        most max_results of each make per source, as a scrape would.
+        """
+        self.seen_at = {}
+        self.store_info = {}
+        if isinstance(makes, str):
+            makes = [m.strip() for m in makes.split(',') if m.strip()]
+        if self.store is None or not makes:
+            return {}
+        
+        rows = self.store.search(makes, model, year_min, year_max, price_min, price_max,
+                                 location, max_age, per_make=max_results)
+        results: Dict[str, List[CarListing]] = {}
+        for listing, first_seen, last_seen in rows:
+            results.setdefault(listing.source, []).append(listing)
+            self.seen_at[listing.url] = first_seen
+        newest = max((last_seen for _, _, last_seen in rows), default=None)
+        self.store_info = {
+            'count': len(rows),
+            'age': round(time.time() - newest, 1) if newest is not None else None,
+        }
         return results
     
     def get_all_listings(self, results: Dict[str, List[CarListing]]) -> List[CarListing]:
@@ -87,37 +285,37 @@ class SearchCoordinator:
                        year_min: Optional[int] = None,
                        year_max: Optional[int] = None,
                        price_min: Optional[int] = None,
-                       price_max: Optional[int] = None) -> List[CarListing]:
-        """Filter listings by year and price"""
-        filtered = []
-        
-        for listing in listings:
-            # Filter by year
-            if year_min or year_max:
-                if listing.year:
-                    try:
-                        year = int(listing.year)
-                        if year_min and year < year_min:
-                            continue
-                        if year_max and year > year_max:
-                            continue
-                    except:
-                        pass
-            
-            # Filter by price
-            if price_min or price_max:
-                # Extract numeric price
-                price_str = listing.price.replace('$', '').replace(',', '').strip()
-                try:
-                    price = int(price_str)
-                    if price_min and price < price_min:
-                        continue
-                    if price_max and price > price_max:
-                        continue
-                except:
-                    pass
-            
-            filtered.append(listing)
+                       price_max: Optional[int] = None,
+                       mileage_max: Optional[int] = None,
+                       sources: Optional[List[str]] = None) -> List[CarListing]:
+        """Filter listings by year, price and mileage; listings missing a value are kept"""
+        with span('filter_listings', listings=len(listings)):
+            return ListingTable(listings).query(year_min=year_min, year_max=year_max,
+                                                price_min=price_min, price_max=price_max,
+                                                mileage_max=mileage_max, sources=sources)
+    
+    def query_listings(self, results: Dict[str, List[CarListing]],
+                       year_min: Optional[int] = None, year_max: Optional[int] = None,
+                       price_min: Optional[int] = None, price_max: Optional[int] = None,
+                       mileage_max: Optional[int] = None, sources: Optional[List[str]] = None,
+                       sort: Optional[str] = None, limit: Optional[int] = None,
+                       dedupe: bool = True) -> List[CarListing]:
+        """
+        Merge all sources into a ListingTable, then filter, sort and take the top `limit`
         
-        return filtered
+        sort is a comma-separated list of price, year, mileage and recency,
+        each optionally prefixed with '-' for descending (e.g. 'price,-year').
+        With dedupe, reposts and cross-site copies collapse into one listing
+        carrying the others' URLs, and dedup_info records how many were removed.
+        """
+        listings = self.get_all_listings(results)
+        if dedupe:
+            with span('dedupe', listings=len(listings)):
+                listings, self.dedup_info = dedupe_listings(listings)
+        with span('query_listings', listings=len(listings)):
+            table = ListingTable(listings, self.seen_at)
+            return table.query(year_min=year_min, year_max=year_max,
+                               price_min=price_min, price_max=price_max,
+                               mileage_max=mileage_max, sources=sources,
+                               sort=sort, limit=limit)
 
@@ -0,0 +1,255 @@
+"""
+Background search jobs, so a long scrape doesn't hold a web worker for its whole duration
+"""
+from typing import Callable, Dict, List, Optional
+from db import get_connection
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+# How often a poller re-reads a job that runs in another worker
+POLL_INTERVAL = 0.25
+# Expired jobs are looked for at most this often per process
+PURGE_INTERVAL = 10
+
+
+class SearchJob:
+    """State of one background search, as last read from the job database"""
+
+    def __init__(self, job_id: str, params: Dict, status: str = 'queued',
+                 created_at: Optional[float] = None, finished_at: Optional[float] = None,
+                 summary: Optional[Dict[str, int]] = None, cache: Optional[Dict[str, Dict]] = None,
+                 total: int = 0, error: Optional[str] = None, version: int = 0):
+        self.id = job_id
+        self.params = params
+        self.status = status
+        self.created_at = created_at if created_at is not None else time.time()
+        self.finished_at = finished_at
+        self.summary = summary or {}
+        self.cache = cache or {}
+        # Listings found so far
+        self.total = total
+        self.error = error
+        # Bumped on every change so pollers can wait for something new
+        self.version = version
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'error')
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> 'SearchJob':
+        return cls(row['id'], json.loads(row['params']), row['status'], row['created_at'],
+                   row['finished_at'], json.loads(row['summary']), json.loads(row['cache']),
+                   row['total'], row['error'], row['version'])
+
+    def to_dict(self, listings: List[Dict], since: int = 0) -> Dict:
+        """Job status plus the listings found after the first `since` ones"""
+        return {
+            'id': self.id,
+            'status': self.status,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'summary': dict(self.summary),
+            'cache': dict(self.cache),
+            'total': self.total,
+            'since': since,
+            'listings': listings,
+            'error': self.error,
+        }
+
+
+class SearchJobManager:
+    """
+    Runs searches on a background thread pool and keeps their results for ttl seconds.
+
+    A job runs in the worker that created it, but its state and listings are
+    written to a SQLite file shared by all workers, so a poll can land on any
+    of them. Jobs still unfinished max_age seconds after they were created -
+    a hung scrape, or a worker that died mid-search - are failed.
+    """
+
+    def __init__(self, coordinator_factory: Callable, path: str, max_workers: int = 2,
+                 ttl: float = 600, max_age: float = 1800):
+        self.coordinator_factory = coordinator_factory
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                               thread_name_prefix='search-job')
+        # Notified on every change made by this process, so local pollers wake at once
+        self._cond = threading.Condition()
+        self._purged_at = 0.0
+        db = get_connection(path)
+        with db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS search_jobs (
+                    id TEXT PRIMARY KEY,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    finished_at REAL,
+                    summary TEXT NOT NULL DEFAULT '{}',
+                    cache TEXT NOT NULL DEFAULT '{}',
+                    total INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    dedupe_key TEXT
+                )
+            ''')
+            columns = {row['name'] for row in db.execute('PRAGMA table_info(search_jobs)')}
+            if 'dedupe_key' not in columns:
+                db.execute('ALTER TABLE search_jobs ADD COLUMN dedupe_key TEXT')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_search_jobs_dedupe_key ON search_jobs (dedupe_key)')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS search_job_listings (
+                    job_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    listing TEXT NOT NULL,
+                    PRIMARY KEY (job_id, seq)
+                )
+            ''')
+
+    def submit(self, params: Dict, dedupe_key: Optional[str] = None) -> SearchJob:
+        """
+        Queue a search; params are SearchCoordinator.search_all keyword arguments.
+
+        With dedupe_key, an unfinished job submitted under the same key (by any
+        worker) is returned instead of starting another identical search.
+        """
+        job = SearchJob(uuid.uuid4().hex, params)
+        self._purge_expired()
+        db = get_connection(self.path)
+        with db:
+            if dedupe_key is not None:
+                # The write lock makes look-up-then-insert atomic across workers
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute("SELECT * FROM search_jobs WHERE dedupe_key = ? "
+                                 "AND status IN ('queued', 'running')", (dedupe_key,)).fetchone()
+                if row is not None:
+                    return SearchJob.from_row(row)
+            db.execute('INSERT INTO search_jobs (id, params, status, created_at, dedupe_key) '
+                       'VALUES (?, ?, ?, ?, ?)',
+                       (job.id, json.dumps(params), job.status, job.created_at, dedupe_key))
+        self._executor.submit(self._run, job.id, params)
+        return job
+
+    def get(self, job_id: str) -> Optional[SearchJob]:
+        """The job's current state, or None if it never existed or has expired"""
+        self._purge_expired()
+        row = get_connection(self.path).execute(
+            'SELECT * FROM search_jobs WHERE id = ?', (job_id,)).fetchone()
+        return SearchJob.from_row(row) if row else None
+
+    def describe(self, job: SearchJob, since: int = 0) -> Dict:
+        """Consistent snapshot of a job for the API"""
+        db = get_connection(self.path)
+        with db:
+            # One read transaction, so the listings match the state they're reported with
+            db.execute('BEGIN')
+            row = db.execute('SELECT * FROM search_jobs WHERE id = ?', (job.id,)).fetchone()
+            rows = db.execute('SELECT listing FROM search_job_listings WHERE job_id = ? AND seq >= ? '
+                              'ORDER BY seq', (job.id, since)).fetchall()
+        if row is not None:
+            job = SearchJob.from_row(row)
+        return job.to_dict([json.loads(r['listing']) for r in rows], since)
+
+    def wait(self, job: SearchJob, version: int, timeout: float) -> SearchJob:
+        """Block until the job changes past `version`, finishes, or timeout passes; returns its latest state"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job.id) or job
+            remaining = deadline - time.monotonic()
+            if job.version > version or job.finished or remaining <= 0:
+                return job
+            with self._cond:
+                self._cond.wait(min(remaining, POLL_INTERVAL))
+
+    def _run(self, job_id: str, params: Dict):
+        if not self._update(job_id, status='running'):
+            return
+        try:
+            coordinator = self.coordinator_factory()
+            for source_name, listings in coordinator.iter_search(**params):
+                filtered = coordinator.filter_listings(
+                    listings,
+                    year_min=params.get('year_min'),
+                    year_max=params.get('year_max'),
+                    price_min=params.get('price_min'),
+                    price_max=params.get('price_max')
+                )
+                if not self._add_results(job_id, source_name, coordinator.cache_info.get(source_name),
+                                         len(listings), [listing.to_dict() for listing in filtered]):
+                    # Failed for running past max_age - nobody is waiting for the rest
+                    return
+            self._update(job_id, status='done')
+        except Exception as e:
+            print(f"[ERROR] Search job {job_id} failed: {e}")
+            traceback.print_exc()
+            self._update(job_id, status='error', error=f'{type(e).__name__}: {e}')
+
+    def _add_results(self, job_id: str, source_name: str, cache: Optional[Dict], found: int,
+                     listings: List[Dict]) -> bool:
+        """Append one source's listings; False if the job is no longer running"""
+        db = get_connection(self.path)
+        with db:
+            # Take the write lock before reading, so the append can't race another writer
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute("SELECT summary, cache, total FROM search_jobs "
+                             "WHERE id = ? AND status = 'running'", (job_id,)).fetchone()
+            if row is None:
+                return False
+            summary = dict(json.loads(row['summary']), **{source_name: found})
+            caches = dict(json.loads(row['cache']), **{source_name: cache})
+            db.executemany('INSERT INTO search_job_listings (job_id, seq, listing) VALUES (?, ?, ?)',
+                           [(job_id, row['total'] + i, json.dumps(listing))
+                            for i, listing in enumerate(listings)])
+            db.execute('UPDATE search_jobs SET summary = ?, cache = ?, total = ?, version = version + 1 '
+                       'WHERE id = ?', (json.dumps(summary), json.dumps(caches),
+                                        row['total'] + len(listings), job_id))
+        self._notify()
+        return True
+
+    def _update(self, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Move an unfinished job to status; False if it had already finished (or expired)"""
+        finished_at = time.time() if status in ('done', 'error') else None
+        db = get_connection(self.path)
+        with db:
+            updated = db.execute('''
+                UPDATE search_jobs SET status = ?, error = ?, finished_at = ?, version = version + 1
+                WHERE id = ? AND status IN ('queued', 'running')
+            ''', (status, error, finished_at, job_id)).rowcount
+        self._notify()
+        return bool(updated)
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _purge_expired(self):
+        """Fail jobs unfinished after max_age and drop finished jobs older than ttl"""
+        now = time.time()
+        if now - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = now
+        try:
+            db = get_connection(self.path)
+            with db:
+                db.execute('''
+                    UPDATE search_jobs SET status = 'error', error = 'Search timed out',
+                        finished_at = ?, version = version + 1
+                    WHERE status IN ('queued', 'running') AND created_at < ?
+                ''', (now, now - self.max_age))
+                expired = [row['id'] for row in db.execute(
+                    "SELECT id FROM search_jobs WHERE status IN ('done', 'error') AND finished_at < ?",
+                    (now - self.ttl,))]
+                if expired:
+                    db.executemany('DELETE FROM search_job_listings WHERE job_id = ?',
+                                   [(job_id,) for job_id in expired])
+                    db.executemany('DELETE FROM search_jobs WHERE id = ?', [(job_id,) for job_id in expired])
+        except sqlite3.Error as e:
+            print(f"[ERROR] Could not purge search jobs: {e}")
@@ -1,6 +1,8 @@
 // Car Search Application
 let allListingsGlobal = []; // Store all listings for filtering
 let currentFilter = null; // Track current filter
+let currentSnapshot = null; // Server-side snapshot the results are paged from
+const RESULTS_PAGE_SIZE = 20;
 
 document.addEventListener('DOMContentLoaded', function () {
     const searchForm = document.getElementById('searchForm');
@@ -10,25 +12,33 @@ document.addEventListener('DOMContentLoaded', function () {
     const noResults = document.getElementById('noResults');
     const loadingOverlay = document.getElementById('loadingOverlay');
     const searchBtn = document.getElementById('searchBtn');
+    const sortSelect = document.getElementById('sort');
+    const loadMoreResults = document.getElementById('loadMoreResults');
+    const shareResultsBtn = document.getElementById('shareResultsBtn');
 
     // Notes elements
     const notesSection = document.getElementById('notes');
     const notesContainer = document.getElementById('notesContainer');
     const noNotes = document.getElementById('noNotes');
+    const loadMoreNotes = document.getElementById('loadMoreNotes');
     const navNotes = document.getElementById('navNotes');
     const noteModal = document.getElementById('noteModal');
     const closeModal = document.querySelector('.close-modal');
     const noteForm = document.getElementById('noteForm');
 
-    // Form submission
-    searchForm.addEventListener('submit', async function (e) {
-        e.preventDefault();
+    // Saved search elements
+    const savedSection = document.getElementById('saved');
+    const savedContainer = document.getElementById('savedContainer');
+    const noSaved = document.getElementById('noSaved');
+    const navSaved = document.getElementById('navSaved');
+    const saveSearchBtn = document.getElementById('saveSearchBtn');
 
-        // Get form data
+    // Read the search form into an API request body
+    function collectFormData() {
         const makeInput = document.getElementById('make').value.trim();
         const modelInput = document.getElementById('model').value.trim();
 
-        const formData = {
+        return {
             make: makeInput,
             model: modelInput || null,
             year_min: document.getElementById('year_min').value || null,
@@ -38,8 +48,17 @@ document.addEventListener('DOMContentLoaded', function () {
             location: document.getElementById('location').value.trim() || null,
             max_results: parseInt(document.getElementById('max_results').value) || 20,
             enable_facebook: document.getElementById('enable_facebook').checked,
-            private_sellers_only: document.getElementById('private_sellers_only').checked
+            private_sellers_only: document.getElementById('private_sellers_only').checked,
+            mileage_max: document.getElementById('mileage_max').value || null,
+            sort: document.getElementById('sort').value || null
         };
+    }
+
+    // Form submission
+    searchForm.addEventListener('submit', async function (e) {
+        e.preventDefault();
+
+        const formData = collectFormData();
 
         // Validate
         if (!formData.location) {
@@ -52,36 +71,225 @@ document.addEventListener('DOMContentLoaded', function () {
         searchBtn.disabled = true;
         resultsSection.style.display = 'none';
         notesSection.style.display = 'none';
+        savedSection.style.display = 'none';
+        currentSnapshot = null;
+        setNextCursor(null);
+        shareResultsBtn.style.display = 'none';
 
         try {
-            // Make API request
-            const response = await fetch('/api/search', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(formData)
-            });
+            await streamSearch(formData);
+        } catch (error) {
+            loadingOverlay.style.display = 'none';
+            searchBtn.disabled = false;
+            alert('Error connecting to server: ' + error.message);
+            console.error('Search error:', error);
+        }
+    });
 
-            const data = await response.json();
+    // Run a search against the streaming endpoint, rendering each site's
+    // listings as soon as that site finishes
+    async function streamSearch(formData) {
+        const response = await fetch('/api/search/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            // Columnar listings are much smaller on the wire; decodeListings unpacks them
+            // page_size: the summary carries the first page; the rest is paged from the snapshot
+            body: JSON.stringify({ ...formData, format: 'columnar', page_size: RESULTS_PAGE_SIZE })
+        });
 
-            // Hide loading
+        if (!response.ok || !response.body) {
+            const data = await response.json();
             loadingOverlay.style.display = 'none';
             searchBtn.disabled = false;
+            alert('Error: ' + (data.error || 'Unknown error occurred'));
+            return;
+        }
 
-            if (data.success) {
-                displayResults(data);
-            } else {
-                alert('Error: ' + (data.error || 'Unknown error occurred'));
+        const summary = {};
+        let started = false;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        function handleEvent(event) {
+            if (event.type === 'source') {
+                if (!started) {
+                    // First site is back - drop the overlay and show what we have
+                    started = true;
+                    loadingOverlay.style.display = 'none';
+                    displayResults({ summary: {}, total: 0, listings: [] });
+                }
+                summary[event.source] = event.count;
+                recordDuplicates(event.duplicates);
+                appendListings(decodeListings(event.listings));
+                displaySummary(summary, allListingsGlobal.length);
+            } else if (event.type === 'summary') {
+                if (event.listings) {
+                    // Sorted results replace the per-site order they arrived in
+                    loadingOverlay.style.display = 'none';
+                    displayResults({ summary: event.summary, total: event.total, listings: decodeListings(event.listings) });
+                } else if (!started) {
+                    loadingOverlay.style.display = 'none';
+                    displayResults({ summary: event.summary, total: 0, listings: [] });
+                }
+                if (event.snapshot) {
+                    showSnapshot(event.snapshot.id, event.next_cursor);
+                }
+                displaySummary(event.summary, 'next_cursor' in event ? event.total : allListingsGlobal.length);
+                noResults.style.display = allListingsGlobal.length > 0 ? 'none' : 'block';
+            } else if (event.type === 'error') {
+                alert('Error: ' + (event.error || 'Unknown error occurred'));
             }
-        } catch (error) {
-            loadingOverlay.style.display = 'none';
-            searchBtn.disabled = false;
-            alert('Error connecting to server: ' + error.message);
-            console.error('Search error:', error);
+        }
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) handleEvent(JSON.parse(line));
+            }
+        }
+        if (buffer.trim()) handleEvent(JSON.parse(buffer));
+
+        loadingOverlay.style.display = 'none';
+        searchBtn.disabled = false;
+    }
+
+    // Turn a columnar listings payload ({fields, interned, strings, rows}) back
+    // into listing objects; plain arrays pass through unchanged
+    function decodeListings(payload) {
+        if (!payload || Array.isArray(payload)) return payload;
+        const interned = new Set(payload.interned);
+        return payload.rows.map(row => {
+            const listing = {};
+            payload.fields.forEach((field, i) => {
+                const value = row[i];
+                listing[field] = interned.has(field) && typeof value === 'number'
+                    ? payload.strings[value] : value;
+            });
+            return listing;
+        });
+    }
+
+    // Page further results out of a stored snapshot, and make the address a shareable link to it
+    function showSnapshot(snapshotId, nextCursor) {
+        currentSnapshot = snapshotId;
+        history.replaceState(null, '', '?results=' + encodeURIComponent(snapshotId));
+        shareResultsBtn.style.display = 'inline-block';
+        shareResultsBtn.textContent = 'Copy Link';
+        setNextCursor(nextCursor);
+    }
+
+    function setNextCursor(cursor) {
+        loadMoreResults.style.display = cursor ? 'block' : 'none';
+        loadMoreResults.dataset.cursor = cursor || '';
+    }
+
+    // Fetch a page of the current snapshot in the selected order and source;
+    // without a cursor it replaces the cards shown, with one it appends
+    async function loadResultsPage(cursor) {
+        const query = new URLSearchParams({ limit: RESULTS_PAGE_SIZE, format: 'columnar' });
+        if (cursor) query.set('cursor', cursor);
+        if (sortSelect.value) query.set('sort', sortSelect.value);
+        if (currentFilter) query.set('sources', currentFilter);
+
+        const response = await fetch(`/api/results/${encodeURIComponent(currentSnapshot)}?${query}`);
+        const data = await response.json();
+        if (!data.success) {
+            currentSnapshot = null;
+            setNextCursor(null);
+            shareResultsBtn.style.display = 'none';
+            history.replaceState(null, '', window.location.pathname);
+            alert('These results have expired - run the search again.');
+            return null;
+        }
+
+        const listings = decodeListings(data.listings);
+        if (cursor) {
+            appendListings(listings);
+        } else {
+            allListingsGlobal = listings;
+            resultsContainer.innerHTML = '';
+            listings.forEach(listing => resultsContainer.appendChild(createCarCard(listing)));
+            noResults.style.display = listings.length > 0 ? 'none' : 'block';
+        }
+        setNextCursor(data.next_cursor);
+        return data;
+    }
+
+    loadMoreResults.addEventListener('click', function () {
+        loadResultsPage(loadMoreResults.dataset.cursor);
+    });
+
+    // Re-sorting a stored result set doesn't need another search
+    sortSelect.addEventListener('change', function () {
+        if (currentSnapshot && resultsSection.style.display !== 'none') {
+            loadResultsPage();
         }
     });
 
+    shareResultsBtn.addEventListener('click', function () {
+        navigator.clipboard.writeText(window.location.href)
+            .then(() => shareResultsBtn.textContent = 'Link Copied!')
+            .catch(() => prompt('Copy this link:', window.location.href));
+    });
+
+    // Reopen the results a shared link points to
+    async function openSharedResults(snapshotId) {
+        currentSnapshot = snapshotId;
+        try {
+            const data = await loadResultsPage();
+            if (!data) return;
+            if (data.search) {
+                document.getElementById('make').value = (data.search.makes || []).join(', ');
+                document.getElementById('model').value = data.search.model || '';
+                document.getElementById('location').value = data.search.location || '';
+            }
+            resultsSection.style.display = 'block';
+            displaySummary(data.summary || {}, data.total);
+            showSnapshot(snapshotId, data.next_cursor);
+        } catch (error) {
+            console.error('Error loading shared results:', error);
+        }
+    }
+
+    const sharedResults = new URLSearchParams(window.location.search).get('results');
+    if (sharedResults) {
+        openSharedResults(sharedResults);
+    }
+
+    // Attach listings the server recognised as repeats to the listing already shown
+    function recordDuplicates(duplicates) {
+        if (!duplicates) return;
+        duplicates.forEach(duplicate => {
+            const original = allListingsGlobal.find(listing => listing.url === duplicate.duplicate_of);
+            if (original) {
+                original.alternate_urls = (original.alternate_urls || []).concat([duplicate.url]);
+            }
+        });
+    }
+
+    // Add listings from one more source to the current results
+    function appendListings(listings) {
+        if (!listings || listings.length === 0) return;
+
+        allListingsGlobal = allListingsGlobal.concat(listings);
+        noResults.style.display = 'none';
+
+        listings.forEach(listing => {
+            if (!currentFilter || listing.source === currentFilter) {
+                resultsContainer.appendChild(createCarCard(listing));
+            }
+        });
+    }
+
     // Display results
     function displayResults(data) {
         const { summary, total, listings } = data;
@@ -149,6 +357,13 @@ document.addEventListener('DOMContentLoaded', function () {
         document.querySelectorAll('.summary-badge').forEach(b => b.classList.remove('active'));
         document.querySelector(`[data-source="${source}"]`).classList.add('active');
 
+        // Paged results are filtered server-side so every page matches
+        if (currentSnapshot) {
+            currentFilter = source === 'all' ? null : source;
+            loadResultsPage();
+            return;
+        }
+
         // Filter listings
         let filteredListings;
         if (source === 'all') {
@@ -196,6 +411,13 @@ document.addEventListener('DOMContentLoaded', function () {
         if (listing.location && listing.location !== 'N/A') {
             details.push(`<div class="car-detail-item">📍 ${listing.location}</div>`);
         }
+        if (listing.has_note) {
+            details.push(`<div class="car-detail-item note-preview" title="Your note">📝 ${listing.note_preview}</div>`);
+        }
+        if (listing.alternate_urls && listing.alternate_urls.length > 0) {
+            const count = listing.alternate_urls.length;
+            details.push(`<div class="car-detail-item" title="${listing.alternate_urls.join('\n')}">🔁 Also listed ${count} more time${count > 1 ? 's' : ''}</div>`);
+        }
 
         card.innerHTML = `
             <div class="car-image">
@@ -207,7 +429,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 ${details.length > 0 ? `<div class="car-details">${details.join('')}</div>` : ''}
                 <div class="car-footer">
                     <span class="source-badge ${sourceClass}">${listing.source}</span>
-                    <button class="btn-note" data-url="${listing.url}" data-title="${listing.title}" data-price="${listing.price}" data-source="${listing.source}" data-image="${listing.image_url || ''}">📝 Note</button>
+                    <button class="btn-note" data-url="${listing.url}" data-title="${listing.title}" data-price="${listing.price}" data-source="${listing.source}" data-image="${listing.image_url || ''}">📝 ${listing.has_note ? 'Edit Note' : 'Note'}</button>
                     <a href="${listing.url}" target="_blank" class="view-link">View Listing →</a>
                 </div>
             </div>
@@ -240,15 +462,27 @@ document.addEventListener('DOMContentLoaded', function () {
         document.getElementById('search').style.display = 'none';
         document.querySelector('.hero').style.display = 'none';
         resultsSection.style.display = 'none';
+        savedSection.style.display = 'none';
         notesSection.style.display = 'block';
         loadNotes();
     });
 
+    navSaved.addEventListener('click', function (e) {
+        e.preventDefault();
+        document.getElementById('search').style.display = 'none';
+        document.querySelector('.hero').style.display = 'none';
+        resultsSection.style.display = 'none';
+        notesSection.style.display = 'none';
+        savedSection.style.display = 'block';
+        loadSavedSearches();
+    });
+
     document.querySelector('a[href="#search"]').addEventListener('click', function (e) {
         e.preventDefault();
         document.getElementById('search').style.display = 'block';
         document.querySelector('.hero').style.display = 'block';
         notesSection.style.display = 'none';
+        savedSection.style.display = 'none';
         if (resultsContainer.children.length > 0) {
             resultsSection.style.display = 'block';
         }
@@ -265,14 +499,11 @@ document.addEventListener('DOMContentLoaded', function () {
         document.getElementById('noteText').value = ''; // Clear previous note
 
         // Check if note exists
-        fetch('/api/notes')
+        fetch('/api/notes?url=' + encodeURIComponent(data.url))
             .then(res => res.json())
             .then(response => {
-                if (response.success) {
-                    const existing = response.notes.find(n => n.url === data.url);
-                    if (existing) {
-                        document.getElementById('noteText').value = existing.note;
-                    }
+                if (response.success && response.notes.length > 0) {
+                    document.getElementById('noteText').value = response.notes[0].note;
                 }
             });
 
@@ -310,6 +541,13 @@ document.addEventListener('DOMContentLoaded', function () {
 
             if (data.success) {
                 noteModal.style.display = 'none';
+                const listing = allListingsGlobal.find(l => l.url === formData.url);
+                if (listing) {
+                    listing.has_note = true;
+                    listing.note_preview = formData.note.length > 80 ? formData.note.slice(0, 79) + '…' : formData.note;
+                }
+                document.querySelectorAll(`.btn-note[data-url="${CSS.escape(formData.url)}"]`)
+                    .forEach(btn => btn.textContent = '📝 Edit Note');
                 alert('Note saved successfully!');
             } else {
                 alert('Error saving note: ' + (data.error || 'Unknown error'));
@@ -319,13 +557,16 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
-    // Load Notes
-    function loadNotes() {
-        fetch('/api/notes')
+    // Load Notes - a page at a time; "Load More" follows the cursor
+    function loadNotes(cursor) {
+        const url = cursor ? '/api/notes?cursor=' + encodeURIComponent(cursor) : '/api/notes';
+        fetch(url)
             .then(res => res.json())
             .then(response => {
                 if (response.success) {
-                    displayNotes(response.notes);
+                    displayNotes(response.notes, Boolean(cursor));
+                    loadMoreNotes.style.display = response.next_cursor ? 'block' : 'none';
+                    loadMoreNotes.dataset.cursor = response.next_cursor || '';
                 }
             })
             .catch(error => {
@@ -333,16 +574,21 @@ document.addEventListener('DOMContentLoaded', function () {
             });
     }
 
+    loadMoreNotes.addEventListener('click', function () {
+        loadNotes(loadMoreNotes.dataset.cursor);
+    });
+
     // Display Notes
-    function displayNotes(notes) {
-        if (notes.length === 0) {
-            noNotes.style.display = 'block';
+    function displayNotes(notes, append) {
+        if (!append) {
             notesContainer.innerHTML = '';
+        }
+        if (notes.length === 0 && !append) {
+            noNotes.style.display = 'block';
             return;
         }
 
         noNotes.style.display = 'none';
-        notesContainer.innerHTML = '';
 
         notes.forEach(note => {
             const card = document.createElement('div');
@@ -364,7 +610,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     <div class="car-footer">
                         <span class="source-badge ${sourceClass}">${note.source}</span>
                         <div class="note-actions">
-                            <button class="btn-delete" data-url="${note.url}">Delete</button>
+                            <button class="btn-delete" data-id="${note.id}">Delete</button>
                             <a href="${note.url}" target="_blank" class="view-link">View Listing →</a>
                         </div>
                     </div>
@@ -374,7 +620,7 @@ document.addEventListener('DOMContentLoaded', function () {
             // Delete handler
             card.querySelector('.btn-delete').addEventListener('click', function () {
                 if (confirm('Delete this note?')) {
-                    deleteNote(note.url);
+                    deleteNote(note.id);
                 }
             });
 
@@ -383,13 +629,9 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     // Delete Note
-    function deleteNote(url) {
-        fetch('/api/notes', {
-            method: 'DELETE',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ url: url })
+    function deleteNote(noteId) {
+        fetch(`/api/notes/${noteId}`, {
+            method: 'DELETE'
         })
             .then(res => res.json())
             .then(response => {
@@ -403,4 +645,129 @@ document.addEventListener('DOMContentLoaded', function () {
                 alert('Error deleting note: ' + error.message);
             });
     }
+
+    // Saved Searches
+
+    // Save the current form as a search the server refreshes on a schedule
+    saveSearchBtn.addEventListener('click', async function () {
+        const formData = collectFormData();
+        if (!formData.location) {
+            alert('Please enter a location or ZIP code');
+            return;
+        }
+        const name = prompt('Name this search:', formData.make || formData.location);
+        if (name === null) return;
+        formData.name = name;
+        formData.interval_minutes = parseInt(document.getElementById('save_interval').value) || 60;
+
+        try {
+            const response = await fetch('/api/saved-searches', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(formData)
+            });
+            const data = await response.json();
+            if (data.success) {
+                alert('Search saved! New listings and price changes will appear under Saved Searches.');
+            } else {
+                alert('Error saving search: ' + (data.error || 'Unknown error'));
+            }
+        } catch (error) {
+            alert('Error saving search: ' + error.message);
+        }
+    });
+
+    function loadSavedSearches() {
+        fetch('/api/saved-searches')
+            .then(res => res.json())
+            .then(response => {
+                if (response.success) {
+                    displaySavedSearches(response.searches);
+                }
+            })
+            .catch(error => {
+                console.error('Error loading saved searches:', error);
+            });
+    }
+
+    function formatCents(cents) {
+        return cents === null || cents === undefined ? 'N/A' : '$' + Math.round(cents / 100).toLocaleString();
+    }
+
+    function displaySavedSearches(searches) {
+        savedContainer.innerHTML = '';
+        noSaved.style.display = searches.length === 0 ? 'block' : 'none';
+
+        searches.forEach(search => {
+            const card = document.createElement('div');
+            card.className = 'saved-search-card';
+            const lastRun = search.last_run ? new Date(search.last_run * 1000).toLocaleString() : 'not yet';
+            const unseen = search.unseen > 0 ? `<span class="unseen-badge">${search.unseen} new</span>` : '';
+
+            card.innerHTML = `
+                <div class="saved-search-header">
+                    <h4 class="car-title">${search.name} ${unseen}</h4>
+                    <div class="saved-search-meta">
+                        Every ${Math.round(search.interval / 60)} min · last checked ${lastRun}
+                        ${search.last_error ? `<span class="saved-search-error">⚠ ${search.last_error}</span>` : ''}
+                    </div>
+                </div>
+                <div class="note-actions">
+                    <button class="btn-secondary btn-changes">Show Changes</button>
+                    <button class="btn-secondary btn-refresh">Refresh Now</button>
+                    <button class="btn-delete">Delete</button>
+                </div>
+                <ul class="saved-search-changes"></ul>
+            `;
+
+            card.querySelector('.btn-changes').addEventListener('click', function () {
+                loadChanges(search, card.querySelector('.saved-search-changes'));
+            });
+            card.querySelector('.btn-refresh').addEventListener('click', function () {
+                fetch(`/api/saved-searches/${search.id}/refresh`, { method: 'POST' })
+                    .then(() => alert('Refresh queued - changes will show up shortly.'));
+            });
+            card.querySelector('.btn-delete').addEventListener('click', function () {
+                if (confirm('Delete this saved search?')) {
+                    fetch(`/api/saved-searches/${search.id}`, { method: 'DELETE' })
+                        .then(() => loadSavedSearches());
+                }
+            });
+
+            savedContainer.appendChild(card);
+        });
+    }
+
+    // Changes not checked yet; checking them clears the "new" badge
+    function loadChanges(search, list) {
+        fetch(`/api/saved-searches/${search.id}/changes`)
+            .then(res => res.json())
+            .then(response => {
+                if (!response.success) return;
+                list.innerHTML = '';
+                if (response.changes.length === 0) {
+                    list.innerHTML = '<li>No changes since you last checked.</li>';
+                    return;
+                }
+                response.changes.forEach(change => {
+                    const item = document.createElement('li');
+                    item.className = `change-${change.kind}`;
+                    let text;
+                    if (change.kind === 'new') {
+                        text = `🆕 ${change.title} - ${formatCents(change.new_price_cents)}`;
+                    } else if (change.kind === 'price') {
+                        text = `💲 ${change.title}: ${formatCents(change.old_price_cents)} → ${formatCents(change.new_price_cents)}`;
+                    } else {
+                        text = `❌ ${change.title} (no longer listed)`;
+                    }
+                    item.innerHTML = `<a href="${change.url}" target="_blank">${text}</a>`;
+                    list.appendChild(item);
+                });
+                const badge = list.parentElement.querySelector('.unseen-badge');
+                if (badge) badge.remove();
+            })
+            .catch(error => {
+                console.error('Error loading changes:', error);
+            });
+    }
 });
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+from scraper import base_scraper
+from scraper.base_scraper import CarListing
+from search_coordinator import SearchCoordinator
+
+
+def make_listing(**kwargs):
+    fields = {'title': '2018 Honda Civic', 'price': '$15,500', 'location': 'Austin',
+              'url': 'https://example.com/1', 'source': 'Test', 'year': '2018'}
+    fields.update(kwargs)
+    return CarListing(**fields)
+
+
+class CarListingTestCase(unittest.TestCase):
+    def test_numeric_fields_parsed_once(self):
+        listing = make_listing(mileage='42,000 mi.')
+        self.assertEqual(listing.price_cents, 1550000)
+        self.assertEqual(listing.year_int, 2018)
+        self.assertEqual(listing.mileage_int, 42000)
+
+    def test_display_strings_unchanged(self):
+        for price in ('$15,500', 'N/A', '15500 obo', '$1,234.50', ''):
+            self.assertEqual(make_listing(price=price).price, price)
+        self.assertEqual(make_listing(mileage='85k miles').mileage_int, 85000)
+        self.assertEqual(make_listing(mileage='85k miles').mileage, '85k miles')
+
+    def test_round_trip_and_numeric_construction(self):
+        listing = make_listing(mileage='42,000 mi.')
+        self.assertEqual(CarListing.from_dict(listing.to_dict()).to_dict(), listing.to_dict())
+        built = CarListing('Civic', None, 'Austin', 'u', 'Test', price_cents=990000, year_int=2016)
+        self.assertEqual((built.price, built.year), ('$9,900', '2016'))
+        with self.assertRaises(AttributeError):
+            listing.extra = 1
+
+    def test_from_dict_reuses_typed_fields(self):
+        data = make_listing(price='Call', mileage='42,000 mi.').to_dict()
+        self.assertEqual((data['price_cents'], data['year_int'], data['mileage_int']), (None, 2018, 42000))
+        with mock.patch.object(base_scraper, 'parse_price_cents') as parse_price, \
+                mock.patch.object(base_scraper, 'parse_mileage') as parse_mileage:
+            listing = CarListing.from_dict(data)
+        parse_price.assert_not_called()
+        parse_mileage.assert_not_called()
+        self.assertEqual(listing.to_dict(), data)
+
+        # Dicts stored before the typed fields were added are still parsed
+        for name in ('price_cents', 'year_int', 'mileage_int'):
+            del data[name]
+        self.assertEqual(CarListing.from_dict(data).mileage_int, 42000)
+
+    def test_filter_compares_numbers_and_keeps_unknowns(self):
+        listings = [make_listing(price='$9,000', year='2012'),
+                    make_listing(price='$15,500', year='2018'),
+                    make_listing(price='Call', year='')]
+        coordinator = SearchCoordinator(cache=None)
+        kept = coordinator.filter_listings(listings, year_min=2015, price_max=20000)
+        self.assertEqual([l.price for l in kept], ['$15,500', 'Call'])
+
+
+if __name__ == '__main__':
+    unittest.main()
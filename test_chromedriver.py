@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+import os
+import sys
+import tempfile
+import types
+from scraper import chromedriver
+from scraper.driver_pool import DriverPool
+
+
+class StubManager:
+    """Stands in for webdriver_manager's ChromeDriverManager"""
+
+    result = '/cache/chromedriver'
+    installs = 0
+
+    def install(self):
+        StubManager.installs += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class ResolveChromedriverTestCase(unittest.TestCase):
+    def setUp(self):
+        chromedriver.reset_chromedriver_cache()
+        StubManager.result = '/cache/chromedriver'
+        StubManager.installs = 0
+        package = types.ModuleType('webdriver_manager')
+        module = types.ModuleType('webdriver_manager.chrome')
+        module.ChromeDriverManager = StubManager
+        package.chrome = module
+        patches = [
+            mock.patch.dict(sys.modules, {'webdriver_manager': package, 'webdriver_manager.chrome': module}),
+            mock.patch.dict(os.environ),
+            mock.patch.object(chromedriver.shutil, 'which', return_value=None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        os.environ.pop('CHROMEDRIVER_PATH', None)
+        os.environ.pop('CHROMEDRIVER_OFFLINE', None)
+        self.addCleanup(chromedriver.reset_chromedriver_cache)
+
+    def test_resolved_once(self):
+        self.assertEqual(chromedriver.resolve_chromedriver_path(), '/cache/chromedriver')
+        self.assertEqual(chromedriver.resolve_chromedriver_path(), '/cache/chromedriver')
+        self.assertEqual(StubManager.installs, 1)
+
+        chromedriver.reset_chromedriver_cache()
+        chromedriver.resolve_chromedriver_path()
+        self.assertEqual(StubManager.installs, 2)
+
+    def test_pinned_path(self):
+        with tempfile.NamedTemporaryFile() as binary:
+            os.environ['CHROMEDRIVER_PATH'] = binary.name
+            self.assertEqual(chromedriver.resolve_chromedriver_path(), binary.name)
+        self.assertEqual(StubManager.installs, 0)
+
+    def test_missing_pinned_path_falls_back(self):
+        os.environ['CHROMEDRIVER_PATH'] = '/nonexistent/chromedriver'
+        self.assertEqual(chromedriver.resolve_chromedriver_path(), '/cache/chromedriver')
+
+    def test_offline_uses_path(self):
+        os.environ['CHROMEDRIVER_OFFLINE'] = '1'
+        chromedriver.shutil.which.return_value = '/usr/bin/chromedriver'
+        self.assertEqual(chromedriver.resolve_chromedriver_path(), '/usr/bin/chromedriver')
+        self.assertEqual(StubManager.installs, 0)
+
+    def test_failed_lookup_is_retried_later(self):
+        StubManager.result = RuntimeError('no network')
+        with mock.patch.object(chromedriver.time, 'monotonic', return_value=1000.0):
+            self.assertIsNone(chromedriver.resolve_chromedriver_path())
+            self.assertIsNone(chromedriver.chrome_service())
+        self.assertEqual(StubManager.installs, 1)
+
+        StubManager.result = '/cache/chromedriver'
+        retry_at = 1000.0 + chromedriver.RETRY_AFTER_SECONDS
+        with mock.patch.object(chromedriver.time, 'monotonic', return_value=retry_at - 1):
+            self.assertIsNone(chromedriver.resolve_chromedriver_path())
+        with mock.patch.object(chromedriver.time, 'monotonic', return_value=retry_at):
+            self.assertEqual(chromedriver.resolve_chromedriver_path(), '/cache/chromedriver')
+        self.assertEqual(StubManager.installs, 2)
+
+
+class StartDriverTestCase(unittest.TestCase):
+    def test_broken_binary_falls_back_to_path(self):
+        calls = []
+
+        def chrome(service=None, options=None):
+            calls.append(service)
+            if service is not None:
+                raise OSError('exec format error')
+            return 'driver'
+
+        with mock.patch('scraper.driver_pool.chrome_service', return_value=mock.Mock(path='/bad')), \
+                mock.patch('scraper.driver_pool.reset_chromedriver_cache') as reset, \
+                mock.patch('scraper.driver_pool.webdriver.Chrome', side_effect=chrome):
+            self.assertEqual(DriverPool()._start_driver(), 'driver')
+        self.assertEqual(len(calls), 2)
+        self.assertIsNone(calls[1])
+        reset.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
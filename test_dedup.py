@@ -0,0 +1,95 @@
+import unittest
+import random
+from scraper.base_scraper import CarListing
+from dedup import DuplicateIndex, dedupe_listings, make_model_key
+
+
+def make_listing(url, title, price='N/A', year='', mileage='', source='Craigslist', image_url=''):
+    return CarListing(title=title, price=price, location='NJ', url=url, source=source,
+                      year=year, mileage=mileage, image_url=image_url)
+
+
+class DedupTestCase(unittest.TestCase):
+    def test_cross_source_copies_collapse_to_most_complete(self):
+        listings = [
+            make_listing('http://cl/1', '2015 Honda Civic EX', '$10,500', '2015', '61k'),
+            make_listing('http://cars/9', 'Used 2015 Honda Civic EX Sedan', '$10,500', '2015',
+                         '61,000 mi.', source='Cars.com', image_url='http://img/9.jpg'),
+            make_listing('http://cl/2', '2015 Honda Civic EX', '$10,500', '2015'),
+            make_listing('http://cl/3', '2018 Toyota Camry SE', '$17,900', '2018'),
+        ]
+        result, stats = dedupe_listings(listings)
+        self.assertEqual([l.url for l in result], ['http://cars/9', 'http://cl/3'])
+        self.assertEqual(result[0].alternate_urls, ('http://cl/1', 'http://cl/2'))
+        self.assertEqual(result[0].to_dict()['alternate_urls'], ['http://cl/1', 'http://cl/2'])
+        self.assertEqual(stats, {'input': 4, 'output': 2, 'ratio': 0.5})
+        # The caller's listings (possibly cached) are left as they were
+        self.assertEqual(listings[1].alternate_urls, ())
+        self.assertIsNot(result[0], listings[1])
+        self.assertIs(result[1], listings[3])
+
+    def test_key_match_needs_mileage_or_similar_text(self):
+        listings = [
+            make_listing('http://cl/1', '2015 Honda Civic EX', '$10,000', '2015'),
+            make_listing('http://cl/2', '2015 Honda Civic LX coupe, manual, one owner', '$10,000', '2015'),
+        ]
+        result, _ = dedupe_listings(listings)
+        self.assertEqual(len(result), 2)
+
+        listings[1].mileage_int = 80000
+        listings[0].mileage_int = 80200
+        result, _ = dedupe_listings(listings)
+        self.assertEqual(len(result), 1)
+
+    def test_reposts_with_reworded_titles_merge(self):
+        listings = [
+            make_listing('http://cl/1', '2012 Ford F-150 XLT 4x4 crew cab', '$14,000', mileage='98,000'),
+            make_listing('http://cl/2', '2012 Ford F150 XLT 4x4 crew cab!!', '$14,000', mileage='98,000'),
+        ]
+        result, _ = dedupe_listings(listings)
+        self.assertEqual(len(result), 1)
+
+    def test_conflicting_numbers_keep_listings_apart(self):
+        listings = [
+            make_listing('http://cl/1', '2015 Honda Civic EX', '$10,500', '2015'),
+            make_listing('http://cl/2', '2015 Honda Civic EX', '$13,900', '2015'),
+            make_listing('http://cl/3', '2016 Honda Civic EX', '$10,500', '2016'),
+            # Same title but nothing to corroborate it
+            make_listing('http://cl/4', '2015 Honda Civic EX'),
+        ]
+        result, stats = dedupe_listings(listings)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(stats['ratio'], 0.0)
+
+    def test_same_url_is_always_a_duplicate(self):
+        index = DuplicateIndex()
+        first = index.add(make_listing('http://cl/1', 'Car'))
+        second = index.add(make_listing('http://cl/1', 'Different text'))
+        self.assertEqual(index.find(second), first)
+
+    def test_missing_urls_are_not_a_match(self):
+        listings = [
+            make_listing('', '2015 Honda Civic EX', '$10,500', '2015'),
+            make_listing('', '2018 Ford F-150 XLT', '$27,000', '2018'),
+        ]
+        result, stats = dedupe_listings(listings)
+        self.assertEqual(len(result), 2)
+        self.assertEqual(stats['ratio'], 0.0)
+
+    def test_make_model_key_skips_years_and_filler(self):
+        self.assertEqual(make_model_key('Used 2015 Honda Civic EX'), ('honda', 'civic'))
+
+    def test_large_distinct_set_stays_distinct(self):
+        rng = random.Random(7)
+        makes = ['Honda Civic', 'Toyota Camry', 'Ford Focus', 'Mazda 3', 'Subaru Outback']
+        listings = [
+            make_listing(f'http://cl/{i}', f'{rng.randint(2000, 2023)} {rng.choice(makes)} #{i}',
+                         f'${rng.randint(2000, 40000):,}', mileage=f'{rng.randint(1, 200000):,}')
+            for i in range(2000)
+        ]
+        result, _ = dedupe_listings(listings)
+        self.assertGreater(len(result), 1950)
+
+
+if __name__ == '__main__':
+    unittest.main()
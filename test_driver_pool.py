@@ -0,0 +1,156 @@
+import unittest
+from unittest import mock
+import threading
+from scraper import driver_pool
+from scraper.driver_pool import DriverPool
+
+
+class FakeDriver:
+    """Stands in for webdriver.Chrome: counts quits and can be made unresponsive"""
+
+    def __init__(self, pid=1234):
+        self.quit_count = 0
+        self.healthy = True
+        self.service = mock.Mock()
+        self.service.process.pid = pid
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise RuntimeError('browser is gone')
+        return 1
+
+    def quit(self):
+        self.quit_count += 1
+
+
+class FakeDriverPool(DriverPool):
+    """A DriverPool that starts FakeDrivers instead of Chrome"""
+
+    def __init__(self, *args, fail_start=False, **kwargs):
+        kwargs.setdefault('max_rss_mb', 0)
+        super().__init__(*args, **kwargs)
+        self.fail_start = fail_start
+        self.started = []
+
+    def _start_driver(self):
+        if self.fail_start:
+            return None
+        driver = FakeDriver()
+        self.started.append(driver)
+        return driver
+
+
+class DriverPoolTestCase(unittest.TestCase):
+    def test_acquire_and_release_reuse_drivers(self):
+        pool = FakeDriverPool(size=2)
+        driver = pool.acquire()
+        self.assertEqual(pool.stats(), {'size': 2, 'live': 1, 'idle': 0, 'in_use': 1})
+        pool.release(driver)
+        self.assertEqual(pool.stats(), {'size': 2, 'live': 1, 'idle': 1, 'in_use': 0})
+        self.assertIs(pool.acquire(), driver)
+        self.assertEqual(len(pool.started), 1)
+
+    def test_acquire_waits_for_a_free_driver(self):
+        pool = FakeDriverPool(size=1)
+        driver = pool.acquire()
+        self.assertIsNone(pool.acquire(timeout=0.05))
+
+        threading.Timer(0.05, pool.release, args=(driver,)).start()
+        self.assertIs(pool.acquire(timeout=5), driver)
+
+    def test_failed_start_frees_the_slot(self):
+        pool = FakeDriverPool(size=1, fail_start=True)
+        self.assertIsNone(pool.acquire())
+        self.assertEqual(pool.stats()['live'], 0)
+        pool.fail_start = False
+        self.assertIsNotNone(pool.acquire(timeout=0.05))
+
+    def test_recycled_after_max_pages(self):
+        pool = FakeDriverPool(size=1, max_pages=3)
+        driver = pool.acquire()
+        pool.release(driver, pages=2)
+        self.assertIs(pool.acquire(), driver)
+        pool.release(driver, pages=1)
+        self.assertEqual(driver.quit_count, 1)
+        self.assertEqual(pool.stats()['live'], 0)
+
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, driver)
+        # The new driver starts counting from zero
+        pool.release(fresh, pages=2)
+        self.assertEqual(fresh.quit_count, 0)
+
+    def test_recycled_over_memory_limit(self):
+        pool = FakeDriverPool(size=1, max_rss_mb=1024)
+        driver = pool.acquire()
+        with mock.patch.object(driver_pool, '_process_tree_rss_mb', return_value=2048.0) as rss:
+            pool.release(driver)
+        rss.assert_called_once_with(1234)
+        self.assertEqual(driver.quit_count, 1)
+
+        driver = pool.acquire()
+        with mock.patch.object(driver_pool, '_process_tree_rss_mb', return_value=512.0):
+            pool.release(driver)
+        self.assertEqual(driver.quit_count, 0)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_unhealthy_idle_driver_is_replaced(self):
+        pool = FakeDriverPool(size=1)
+        driver = pool.acquire()
+        pool.release(driver)
+        driver.healthy = False
+
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, driver)
+        self.assertEqual(driver.quit_count, 1)
+        self.assertEqual(pool.stats()['live'], 1)
+
+    def test_shutdown(self):
+        pool = FakeDriverPool(size=2)
+        idle, busy = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.shutdown()
+        self.assertEqual(idle.quit_count, 1)
+        self.assertEqual(busy.quit_count, 0)
+        self.assertIsNone(pool.acquire())
+
+        # Drivers checked out during shutdown are quit when they come back
+        pool.release(busy)
+        self.assertEqual(busy.quit_count, 1)
+        self.assertEqual(pool.stats()['live'], 0)
+
+
+class ProcessPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.original = driver_pool._pool
+
+    def tearDown(self):
+        driver_pool._pool = self.original
+
+    def test_shutdown_at_exit(self):
+        pool = FakeDriverPool()
+        driver = pool.acquire()
+        pool.release(driver)
+        driver_pool._pool = pool
+        driver_pool.shutdown_driver_pool()
+        self.assertEqual(driver.quit_count, 1)
+        self.assertIsNone(driver_pool._pool)
+        # Safe to call again, e.g. from atexit after an explicit shutdown
+        driver_pool.shutdown_driver_pool()
+        self.assertEqual(driver.quit_count, 1)
+
+    def test_forked_worker_starts_its_own_pool(self):
+        pool = FakeDriverPool()
+        driver = pool.acquire()
+        pool.release(driver)
+        driver_pool._pool = pool
+        driver_pool._reset_after_fork()
+        # The parent's browsers are left alone
+        self.assertIsNone(driver_pool._pool)
+        self.assertEqual(driver.quit_count, 0)
+        with mock.patch.dict('os.environ', {'DRIVER_POOL_SIZE': '5'}):
+            self.assertEqual(driver_pool.get_driver_pool().size, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
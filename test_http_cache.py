@@ -0,0 +1,82 @@
+import unittest
+import shutil
+import tempfile
+from scraper.http_cache import HTTPCache
+from scraper.craigslist_scraper import CraigslistScraper
+
+PAGE = b'<html><body><li class="cl-search-result">2015 Toyota Camry</li></body></html>'
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode('utf-8')
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f'HTTP {self.status_code}')
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.headers = {}
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+class HTTPCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = HTTPCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def make_scraper(self, responses):
+        scraper = CraigslistScraper(use_selenium=False)
+        scraper.http_cache = self.cache
+        scraper.cache_max_age = None
+        scraper.session = FakeSession(responses)
+        return scraper
+
+    def test_revalidates_with_etag_and_serves_304_from_disk(self):
+        scraper = self.make_scraper([
+            FakeResponse(200, PAGE, {'ETag': '"v1"'}),
+            FakeResponse(304),
+        ])
+        first = scraper.get_page('http://example.com/search', {'query': 'toyota'})
+        second = scraper.get_page('http://example.com/search', {'query': 'toyota'})
+
+        self.assertEqual(first.get_text(), second.get_text())
+        url, headers = scraper.session.requests[1]
+        self.assertEqual(url, 'http://example.com/search?query=toyota')
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+
+    def test_fresh_entry_skips_network(self):
+        scraper = self.make_scraper([FakeResponse(200, PAGE, {'Cache-Control': 'max-age=60'})])
+        scraper.get_page('http://example.com/search')
+        soup = scraper.get_page('http://example.com/search')
+
+        self.assertEqual(len(scraper.session.requests), 1)
+        self.assertIn('Camry', soup.get_text())
+
+    def test_no_store_is_not_cached(self):
+        self.cache.store('http://example.com/a', FakeResponse(200, PAGE, {'Cache-Control': 'no-store'}))
+        self.assertIsNone(self.cache.get('http://example.com/a'))
+
+    def test_eviction_keeps_cache_under_size(self):
+        cache = HTTPCache(self.directory, max_bytes=len(PAGE) * 2)
+        for i in range(4):
+            cache.store(f'http://example.com/{i}', FakeResponse(200, PAGE))
+        self.assertIsNone(cache.get('http://example.com/0'))
+        self.assertIsNotNone(cache.get('http://example.com/3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
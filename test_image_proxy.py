@@ -0,0 +1,182 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+import app as app_module
+from app import app, init_db
+from db import close_connections, get_connection
+from image_proxy import Image, ImageProxy, THUMBNAIL_SIZE, make_thumbnail, proxy_images, image_key
+import io
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 2000
+
+
+class FakeFetch:
+    """Serves a fixed image body, slowly, and counts the downloads"""
+
+    def __init__(self, body=JPEG):
+        self.body = body
+        self.calls = []
+
+    def __call__(self, url):
+        self.calls.append(url)
+        time.sleep(0.05)
+        return (self.body, 'image/jpeg') if self.body is not None else None
+
+
+class ImageProxyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fetch = FakeFetch()
+        self.proxy = ImageProxy(self.directory, fetch=self.fetch)
+
+    def tearDown(self):
+        close_connections()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_proxy_images_rewrites_remote_urls_only(self):
+        items = [{'image_url': 'https://images.example.com/1.jpg'}, {'image_url': ''},
+                 {'image_url': '/img/abc'}]
+        proxy_images(self.proxy, items)
+        self.assertEqual([i['image_url'] for i in items],
+                         ['/img/' + image_key('https://images.example.com/1.jpg'), '', '/img/abc'])
+        self.assertEqual(proxy_images(None, [{'image_url': 'http://x'}]), [{'image_url': 'http://x'}])
+
+    def test_concurrent_requests_fetch_once(self):
+        key = self.proxy.register(['https://images.example.com/1.jpg'])['https://images.example.com/1.jpg']
+        found = []
+        threads = [threading.Thread(target=lambda: found.append(self.proxy.get(key))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.fetch.calls), 1)
+        self.assertEqual({f[1] for f in found}, {'image/jpeg'})
+        self.assertIsNone(self.proxy.get(image_key('https://unregistered.example.com/x.jpg')))
+
+    def test_fetch_lock_outlives_the_first_request(self):
+        release = threading.Event()
+        self.proxy.fetch = lambda url: release.wait(5) and (JPEG, 'image/jpeg')
+        key = self.proxy.register(['https://images.example.com/1.jpg'])['https://images.example.com/1.jpg']
+        threads = [threading.Thread(target=self.proxy.get, args=(key,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.proxy._fetching.get(key, [None, 0])[1] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Both requests share one lock, kept until the last of them is done
+        self.assertEqual(self.proxy._fetching[key][1], 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertNotIn(key, self.proxy._fetching)
+
+    def test_unused_images_are_pruned(self):
+        old, recent = 'https://images.example.com/old.jpg', 'https://images.example.com/recent.jpg'
+        keys = self.proxy.register([old, recent])
+        for key in keys.values():
+            self.proxy.get(key)
+        db = get_connection(self.proxy.db_path)
+        with db:
+            db.execute('UPDATE image_sources SET registered_at = ? WHERE key = ?',
+                       (time.time() - 7200, keys[old]))
+
+        self.assertEqual(self.proxy.prune(3600), 1)
+        self.assertIsNone(self.proxy.source_url(keys[old]))
+        self.assertFalse(os.path.exists(self.proxy._path(keys[old])))
+        self.assertEqual(self.proxy.source_url(keys[recent]), recent)
+
+        # Handed out again, it can be proxied again
+        self.proxy.register([old])
+        self.assertIsNotNone(self.proxy.get(keys[old]))
+
+    def test_least_recently_used_thumbnails_are_evicted(self):
+        self.proxy.max_bytes = len(JPEG) * 2
+        keys = self.proxy.register([f'https://images.example.com/{n}.jpg' for n in range(3)])
+        for n, key in enumerate(keys.values()):
+            self.proxy.get(key)
+            os.utime(self.proxy._path(key), (n, n))
+        first = list(keys.values())[0]
+        self.proxy._evict()
+        self.assertFalse(os.path.exists(self.proxy._path(first)))
+
+        # Evicted images are fetched again from the remembered URL
+        self.assertIsNotNone(self.proxy.get(first))
+        self.assertEqual(len(self.fetch.calls), 4)
+
+    def test_failed_fetch_is_not_retried_at_once(self):
+        self.fetch.body = None
+        key = self.proxy.register(['https://images.example.com/gone.jpg'])['https://images.example.com/gone.jpg']
+        self.assertIsNone(self.proxy.get(key))
+        self.assertIsNone(self.proxy.get(key))
+        self.assertEqual(len(self.fetch.calls), 1)
+
+    @unittest.skipUnless(Image, 'Pillow is not installed')
+    def test_thumbnails_are_shrunk(self):
+        out = io.BytesIO()
+        Image.new('RGB', (2000, 1500), 'red').save(out, 'PNG')
+        body, content_type = make_thumbnail(out.getvalue(), 'image/png')
+        with Image.open(io.BytesIO(body)) as image:
+            self.assertLessEqual(image.size, THUMBNAIL_SIZE)
+        self.assertIn(content_type, ('image/webp', 'image/jpeg'))
+
+
+class ImageRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.directory = tempfile.mkdtemp()
+        self.fetch = FakeFetch()
+        self.original_proxy = app_module.image_proxy
+        app_module.image_proxy = ImageProxy(self.directory, fetch=self.fetch)
+        self.original_database = app.config['DATABASE']
+        app.config['DATABASE'] = os.path.join(self.directory, 'notes.db')
+        init_db()
+
+    def tearDown(self):
+        app_module.image_proxy = self.original_proxy
+        app.config['DATABASE'] = self.original_database
+        close_connections()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_serves_thumbnail_with_long_cache_headers(self):
+        url = 'https://images.example.com/1.jpg'
+        key = app_module.image_proxy.register([url])[url]
+        rv = self.app.get(f'/img/{key}')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.data, JPEG)
+        self.assertIn('immutable', rv.headers['Cache-Control'])
+        self.assertEqual(self.app.get(f'/img/{key}', headers={'If-None-Match': rv.headers['ETag']}).status_code, 304)
+
+        self.assertEqual(self.app.get('/img/' + image_key('https://elsewhere.example.com/')).status_code, 404)
+        self.assertEqual(self.app.get('/img/not-a-key').status_code, 404)
+
+    def test_noted_image_survives_prune(self):
+        proxy = app_module.image_proxy
+        url = 'https://images.example.com/noted.jpg'
+        key = proxy.register([url])[url]
+        # The page saves the proxied URL it was showing
+        self.app.post('/api/notes', json={'url': 'http://example.com/car1', 'note': 'Nice',
+                                          'image_url': f'/img/{key}'})
+        db = get_connection(proxy.db_path)
+        with db:
+            db.execute('UPDATE image_sources SET registered_at = ?', (time.time() - 7200,))
+        proxy.prune(3600)
+        self.assertIsNone(proxy.source_url(key))
+
+        note, = self.app.get('/api/notes').get_json()['notes']
+        self.assertEqual(note['image_url'], f'/img/{key}')
+        self.assertEqual(self.app.get(f'/img/{key}').status_code, 200)
+
+    def test_falls_back_to_original_url(self):
+        self.fetch.body = None
+        url = 'https://images.example.com/gone.jpg'
+        key = app_module.image_proxy.register([url])[url]
+        rv = self.app.get(f'/img/{key}')
+        self.assertEqual((rv.status_code, rv.headers['Location']), (302, url))
+
+
+if __name__ == '__main__':
+    unittest.main()
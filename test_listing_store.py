@@ -0,0 +1,128 @@
+import unittest
+import os
+import tempfile
+from scraper.base_scraper import CarListing, SeenListings
+from listing_store import ListingStore
+from search_coordinator import SearchCoordinator
+
+
+def make_listing(n, price='$10,000', year='2015', title='Toyota Camry', source='Craigslist'):
+    return CarListing(title=f'{year} {title}', price=price, location='Austin',
+                      url=f'http://example.com/{n}', source=source, year=year)
+
+
+class ListingStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.store = ListingStore(self.path)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+    def test_upsert_keeps_first_seen(self):
+        self.store.upsert({'Toyota': [make_listing(1)]}, 'Austin, TX', seen_at=100.0)
+        self.store.upsert({'Toyota': [make_listing(1, price='$9,500')]}, 'Austin, TX', seen_at=200.0)
+
+        rows = self.store.search(['toyota'], location='austin,  tx')
+        self.assertEqual(len(rows), 1)
+        listing, first_seen, last_seen = rows[0]
+        self.assertEqual((listing.price, first_seen, last_seen), ('$9,500', 100.0, 200.0))
+        self.assertEqual(self.store.first_seen(['http://example.com/1', 'http://nope']),
+                         {'http://example.com/1': 100.0})
+
+    def test_search_filters(self):
+        self.store.upsert({'Toyota': [make_listing(1, '$10,000', '2015'),
+                                      make_listing(2, '$25,000', '2020'),
+                                      make_listing(3, 'Call', '2019'),
+                                      make_listing(4, '$12,000', '2018', 'Toyota Corolla')],
+                           'Honda': [make_listing(5, title='Honda Civic')]}, 'Austin')
+
+        def urls(**filters):
+            return sorted(l.url[-1] for l, _, _ in self.store.search(['Toyota'], **filters))
+
+        self.assertEqual(urls(), ['1', '2', '3', '4'])
+        self.assertEqual(urls(price_max=20000, year_min=2016), ['3', '4'])
+        self.assertEqual(urls(model='corolla'), ['4'])
+        self.assertEqual(urls(location='Dallas'), [])
+
+    def test_prune(self):
+        self.store.upsert({'Toyota': [make_listing(1)]}, 'Austin', seen_at=1.0)
+        self.assertEqual(self.store.prune(older_than=60), 1)
+        self.assertEqual(self.store.search(['Toyota']), [])
+
+    def test_crawl_marks(self):
+        self.assertEqual(self.store.crawl_mark('Craigslist', 'q'), [])
+        self.store.set_crawl_mark('Craigslist', 'q', ['http://a', 'http://b'])
+        self.store.set_crawl_mark('Craigslist', 'q', ['http://c', 'http://a'])
+        self.assertEqual(self.store.crawl_mark('Craigslist', 'q'), ['http://c', 'http://a'])
+        self.assertEqual(self.store.crawl_mark('Cars.com', 'q'), [])
+
+    def test_writes_prune_after_retention(self):
+        store = ListingStore(self.path, retention=60, prune_interval=3600)
+        store.upsert({'Toyota': [make_listing(1)]}, 'Austin', seen_at=1.0)
+        store.set_crawl_mark('Craigslist', 'q', ['http://a'])
+        # The first write prunes; later ones wait for prune_interval
+        self.assertEqual(store.search(['Toyota']), [])
+        store.upsert({'Toyota': [make_listing(2)]}, 'Austin', seen_at=1.0)
+        self.assertEqual(len(store.search(['Toyota'])), 1)
+        self.assertEqual(store.crawl_mark('Craigslist', 'q'), ['http://a'])
+
+    def test_stored_results_apply_max_results(self):
+        self.store.upsert({'Toyota': [make_listing(n) for n in range(5)]}, 'Austin', seen_at=100.0)
+        self.store.upsert({'Toyota': [make_listing(n + 10, source='Cars.com') for n in range(5)],
+                           'Honda': [make_listing(20, title='Honda Civic')]}, 'Austin', seen_at=200.0)
+        coordinator = SearchCoordinator(store=self.store)
+        results = coordinator.stored_results(['Toyota', 'Honda'], location='Austin', max_results=2)
+        self.assertEqual({source: len(listings) for source, listings in results.items()},
+                         {'Craigslist': 3, 'Cars.com': 2})
+        results = coordinator.stored_results(['Toyota'], location='Austin')
+        self.assertEqual(sum(len(listings) for listings in results.values()), 10)
+
+    def test_incremental_search_tops_up_from_store(self):
+        store = self.store
+
+        class FakeScraper:
+            source_name = 'Craigslist'
+            supports_incremental = True
+            pages = [[make_listing(n) for n in (1, 2, 3)]]
+
+            def search_makes(self, makes, *args, stop_at=None):
+                self.stop_at = stop_at
+                return {make: self.pages.pop(0) for make in makes}
+
+        coordinator = SearchCoordinator(store=store)
+        scraper = FakeScraper()
+        args = (['Toyota'], None, None, None, None, None, 'Austin', 20, False)
+        first = coordinator._search_source(scraper, *args, use_cache=False, incremental=True)
+        self.assertEqual(scraper.stop_at, {'Toyota': set()})
+        self.assertEqual(len(first), 3)
+
+        # The second crawl stops at the known listings; they come from the store
+        scraper.pages = [[make_listing(4)]]
+        second = coordinator._search_source(scraper, *args, use_cache=False, incremental=True)
+        self.assertEqual(scraper.stop_at['Toyota'], {l.url for l in first})
+        self.assertEqual([l.url[-1] for l in second], ['4', '1', '2', '3'])
+        self.assertEqual(coordinator.cache_info['Craigslist']['new'], 1)
+
+
+class SeenListingsTestCase(unittest.TestCase):
+    def test_stops_after_a_run_of_known_urls(self):
+        seen = SeenListings({'a', 'b', 'c', 'd'}, run=3)
+        self.assertTrue(seen.seen('a'))
+        self.assertFalse(seen.seen('new'))
+        self.assertTrue(seen.seen('b') and seen.seen('c'))
+        self.assertFalse(seen.done)
+        seen.seen('d')
+        self.assertTrue(seen.done)
+
+    def test_no_urls_never_done(self):
+        seen = SeenListings()
+        self.assertFalse(seen.seen('a'))
+        self.assertFalse(seen.done)
+
+
+if __name__ == '__main__':
+    unittest.main()
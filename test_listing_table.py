@@ -0,0 +1,53 @@
+import unittest
+from scraper.base_scraper import CarListing
+from listing_table import ListingTable, parse_sort
+
+
+def make_listing(n, price='N/A', year='', mileage='', source='A'):
+    return CarListing(title=f'car {n}', price=price, location='NJ', url=f'http://example.com/{n}',
+                      source=source, year=year, mileage=mileage)
+
+
+class ListingTableTestCase(unittest.TestCase):
+    def setUp(self):
+        self.listings = [
+            make_listing(0, '$9,000', '2012', '120,000 mi', 'A'),
+            make_listing(1, '$15,500', '2018', '40,000 mi', 'B'),
+            make_listing(2, 'Call', '2018', '', 'A'),
+            make_listing(3, '$9,000', '2016', '80,000 mi', 'B'),
+            make_listing(4, '$22,000', '', '15,000 mi', 'C'),
+        ]
+        self.table = ListingTable(self.listings, seen_at={'http://example.com/4': 200.0,
+                                                          'http://example.com/1': 100.0})
+
+    def titles(self, listings):
+        return [int(l.title.split()[-1]) for l in listings]
+
+    def test_filters_keep_missing_values(self):
+        self.assertEqual(self.titles(self.table.query(year_min=2015, price_max=20000)), [1, 2, 3])
+        self.assertEqual(self.titles(self.table.query(mileage_max=50000)), [1, 2, 4])
+        self.assertEqual(self.titles(self.table.query(sources=['B', 'missing'])), [1, 3])
+
+    def test_multi_key_sort_puts_missing_last(self):
+        self.assertEqual(self.titles(self.table.query(sort='price,-year')), [3, 0, 1, 4, 2])
+        self.assertEqual(self.titles(self.table.query(sort='-price')), [4, 1, 0, 3, 2])
+        self.assertEqual(self.titles(self.table.query(sort='-recency')), [4, 1, 0, 2, 3])
+
+    def test_top_k_matches_full_sort(self):
+        for sort in ('price', '-year,mileage', 'mileage', '-recency'):
+            full = self.titles(self.table.query(sort=sort))
+            for limit in range(6):
+                self.assertEqual(self.titles(self.table.query(sort=sort, limit=limit)), full[:limit])
+
+    def test_parse_sort(self):
+        self.assertEqual(parse_sort('price, -year'), [('price', False), ('year', True)])
+        self.assertEqual(parse_sort('relevance'), [])
+        with self.assertRaises(ValueError):
+            parse_sort('color')
+
+    def test_empty_table(self):
+        self.assertEqual(ListingTable([]).query(sort='price', limit=5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import tempfile
+import time
+import requests
+import app as app_module
+from app import app
+from scraper.base_scraper import CarListing
+from scraper.craigslist_scraper import CraigslistScraper
+from scraper.metrics import MetricsRegistry, format_labels, parse_labels
+
+
+def make_listing(n):
+    return CarListing(title=f'2015 Honda Civic #{n}', price='$9,000', location='Austin',
+                      url=f'http://example.com/{n}', source='Test')
+
+
+def series(text):
+    """{'name{labels}': value} of a rendered exposition"""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.metrics = MetricsRegistry(self.path)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+    def test_workers_add_up(self):
+        other = MetricsRegistry(self.path)
+        self.metrics.inc('scraper_requests_total', source='Cars.com', outcome='ok')
+        other.inc('scraper_requests_total', 2, source='Cars.com', outcome='ok')
+        other.inc('http_cache_requests_total', 3, source='Cars.com', result='fresh')
+        other.inc('http_cache_requests_total', source='Cars.com', result='miss')
+        other.flush()
+
+        text = self.metrics.render()
+        self.assertIn('# TYPE scraper_requests_total counter', text)
+        values = series(text)
+        self.assertEqual(values['scraper_requests_total{outcome="ok",source="Cars.com"}'], 3)
+        self.assertEqual(values['http_cache_hit_ratio{source="Cars.com"}'], 0.75)
+
+    def test_ratio_labels_may_hold_commas_and_quotes(self):
+        source = 'Dealer, "Cars" \\ Co'
+        self.metrics.inc('result_cache_requests_total', 3, source=source, result='hit')
+        self.metrics.inc('result_cache_requests_total', source=source, result='miss')
+        self.assertEqual(parse_labels(format_labels({'source': source, 'result': 'hit'})),
+                         {'source': source, 'result': 'hit'})
+
+        values = series(self.metrics.render())
+        self.assertEqual(values[f'result_cache_hit_ratio{{{format_labels({"source": source})}}}'], 0.75)
+        self.assertEqual(len([k for k in values if k.startswith('result_cache_hit_ratio')]), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        self.metrics.observe('scraper_stage_seconds', 0.3, source='Craigslist', stage='parse')
+        self.metrics.observe('scraper_stage_seconds', 7, source='Craigslist', stage='parse')
+        text = self.metrics.render()
+        values = series(text)
+        labels = 'source="Craigslist",stage="parse"'
+        self.assertEqual(values[f'scraper_stage_seconds_bucket{{le="0.25",{labels}}}'], 0)
+        self.assertEqual(values[f'scraper_stage_seconds_bucket{{le="0.5",{labels}}}'], 1)
+        self.assertEqual(values[f'scraper_stage_seconds_bucket{{le="+Inf",{labels}}}'], 2)
+        self.assertEqual(values[f'scraper_stage_seconds_count{{{labels}}}'], 2)
+        self.assertAlmostEqual(values[f'scraper_stage_seconds_sum{{{labels}}}'], 7.3)
+        buckets = [line for line in text.splitlines() if line.startswith('scraper_stage_seconds_bucket')]
+        self.assertTrue(buckets[-1].startswith('scraper_stage_seconds_bucket{le="+Inf"'))
+
+    def test_nested_stages_are_not_counted_twice(self):
+        with self.metrics.timed('scraper_stage_seconds', stage='extract'):
+            with self.metrics.timed('scraper_stage_seconds', stage='page_load'):
+                time.sleep(0.2)
+        values = series(self.metrics.render())
+        self.assertLess(values['scraper_stage_seconds_sum{stage="extract"}'], 0.1)
+        self.assertGreaterEqual(values['scraper_stage_seconds_sum{stage="page_load"}'], 0.2)
+
+    def test_gauges_sum_live_workers(self):
+        self.metrics.set_gauge('driver_pool_drivers', 2, state='in_use')
+        self.metrics.flush()
+        db = self.metrics._connect()
+        db.execute('INSERT INTO metric_gauges VALUES (?, ?, ?, ?, ?)',
+                   ('driver_pool_drivers', 'state="in_use"', -1, 1, time.time()))
+        db.execute('INSERT INTO metric_gauges VALUES (?, ?, ?, ?, ?)',
+                   ('driver_pool_drivers', 'state="in_use"', -2, 5, time.time() - 3600))
+        values = series(self.metrics.render())
+        self.assertEqual(values['driver_pool_drivers{state="in_use"}'], 3)
+
+    def test_page_outcomes(self):
+        scraper = CraigslistScraper(use_selenium=False)
+        scraper.metrics = self.metrics
+
+        def fetch(page):
+            if page == 2:
+                scraper._page_failed(requests.Timeout('slow'))
+                return None
+            return [make_listing(page)] if page == 0 else []
+
+        scraper._collect_pages(fetch, max_results=1, page_size=1)
+        scraper._collect_pages(lambda page: [], max_results=1, page_size=1)
+        scraper._collect_pages(lambda page: fetch(2), max_results=1, page_size=1)
+        values = series(self.metrics.render())
+        for outcome in ('ok', 'empty', 'timeout'):
+            self.assertEqual(values[f'scraper_requests_total{{outcome="{outcome}",source="Craigslist"}}'], 1)
+        self.assertEqual(values['scraper_stage_seconds_count{source="Craigslist",stage="extract"}'], 3)
+
+
+class MetricsEndpointTestCase(unittest.TestCase):
+    def test_metrics_endpoint(self):
+        app.config['TESTING'] = True
+        rv = app.test_client().get('/metrics')
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(rv.content_type.startswith('text/plain'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,34 +3,31 @@ import json
 import os
 import tempfile
 from app import app, init_db, get_db
+from db import close_connections
 
 class NotesTestCase(unittest.TestCase):
     def setUp(self):
+        self.original_database = app.config['DATABASE']
         self.db_fd, app.config['DATABASE'] = tempfile.mkstemp()
         app.config['TESTING'] = True
         self.app = app.test_client()
-        
-        # Override get_db to use the temp database
-        with app.app_context():
-            import sqlite3
-            def get_test_db():
-                db = sqlite3.connect(app.config['DATABASE'])
-                db.row_factory = sqlite3.Row
-                return db
-            
-            # Monkey patch get_db for the test context if needed, 
-            # but since app.py uses a global DATABASE constant for connection,
-            # we might need to rely on the fact that we can't easily change the global DATABASE var
-            # without modifying app.py structure. 
-            # However, app.py uses `sqlite3.connect(DATABASE)`.
-            # Let's try to patch the DATABASE variable in app module.
-            import app as app_module
-            app_module.DATABASE = app.config['DATABASE']
-            app_module.init_db()
+        init_db()
 
     def tearDown(self):
+        close_connections()
         os.close(self.db_fd)
-        os.unlink(app.config['DATABASE'])
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(app.config['DATABASE'] + suffix):
+                os.unlink(app.config['DATABASE'] + suffix)
+        app.config['DATABASE'] = self.original_database
+
+    def test_connection_is_tuned_and_reused(self):
+        with app.app_context():
+            db = get_db()
+            self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(db.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        with app.app_context():
+            self.assertIs(get_db(), db)
 
     def test_empty_notes(self):
         rv = self.app.get('/api/notes')
@@ -94,5 +91,72 @@ class NotesTestCase(unittest.TestCase):
         data = json.loads(rv.data)
         self.assertEqual(len(data['notes']), 0)
 
+    def save(self, n, note='Note'):
+        self.app.post('/api/notes', json={'url': f'http://example.com/car{n}', 'note': f'{note} {n}'})
+
+    def test_lookup_by_url(self):
+        self.save(1)
+        self.save(2)
+        rv = self.app.get('/api/notes?url=http://example.com/car2&url=http://example.com/none')
+        notes = json.loads(rv.data)['notes']
+        self.assertEqual([n['note'] for n in notes], ['Note 2'])
+
+        rv = self.app.post('/api/notes/lookup', json={'urls': ['http://example.com/car1', 'x']})
+        found = json.loads(rv.data)['notes']
+        self.assertEqual(list(found), ['http://example.com/car1'])
+        self.assertEqual(self.app.post('/api/notes/lookup', json={'urls': 'x'}).status_code, 400)
+
+    def test_pagination(self):
+        for n in range(5):
+            self.save(n)
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/notes?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = json.loads(self.app.get(url).data)
+            seen.extend(n['note'] for n in data['notes'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        # Same timestamps fall back to id order, newest first
+        self.assertEqual(seen, [f'Note {n}' for n in range(4, -1, -1)])
+        self.assertEqual(self.app.get('/api/notes?cursor=junk').status_code, 400)
+
+    def test_duplicate_urls_are_merged_on_startup(self):
+        import sqlite3
+        import app as app_module
+        db = sqlite3.connect(app.config['DATABASE'])
+        db.execute('DROP INDEX idx_notes_url')
+        db.execute("INSERT INTO notes (url, note) VALUES ('http://example.com/dup', 'old')")
+        db.execute("INSERT INTO notes (url, note) VALUES ('http://example.com/dup', 'new')")
+        db.commit()
+        db.close()
+
+        app_module.init_db()
+        data = json.loads(self.app.get('/api/notes').data)
+        self.assertEqual([n['note'] for n in data['notes']], ['new'])
+        self.save(3)
+        self.save(3, 'Again')
+        self.assertEqual(len(json.loads(self.app.get('/api/notes').data)['notes']), 2)
+
+    def test_search_results_carry_notes(self):
+        import app as app_module
+        from test_search_api import FakeCoordinator
+        self.app.post('/api/notes', json={'url': 'http://example.com/Cars.com/Honda',
+                                          'note': 'Called the seller, ' + 'x' * 100})
+        original = app_module.SearchCoordinator
+        app_module.SearchCoordinator = FakeCoordinator
+        try:
+            rv = self.app.post('/api/search', json={'make': 'Toyota,Honda', 'location': 'NJ'})
+        finally:
+            app_module.SearchCoordinator = original
+        listings = {l['url']: l for l in json.loads(rv.data)['listings']}
+        noted = listings['http://example.com/Cars.com/Honda']
+        self.assertTrue(noted['has_note'])
+        self.assertTrue(noted['note_preview'].startswith('Called the seller'))
+        self.assertLessEqual(len(noted['note_preview']), app_module.NOTE_PREVIEW_LENGTH)
+        self.assertEqual(sum(l['has_note'] for l in listings.values()), 1)
+        self.assertIsNone(listings['http://example.com/Craigslist/Toyota']['note_preview'])
+
 if __name__ == '__main__':
     unittest.main()
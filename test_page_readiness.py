@@ -0,0 +1,39 @@
+import unittest
+from scraper.page_readiness import ReadinessProfile, wait_until_ready
+
+
+class FakeDriver:
+    """Replays a sequence of probe results, repeating the last one"""
+
+    def __init__(self, probes):
+        self.probes = list(probes)
+
+    def execute_script(self, script, *args):
+        if len(self.probes) > 1:
+            return self.probes.pop(0)
+        return self.probes[0]
+
+
+def probe(cards=0, mutations=0, resources=0, ready=True):
+    return {'cards': cards, 'mutations': mutations, 'resources': resources, 'ready': ready}
+
+
+class PageReadinessTestCase(unittest.TestCase):
+    def setUp(self):
+        self.profile = ReadinessProfile('li', timeout=1, quiet_period=0.05, poll_interval=0.01)
+
+    def test_returns_once_enough_cards(self):
+        driver = FakeDriver([probe(cards=3, mutations=1), probe(cards=20, mutations=5)])
+        self.assertEqual(wait_until_ready(driver, self.profile, 20), 'cards')
+
+    def test_returns_when_page_goes_quiet(self):
+        driver = FakeDriver([probe(cards=1, mutations=1), probe(cards=4, mutations=9), probe(cards=4, mutations=9)])
+        self.assertEqual(wait_until_ready(driver, self.profile, 20), 'quiet')
+
+    def test_keeps_waiting_while_loading(self):
+        driver = FakeDriver([probe(cards=4, mutations=9, ready=False)])
+        self.assertEqual(wait_until_ready(driver, self.profile, 20, timeout=0.1), 'timeout')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import threading
+import urllib.parse
+from scraper.base_scraper import CarListing, SeenListings
+from scraper.cars_com_scraper import CarsComScraper
+from scraper.craigslist_scraper import CraigslistScraper
+
+
+def make_listing(n):
+    return CarListing(title=f'2015 Honda Civic #{n}', price='$9,000', location='Austin',
+                      url=f'http://example.com/{n}', source='Test')
+
+
+def cars_com_page(first, count):
+    cards = ''.join(
+        f'<div class="vehicle-card"><a class="title" href="/vehicledetail/{n}/">2015 Honda Civic</a></div>'
+        for n in range(first, first + count))
+    return f'<html><body>{cards}</body></html>'.encode()
+
+
+class PagedResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class PagedSession:
+    """Cars.com stand-in serving 10 cards per page, 3 pages in total"""
+
+    def __init__(self):
+        self.headers = {}
+        self.pages = []
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        page = int(query.get('page', ['1'])[0])
+        with self.lock:
+            self.pages.append(page)
+        # Past the end the site repeats its last page
+        return PagedResponse(cars_com_page((min(page, 3) - 1) * 10, 10))
+
+
+class CollectPagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.scraper = CraigslistScraper(use_selenium=False)
+        self.requested = []
+
+    def fetch_from(self, pages):
+        def fetch(page):
+            self.requested.append(page)
+            return pages[page] if page < len(pages) else []
+        return fetch
+
+    def test_reads_only_the_pages_it_needs(self):
+        pages = [[make_listing(p * 10 + i) for i in range(10)] for p in range(5)]
+        listings = self.scraper._collect_pages(self.fetch_from(pages), 25, 10)
+        self.assertEqual([l.url for l in listings], [f'http://example.com/{n}' for n in range(25)])
+        self.assertEqual(sorted(self.requested), [0, 1, 2])
+
+    def test_stops_at_an_empty_or_repeated_page(self):
+        first = [make_listing(n) for n in range(10)]
+        listings = self.scraper._collect_pages(self.fetch_from([first, first]), 100, 10,
+                                               concurrency=1)
+        self.assertEqual(len(listings), 10)
+        self.assertEqual(self.requested, [0, 1])
+
+    def test_stops_at_known_listings(self):
+        pages = [[make_listing(n) for n in range(10)], [make_listing(n) for n in range(10, 20)]]
+        seen = SeenListings({f'http://example.com/{n}' for n in range(4, 20)})
+        listings = self.scraper._collect_pages(self.fetch_from(pages), 20, 10, seen, concurrency=1)
+        self.assertEqual([l.url[-1] for l in listings], ['0', '1', '2', '3'])
+        self.assertEqual(self.requested, [0])
+
+    def test_failed_page_ends_the_search(self):
+        pages = [[make_listing(n) for n in range(10)], None]
+        listings = self.scraper._collect_pages(self.fetch_from(pages), 30, 10, concurrency=1)
+        self.assertEqual(len(listings), 10)
+
+
+class ScraperPaginationTestCase(unittest.TestCase):
+    def make_scraper(self):
+        scraper = CarsComScraper(use_selenium=False)
+        scraper.http_cache = None
+        scraper.rate_limiter = None
+        scraper.session = PagedSession()
+        return scraper
+
+    def test_cars_com_reads_later_pages(self):
+        scraper = self.make_scraper()
+        listings = scraper._search_make('Honda', max_results=25)
+        self.assertEqual(len(listings), 25)
+        self.assertEqual(len({l.url for l in listings}), 25)
+        self.assertEqual(sorted(scraper.session.pages)[:2], [1, 2])
+
+    def test_cars_com_stops_at_the_last_page(self):
+        scraper = self.make_scraper()
+        # page_size is capped at 100 but the site only returns 10 per page
+        listings = scraper._search_make('Honda', max_results=200)
+        self.assertEqual(len(listings), 30)
+        self.assertLessEqual(max(scraper.session.pages), scraper.max_pages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from unittest import mock
+from scraper import parsing
+from scraper.cars_com_scraper import CarsComScraper
+from scraper.autotrader_scraper import AutoTraderScraper
+
+CARS_COM_PAGE = b'''<html><head><title>Results</title></head><body>
+<nav><a href="/home">Home</a></nav>
+<div class="vehicle-card">
+  <h2 class="title"><a class="title" href="/vehicledetail/1/">2018 Honda Civic</a></h2>
+  <span class="primary-price">$15,500</span>
+  <div class="dealer-name">Springfield, IL</div>
+  <span class="mileage">42,000 mi.</span>
+  <img src="https://img.example.com/1.jpg">
+</div>
+<div data-qa="vehicle-card"><a class="title" href="/vehicledetail/2/">2012 Ford Focus</a></div>
+</body></html>'''
+
+AUTOTRADER_PAGE = b'''<html><head><title>AutoTrader</title></head><body>
+<div class="page-wrapper">
+  <section><a href="/cars-for-sale/vehicledetails.xhtml?listingId=7">2016 Mazda 3 hatchback</a>
+  <span class="price">$9,900</span></section>
+</div>
+</body></html>'''
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, content):
+        self.headers = {}
+        self.content = content
+
+    def get(self, url, headers=None, timeout=None):
+        return FakeResponse(self.content)
+
+
+def make_scraper(scraper_class, content):
+    scraper = scraper_class(use_selenium=False)
+    scraper.http_cache = None
+    scraper.rate_limiter = None
+    scraper.session = FakeSession(content)
+    return scraper
+
+
+def full_parse(markup, parse_only=None):
+    return parsing.BeautifulSoup(markup, 'lxml')
+
+
+class ParsingTestCase(unittest.TestCase):
+    def search(self, scraper_class, content):
+        scraper = make_scraper(scraper_class, content)
+        return [listing.to_dict() for listing in scraper._search_make('Honda', max_results=10)]
+
+    def assert_same_as_full_parse(self, scraper_class, content, module):
+        strained = self.search(scraper_class, content)
+        with mock.patch(f'{module}.parse_html', full_parse):
+            full = self.search(scraper_class, content)
+        self.assertEqual(strained, full)
+        return strained
+
+    def test_strained_cars_com_parse_matches_full_parse(self):
+        listings = self.assert_same_as_full_parse(CarsComScraper, CARS_COM_PAGE,
+                                                  'scraper.cars_com_scraper')
+        self.assertEqual([l['title'] for l in listings], ['2018 Honda Civic'])
+        self.assertEqual(listings[0]['price'], '$15,500')
+        self.assertEqual(listings[0]['year'], '2018')
+        self.assertEqual(listings[0]['mileage'], '42,000 mi.')
+
+    def test_link_fallback_reparses_full_document(self):
+        listings = self.assert_same_as_full_parse(AutoTraderScraper, AUTOTRADER_PAGE,
+                                                  'scraper.autotrader_scraper')
+        self.assertEqual(len(listings), 1)
+        self.assertEqual(listings[0]['url'],
+                         'https://www.autotrader.com/cars-for-sale/vehicledetails.xhtml?listingId=7')
+
+    def test_strainer_drops_everything_but_cards(self):
+        import re
+        strainer = parsing.card_strainer('div', {'class': re.compile(r'vehicle-card')})
+        soup = parsing.parse_html(CARS_COM_PAGE, strainer)
+        self.assertIsNone(soup.find('nav'))
+        self.assertEqual(len(soup.find_all('div', class_='vehicle-card')), 1)
+
+    def test_block_detection_on_raw_bytes(self):
+        self.assertTrue(parsing.looks_blocked(b'<title>Please complete the CAPTCHA</title>'))
+        self.assertTrue(parsing.looks_blocked(b'Your IP has been Blocked'))
+        self.assertFalse(parsing.looks_blocked(CARS_COM_PAGE))
+
+
+if __name__ == '__main__':
+    unittest.main()
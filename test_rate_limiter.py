@@ -0,0 +1,44 @@
+import unittest
+from unittest import mock
+import os
+import tempfile
+from scraper.rate_limiter import RateLimiter, bucket_key, parse_overrides
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_bucket_key_groups_subdomains(self):
+        self.assertEqual(bucket_key('https://newjersey.craigslist.org/search/cta'), 'craigslist.org')
+        self.assertEqual(bucket_key('www.cars.com'), 'cars.com')
+
+    def test_burst_then_spacing(self):
+        limiter = RateLimiter(self.path)
+        # Freeze the clock so slow disk commits don't refill the bucket mid-test
+        with mock.patch('scraper.rate_limiter.time.time', return_value=1000.0):
+            waits = [limiter.reserve('example.com', rate=10, burst=3) for _ in range(5)]
+        self.assertEqual(waits[:3], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(waits[3], 0.1, places=2)
+        self.assertAlmostEqual(waits[4], 0.2, places=2)
+
+    def test_state_is_shared_between_instances(self):
+        first = RateLimiter(self.path)
+        second = RateLimiter(self.path)
+        first.reserve('example.com', rate=1, burst=1)
+        self.assertGreater(second.reserve('example.com', rate=1, burst=1), 0.9)
+        self.assertEqual(second.reserve('other.com', rate=1, burst=1), 0.0)
+
+    def test_overrides(self):
+        self.assertEqual(parse_overrides('craigslist.org=0.5:2, bad'), {'craigslist.org': (0.5, 2.0)})
+        limiter = RateLimiter(self.path, overrides={'example.com': (1, 1)})
+        limiter.reserve('example.com', rate=100, burst=100)
+        self.assertGreater(limiter.reserve('example.com', rate=100, burst=100), 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
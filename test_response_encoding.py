@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+import json
+import zlib
+from flask import Flask, jsonify
+import response_encoding
+from response_encoding import (FastJSONProvider, columnar, compress_chunks, iter_listings, iter_object,
+                               negotiate_encoding, CHUNK_SIZE)
+
+LISTINGS = [
+    {'title': f'Car {n}', 'price': '$1,000', 'source': 'Craigslist' if n % 2 else 'Cars.com',
+     'location': 'NJ', 'mileage': None}
+    for n in range(CHUNK_SIZE * 2 + 5)
+]
+
+
+class ResponseEncodingTestCase(unittest.TestCase):
+    def test_columnar_interns_repeated_strings(self):
+        packed = columnar(LISTINGS)
+        self.assertEqual(packed['fields'], ['title', 'price', 'source', 'location', 'mileage'])
+        self.assertEqual(packed['interned'], ['source', 'location'])
+        self.assertEqual(packed['strings'], ['Cars.com', 'NJ', 'Craigslist'])
+        decoded = [
+            {name: packed['strings'][value] if name in packed['interned'] else value
+             for name, value in zip(packed['fields'], row)}
+            for row in packed['rows']
+        ]
+        self.assertEqual(decoded, LISTINGS)
+
+    def test_streamed_json_matches_one_shot(self):
+        body = b''.join(iter_object({'total': len(LISTINGS)}, 'listings', iter_listings(LISTINGS)))
+        self.assertEqual(json.loads(body), {'total': len(LISTINGS), 'listings': LISTINGS})
+
+        body = b''.join(iter_object({}, 'listings', iter_listings([], 'columnar')))
+        self.assertEqual(json.loads(body)['listings']['rows'], [])
+
+    @unittest.skipUnless(response_encoding.orjson, 'orjson is not installed')
+    def test_jsonify_goes_through_orjson(self):
+        app = Flask(__name__)
+        app.json = FastJSONProvider(app)
+        orjson = response_encoding.orjson
+        with mock.patch.object(orjson, 'dumps', wraps=orjson.dumps) as dumps, app.app_context():
+            body = jsonify({'total': 1, 'listings': LISTINGS[:1]}).get_data()
+            self.assertEqual(dumps.call_count, 1)
+            self.assertNotIn(b' ', body.replace(b'Car 0', b''))
+            self.assertEqual(json.loads(body)['listings'], LISTINGS[:1])
+
+            # Debug mode pretty-prints, still through orjson
+            app.debug = True
+            body = jsonify({'total': 1}).get_data()
+            self.assertEqual(dumps.call_count, 2)
+            self.assertEqual(body, b'{\n  "total": 1\n}\n')
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(negotiate_encoding('gzip;q=0, identity'))
+        self.assertIsNone(negotiate_encoding(None))
+
+    def test_flushed_chunks_decode_incrementally(self):
+        decompressor = zlib.decompressobj(31)
+        for chunk in compress_chunks([b'{"a":1}\n', b'{"b":2}\n'], 'gzip', flush_each=True):
+            out = decompressor.decompress(chunk)
+            if out:
+                # Each event can be read as soon as it arrives
+                self.assertTrue(out.endswith(b'\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
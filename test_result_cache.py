@@ -0,0 +1,88 @@
+import unittest
+import os
+import tempfile
+import time
+from result_cache import MemoryResultCache, SQLiteResultCache, make_cache_key
+from search_coordinator import SearchCoordinator
+from scraper import CarListing
+
+
+class FakeScraper:
+    source_name = 'Fake'
+
+    def __init__(self):
+        self.searched = []
+
+    def search_makes(self, makes, *args):
+        self.searched.append(list(makes))
+        return {
+            make: [CarListing(title=f'2015 {make}', price='$10,000', location='NJ',
+                              url=f'http://example.com/{make}', source=self.source_name)]
+            for make in makes
+        }
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def test_key_is_normalized(self):
+        self.assertEqual(
+            make_cache_key('Craigslist', ' Toyota ', 'CAMRY', location='New  Jersey'),
+            make_cache_key('Craigslist', 'toyota', 'camry', location='new jersey')
+        )
+        self.assertNotEqual(
+            make_cache_key('Craigslist', 'toyota'),
+            make_cache_key('Cars.com', 'toyota')
+        )
+
+    def test_memory_lru_eviction(self):
+        cache = MemoryResultCache(ttl=60, max_entries=2)
+        cache.set('a', [{'n': 1}])
+        cache.set('b', [{'n': 2}])
+        cache.get('a')
+        cache.set('c', [{'n': 3}])
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_memory_ttl(self):
+        cache = MemoryResultCache(ttl=0.05, max_entries=10)
+        cache.set('a', [{'n': 1}])
+        self.assertEqual(cache.get('a')[0], [{'n': 1}])
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_sqlite_backend(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            cache = SQLiteResultCache(path, ttl=60, max_entries=2)
+            cache.set('a', [{'n': 1}])
+            cache.set('b', [{'n': 2}])
+            cache.get('a')
+            cache.set('c', [{'n': 3}])
+
+            # A second instance sees the same store, as another worker would
+            other = SQLiteResultCache(path, ttl=60, max_entries=2)
+            self.assertEqual(other.get('a')[0], [{'n': 1}])
+            self.assertIsNone(other.get('b'))
+        finally:
+            os.unlink(path)
+
+    def test_coordinator_reuses_per_make_results(self):
+        coordinator = SearchCoordinator(cache=MemoryResultCache())
+        scraper = FakeScraper()
+        coordinator.scrapers = [scraper]
+
+        coordinator.search_all(makes='Toyota,Honda', location='NJ')
+        self.assertEqual(coordinator.cache_info['Fake']['misses'], 2)
+
+        results = coordinator.search_all(makes='Toyota', location='NJ')
+        self.assertEqual(scraper.searched, [['Toyota', 'Honda']])
+        self.assertEqual(coordinator.cache_info['Fake']['hits'], 1)
+        self.assertEqual([l.title for l in results['Fake']], ['2015 Toyota'])
+
+        coordinator.search_all(makes='Toyota', location='NJ', use_cache=False)
+        self.assertEqual(scraper.searched[-1], ['Toyota'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import tempfile
+import time
+from scraper import CarListing
+from result_snapshots import ResultSnapshotStore
+
+
+def make_listing(n, price):
+    return CarListing(title=f'2015 Toyota Camry #{n}', price=price, location='Austin',
+                      url=f'http://example.com/{n}', source='Craigslist', year='2015')
+
+
+class ResultSnapshotStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.store = ResultSnapshotStore(self.path, ttl=60)
+        self.listings = [make_listing(n, f'${price:,}') for n, price in
+                         enumerate([9000, 7000, 8000, 6000, 10000])]
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+    def test_pages_follow_stored_order_or_sort(self):
+        snapshot = self.store.create(self.listings, meta={'sort': None})
+        listings, total, next_offset = snapshot.page(limit=2)
+        self.assertEqual(([l.url[-1] for l in listings], total, next_offset), (['0', '1'], 5, 2))
+
+        seen = []
+        offset = 0
+        while offset is not None:
+            listings, _, offset = snapshot.page(sort='-price', offset=offset, limit=2)
+            seen.extend(l.price for l in listings)
+        self.assertEqual(seen, ['$10,000', '$9,000', '$8,000', '$7,000', '$6,000'])
+
+    def test_snapshot_reloads_from_disk(self):
+        snapshot = self.store.create(self.listings, meta={'summary': {'Craigslist': 5}})
+        reopened = ResultSnapshotStore(self.path).get(snapshot.id)
+        self.assertEqual(reopened.meta, {'summary': {'Craigslist': 5}})
+        self.assertEqual([l.to_dict() for l in reopened.table.listings],
+                         [l.to_dict() for l in self.listings])
+
+    def test_expired_snapshots_are_gone(self):
+        snapshot = self.store.create(self.listings)
+        snapshot.expires_at = time.time() - 1
+        self.assertIsNone(self.store.get(snapshot.id))
+        expired = ResultSnapshotStore(self.path, ttl=-1).create(self.listings)
+        self.assertIsNone(self.store.get(expired.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
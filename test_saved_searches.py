@@ -0,0 +1,189 @@
+import unittest
+from unittest import mock
+import json
+import os
+import tempfile
+import threading
+import app as app_module
+from app import app
+from scraper import CarListing
+from saved_searches import SavedSearchStore, SavedSearchScheduler, query_key
+
+PARAMS = {'makes': ['Toyota'], 'model': None, 'location': 'Austin', 'max_results': 20}
+
+
+def make_listing(n, price='$10,000', source='Craigslist', alternate_urls=None):
+    return CarListing(title=f'2015 Toyota Camry #{n}', price=price, location='Austin',
+                      url=f'http://example.com/{n}', source=source, year='2015',
+                      alternate_urls=alternate_urls)
+
+
+class FakeCoordinator:
+    """Returns the listings of the next scripted run and counts scrapes"""
+
+    runs = []
+    calls = []
+
+    def search_all(self, **params):
+        FakeCoordinator.calls.append(params)
+        run = FakeCoordinator.runs.pop(0)
+        return run if isinstance(run, dict) else {'Craigslist': run}
+
+    def query_listings(self, results, **filters):
+        return [listing for listings in results.values() for listing in listings]
+
+
+class SavedSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.store = SavedSearchStore(self.path)
+        FakeCoordinator.runs = []
+        FakeCoordinator.calls = []
+        self.scheduler = SavedSearchScheduler(self.store, FakeCoordinator)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+    def run_all(self):
+        self.scheduler.run_due(now=float('inf'))
+
+    def test_records_only_changes(self):
+        search = self.store.create('Camry', PARAMS)
+        FakeCoordinator.runs = [[make_listing(1), make_listing(2)],
+                                [make_listing(1, '$9,500'), make_listing(3)]]
+        self.run_all()
+        self.assertEqual([c['kind'] for c in self.store.changes(search['id'])], ['new', 'new'])
+
+        self.store.run_now(search['id'])
+        self.run_all()
+        changes = self.store.changes(search['id'])
+        self.assertEqual(sorted((c['kind'], c['url'][-1]) for c in changes),
+                         [('new', '3'), ('price', '1'), ('removed', '2')])
+        price = next(c for c in changes if c['kind'] == 'price')
+        self.assertEqual((price['old_price_cents'], price['new_price_cents']), (1000000, 950000))
+
+        # Checked changes are no longer unseen
+        self.assertEqual(self.store.changes(search['id']), [])
+        self.assertEqual(self.store.list_all()[0]['unseen'], 0)
+        self.assertEqual(len(self.store.changes(search['id'], since=0)), 5)
+
+    def test_failed_source_is_not_reported_removed(self):
+        search = self.store.create('Camry', PARAMS)
+        FakeCoordinator.runs = [
+            {'Craigslist': [make_listing(1)], 'Cars.com': [make_listing(2, source='Cars.com')]},
+            # Cars.com was blocked or timed out - the coordinator turns that into no listings
+            {'Craigslist': [], 'Cars.com': [make_listing(2, source='Cars.com')]},
+            {'Craigslist': [make_listing(1)], 'Cars.com': [make_listing(2, source='Cars.com')]},
+        ]
+        self.run_all()
+        self.store.changes(search['id'])
+        for _ in range(2):
+            self.store.run_now(search['id'])
+            self.run_all()
+            self.assertEqual(self.store.changes(search['id']), [])
+
+        # Once the site answers without the listing, it is removed
+        FakeCoordinator.runs = [{'Craigslist': [make_listing(3)], 'Cars.com': []}]
+        self.store.run_now(search['id'])
+        self.run_all()
+        self.assertEqual(sorted((c['kind'], c['url'][-1]) for c in self.store.changes(search['id'])),
+                         [('new', '3'), ('removed', '1')])
+
+    def test_listing_matched_on_alternate_urls(self):
+        search = self.store.create('Camry', PARAMS)
+        FakeCoordinator.runs = [
+            [make_listing(1, alternate_urls=['http://example.com/2'])],
+            # Dedup picked the other copy as canonical this time
+            [make_listing(2, '$9,000', alternate_urls=['http://example.com/1'])],
+            [make_listing(9, '$9,000', alternate_urls=['http://example.com/2'])],
+        ]
+        self.run_all()
+        self.store.changes(search['id'])
+        self.store.run_now(search['id'])
+        self.run_all()
+        changes = self.store.changes(search['id'])
+        self.assertEqual([(c['kind'], c['url'][-1]) for c in changes], [('price', '2')])
+
+        self.store.run_now(search['id'])
+        self.run_all()
+        self.assertEqual(self.store.changes(search['id']), [])
+
+    def test_identical_searches_share_one_scrape(self):
+        first = self.store.create('Camry', PARAMS)
+        second = self.store.create('Same', dict(PARAMS, location=' austin', makes=['toyota']))
+        self.assertEqual(query_key(first['params']), query_key(second['params']))
+        FakeCoordinator.runs = [[make_listing(1)]]
+        self.run_all()
+        self.assertEqual(len(FakeCoordinator.calls), 1)
+        self.assertTrue(FakeCoordinator.calls[0]['incremental'])
+        self.assertEqual([s['unseen'] for s in self.store.list_all()], [1, 1])
+
+    def test_claimed_searches_are_not_due_again(self):
+        search = self.store.create('Camry', PARAMS)
+        self.assertEqual(len(self.store.claim_due(now=search['next_run'])), 1)
+        self.assertEqual(self.store.claim_due(now=search['next_run']), [])
+
+    def test_failed_run_is_recorded(self):
+        search = self.store.create('Camry', PARAMS)
+        self.run_all()  # no scripted run - search_all raises
+        saved = self.store.get(search['id'])
+        self.assertIn('IndexError', saved['last_error'])
+        self.assertGreater(saved['next_run'], saved['interval'] * 0.8)
+
+
+class SavedSearchAPITestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.original_store = app_module.saved_searches
+        app_module.saved_searches = SavedSearchStore(self.path)
+
+    def tearDown(self):
+        app_module.saved_searches = self.original_store
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.unlink(self.path + suffix)
+
+    def test_scheduler_only_runs_when_asked(self):
+        # Importing the app starts nothing
+        self.assertNotIn('saved-searches', [t.name for t in threading.enumerate()])
+        with mock.patch.dict(os.environ, {'SAVED_SEARCH_SCHEDULER': '0'}):
+            self.assertIsNone(app_module.start_saved_search_scheduler())
+        with mock.patch.dict(os.environ, {'SAVED_SEARCH_SCHEDULER': '1'}):
+            scheduler = app_module.start_saved_search_scheduler()
+        try:
+            self.assertIs(scheduler.store, app_module.saved_searches)
+        finally:
+            scheduler.stop()
+
+    def test_create_list_and_check(self):
+        rv = self.app.post('/api/saved-searches', json={'make': 'Toyota', 'location': 'Austin',
+                                                        'interval_minutes': 30, 'refresh': True})
+        self.assertEqual(rv.status_code, 201)
+        search = json.loads(rv.data)['search']
+        self.assertEqual((search['name'], search['interval']), ('Toyota', 1800))
+        self.assertNotIn('use_cache', search['params'])
+
+        app_module.saved_searches.record_run(search['id'], [make_listing(1)])
+        listed = json.loads(self.app.get('/api/saved-searches').data)['searches']
+        self.assertEqual(listed[0]['unseen'], 1)
+
+        changes = json.loads(self.app.get(f"/api/saved-searches/{search['id']}/changes").data)['changes']
+        self.assertEqual([c['kind'] for c in changes], ['new'])
+        self.assertEqual(changes[0]['listing']['title'], '2015 Toyota Camry #1')
+
+        self.assertEqual(self.app.delete(f"/api/saved-searches/{search['id']}").status_code, 200)
+        self.assertEqual(self.app.get(f"/api/saved-searches/{search['id']}/changes").status_code, 404)
+
+    def test_create_requires_location(self):
+        rv = self.app.post('/api/saved-searches', json={'make': 'Toyota'})
+        self.assertEqual(rv.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+import json
+import os
+import tempfile
+import zlib
+import app as app_module
+from app import app
+from scraper import CarListing
+from search_coordinator import SearchCoordinator
+from listing_store import ListingStore
+from result_snapshots import ResultSnapshotStore
+
+
+class FakeCoordinator(SearchCoordinator):
+    """Stands in for SearchCoordinator so the API can be tested without scraping"""
+
+    PRICES = {'Craigslist': '$12,000', 'Cars.com': '$8,000'}
+    store = None
+
+    def __init__(self):
+        self.cache_info = {}
+        self.seen_at = {}
+        self.dedup_info = {}
+        self.store_info = {}
+
+    def iter_search(self, makes, **params):
+        for source in ('Craigslist', 'Cars.com'):
+            self.cache_info[source] = {'hits': 0, 'misses': len(makes), 'age': None}
+            yield source, [
+                CarListing(title=f'2015 {make} from {source}', price=self.PRICES[source], location='NJ',
+                           url=f'http://example.com/{source}/{make}', source=source, year='2015')
+                for make in makes
+            ]
+
+    def search_all(self, makes, **params):
+        return dict(self.iter_search(makes, **params))
+
+
+class SearchAPITestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.app = app.test_client()
+        self.original_coordinator = app_module.SearchCoordinator
+        app_module.SearchCoordinator = FakeCoordinator
+        fd, self.snapshot_path = tempfile.mkstemp()
+        os.close(fd)
+        self.original_snapshots = app_module.result_snapshots
+        app_module.result_snapshots = ResultSnapshotStore(self.snapshot_path)
+
+    def tearDown(self):
+        app_module.SearchCoordinator = self.original_coordinator
+        app_module.result_snapshots = self.original_snapshots
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.snapshot_path + suffix):
+                os.unlink(self.snapshot_path + suffix)
+
+    def test_search_requires_location(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota'})
+        self.assertEqual(rv.status_code, 400)
+        self.assertEqual(json.loads(rv.data)['error'], 'Location is required')
+
+    def test_search(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota,Honda', 'location': 'NJ'})
+        data = json.loads(rv.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['summary'], {'Craigslist': 2, 'Cars.com': 2})
+        self.assertEqual(data['dedup'], {'input': 4, 'output': 4, 'ratio': 0.0})
+
+    def test_search_sort_and_limit(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota,Honda', 'location': 'NJ',
+                                                'sort': 'price', 'limit': 3})
+        data = json.loads(rv.data)
+        self.assertEqual(data['total'], 3)
+        self.assertEqual([l['price'] for l in data['listings']], ['$8,000', '$8,000', '$12,000'])
+
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ',
+                                                'sources': ['Craigslist']})
+        self.assertEqual({l['source'] for l in json.loads(rv.data)['listings']}, {'Craigslist'})
+
+    def test_search_rejects_unknown_sort(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ', 'sort': 'color'})
+        self.assertEqual(rv.status_code, 400)
+
+    def test_stream_summary_carries_sorted_listings(self):
+        rv = self.app.post('/api/search/stream', json={'make': 'Toyota', 'location': 'NJ',
+                                                       'sort': '-price'})
+        summary = [json.loads(line) for line in rv.data.decode().splitlines() if line][-1]
+        self.assertEqual([l['source'] for l in summary['listings']], ['Craigslist', 'Cars.com'])
+
+    def test_stream_emits_sources_then_summary(self):
+        rv = self.app.post('/api/search/stream', json={'make': 'Toyota', 'location': 'NJ'})
+        self.assertEqual(rv.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in rv.data.decode().splitlines() if line]
+
+        self.assertEqual([e['type'] for e in events], ['source', 'source', 'summary'])
+        self.assertEqual(events[0]['source'], 'Craigslist')
+        self.assertEqual(events[0]['listings'][0]['title'], '2015 Toyota from Craigslist')
+        self.assertEqual(events[-1]['total'], 2)
+        self.assertEqual(events[-1]['dedup']['ratio'], 0.0)
+
+    def test_results_page_through_snapshot(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota,Honda', 'location': 'NJ',
+                                                'dedupe': False, 'page_size': 3})
+        data = json.loads(rv.data)
+        self.assertEqual((data['total'], len(data['listings']), data['next_cursor']), (4, 3, '3'))
+        snapshot_id = data['snapshot']['id']
+
+        rv = self.app.get(f"/api/results/{snapshot_id}?cursor={data['next_cursor']}&limit=3")
+        page = json.loads(rv.data)
+        self.assertEqual([l['title'] for l in page['listings']], ['2015 Honda from Cars.com'])
+        self.assertIsNone(page['next_cursor'])
+
+        # Re-sorted and narrowed without another search
+        rv = self.app.get(f'/api/results/{snapshot_id}?sort=price&sources=Cars.com')
+        page = json.loads(rv.data)
+        self.assertEqual(page['total'], 2)
+        self.assertEqual({l['source'] for l in page['listings']}, {'Cars.com'})
+        self.assertEqual(page['search']['location'], 'NJ')
+
+        self.assertEqual(self.app.get(f'/api/results/{snapshot_id}?cursor=x').status_code, 400)
+        self.assertEqual(self.app.get('/api/results/nope').status_code, 404)
+
+    def test_stream_summary_carries_first_page(self):
+        rv = self.app.post('/api/search/stream', json={'make': 'Toyota,Honda', 'location': 'NJ',
+                                                       'page_size': 2})
+        summary = [json.loads(line) for line in rv.data.decode().splitlines() if line][-1]
+        self.assertEqual(len(summary['listings']), 2)
+        self.assertEqual(summary['next_cursor'], '2')
+        self.assertEqual(summary['snapshot']['total'], summary['total'])
+
+    def test_search_is_compressed_when_accepted(self):
+        makes = ','.join(f'Make{n}' for n in range(20))
+        rv = self.app.post('/api/search', json={'make': makes, 'location': 'NJ'},
+                           headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(rv.headers['Vary'], 'Accept-Encoding')
+        data = json.loads(zlib.decompress(rv.data, 31))
+        self.assertEqual(data['summary'], {'Craigslist': 20, 'Cars.com': 20})
+        self.assertEqual(len(data['listings']), data['total'])
+
+        # Small bodies aren't worth it
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ', 'limit': 1},
+                           headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', rv.headers)
+        self.assertEqual(json.loads(rv.data)['total'], 1)
+
+    def test_stream_columnar_and_compressed(self):
+        rv = self.app.post('/api/search/stream', json={'make': 'Toyota', 'location': 'NJ',
+                                                       'format': 'columnar'},
+                           headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+        lines = zlib.decompress(rv.data, 31).decode().splitlines()
+        listings = json.loads(lines[0])['listings']
+        self.assertEqual(listings['format'], 'columnar')
+        row = dict(zip(listings['fields'], listings['rows'][0]))
+        self.assertEqual(listings['strings'][row['source']], 'Craigslist')
+
+    def test_search_debug_trace(self):
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ'})
+        self.assertNotIn('trace', json.loads(rv.data))
+
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ', 'debug': True})
+        trace = json.loads(rv.data)['trace']
+        root, = trace['spans']
+        self.assertEqual(root['name'], 'api_search')
+        self.assertEqual([child['name'] for child in root['children']],
+                         ['dedupe', 'query_listings', 'snapshot', 'listing_dicts'])
+        self.assertEqual(trace['totals']['dedupe']['count'], 1)
+
+        rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ', 'debug': 'chrome'})
+        events = json.loads(rv.data)['trace']['traceEvents']
+        self.assertIn('api_search', [e['name'] for e in events if e['ph'] == 'X'])
+
+    def test_search_job(self):
+        rv = self.app.post('/api/search/jobs', json={'make': 'Toyota,Honda', 'location': 'NJ'})
+        self.assertEqual(rv.status_code, 202)
+        job_id = json.loads(rv.data)['job_id']
+
+        job = app_module.search_jobs.get(job_id)
+        job = app_module.search_jobs.wait(job, version=1000, timeout=5)
+        self.assertEqual(job.status, 'done')
+
+        rv = self.app.get(f'/api/search/jobs/{job_id}?since=1')
+        job = json.loads(rv.data)['job']
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['total'], 4)
+        self.assertEqual(len(job['listings']), 3)
+        self.assertEqual(job['summary'], {'Craigslist': 2, 'Cars.com': 2})
+
+    def test_search_from_store_refreshes_in_background(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            FakeCoordinator.store = ListingStore(path)
+            FakeCoordinator.store.upsert({'Toyota': [
+                CarListing(title='2014 Toyota Corolla', price='$7,500', location='NJ',
+                           url='http://example.com/stored', source='Craigslist', year='2014')
+            ]}, 'NJ')
+
+            rv = self.app.post('/api/search', json={'make': 'Toyota', 'location': 'NJ', 'mode': 'store'})
+            data = json.loads(rv.data)
+            self.assertEqual(data['mode'], 'store')
+            self.assertEqual([l['url'] for l in data['listings']], ['http://example.com/stored'])
+            self.assertEqual(data['stored']['count'], 1)
+
+            job = app_module.search_jobs.get(data['refresh_job_id'])
+            job = app_module.search_jobs.wait(job, version=1000, timeout=5)
+            self.assertEqual(job.status, 'done')
+        finally:
+            FakeCoordinator.store = None
+            os.unlink(path)
+
+    def test_refresh_key_ignores_make_order(self):
+        def key(body):
+            params, _ = app_module.parse_search_params(dict(body, location='NJ'))
+            return app_module.refresh_key(params)
+
+        self.assertEqual(key({'make': 'Toyota, Honda'}), key({'make': 'honda,toyota'}))
+        self.assertNotEqual(key({'make': 'Toyota'}), key({'make': 'Toyota', 'price_max': 9000}))
+
+    def test_unknown_job(self):
+        rv = self.app.get('/api/search/jobs/nope')
+        self.assertEqual(rv.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from scraper.base_scraper import CarListing
+from search_jobs import SearchJobManager
+
+
+class FakeCoordinator:
+    """Yields one listing per source; holds the second source until `release` is set"""
+
+    def __init__(self, release=None):
+        self.cache_info = {}
+        self.release = release
+
+    def iter_search(self, makes, **params):
+        for n, source in enumerate(('Craigslist', 'Cars.com')):
+            if n and self.release is not None:
+                self.release.wait(5)
+            self.cache_info[source] = {'hits': 0, 'misses': len(makes), 'age': None}
+            yield source, [CarListing(title=f'2015 {make}', price='$9,000', location='NJ',
+                                      url=f'http://example.com/{source}/{make}', source=source)
+                           for make in makes]
+
+    def filter_listings(self, listings, **filters):
+        return listings
+
+
+class SearchJobManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'jobs.db')
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def manager(self, **kwargs):
+        return SearchJobManager(lambda: FakeCoordinator(self.release), self.path, **kwargs)
+
+    def test_poll_from_another_worker(self):
+        runner, other = self.manager(), self.manager()
+        job = runner.submit({'makes': ['Toyota']})
+
+        # The other manager shares only the database, like another gunicorn worker
+        job = other.wait(other.get(job.id), version=1, timeout=5)
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.total, 1)
+        described = other.describe(job)
+        self.assertEqual([l['source'] for l in described['listings']], ['Craigslist'])
+
+        self.release.set()
+        job = other.wait(job, version=1000, timeout=5)
+        self.assertEqual(job.status, 'done')
+        described = other.describe(job, since=1)
+        self.assertEqual(described['summary'], {'Craigslist': 1, 'Cars.com': 1})
+        self.assertEqual(described['total'], 2)
+        self.assertEqual([l['source'] for l in described['listings']], ['Cars.com'])
+        self.assertIsNone(other.get('nope'))
+
+    def test_identical_pending_jobs_are_coalesced(self):
+        runner, other = self.manager(), self.manager()
+        first = runner.submit({'makes': ['Toyota']}, dedupe_key='toyota')
+        self.assertEqual(other.submit({'makes': ['Toyota']}, dedupe_key='toyota').id, first.id)
+        self.assertNotEqual(runner.submit({'makes': ['Honda']}, dedupe_key='honda').id, first.id)
+
+        # Once the job is done the next refresh starts a new one
+        self.release.set()
+        runner.wait(first, version=1000, timeout=5)
+        self.assertNotEqual(runner.submit({'makes': ['Toyota']}, dedupe_key='toyota').id, first.id)
+
+    def test_unfinished_jobs_fail_after_max_age(self):
+        manager = self.manager(max_age=0.1)
+        job = manager.submit({'makes': ['Toyota']})
+        time.sleep(0.2)
+        manager._purged_at = 0
+        job = manager.get(job.id)
+        self.assertEqual((job.status, job.error), ('error', 'Search timed out'))
+
+        # The search stops adding to a job nobody waits for any more
+        self.release.set()
+        time.sleep(0.1)
+        self.assertEqual(manager.get(job.id).total, 1)
+
+    def test_finished_jobs_expire(self):
+        self.release.set()
+        manager = self.manager(ttl=0)
+        job = manager.wait(manager.submit({'makes': ['Toyota']}), version=1000, timeout=5)
+        self.assertEqual(job.status, 'done')
+        manager._purged_at = 0
+        self.assertIsNone(manager.get(job.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+from scraper.base_scraper import CarListing
+from scraper.craigslist_scraper import CraigslistScraper
+from scraper.tracing import MAX_SPANS, bind, current_trace, span, tracing
+
+
+def make_listing(n):
+    return CarListing(title=f'2015 Honda Civic #{n}', price='$9,000', location='Austin',
+                      url=f'http://example.com/{n}', source='Test')
+
+
+def find(nodes, name):
+    """Depth-first list of the span dicts called name"""
+    found = []
+    for node in nodes:
+        if node['name'] == name:
+            found.append(node)
+        found.extend(find(node['children'], name))
+    return found
+
+
+class TracingTestCase(unittest.TestCase):
+    def test_spans_are_noops_outside_a_trace(self):
+        self.assertIsNone(current_trace())
+        with span('parse'):
+            pass
+        fn = lambda: None
+        self.assertIs(bind(fn), fn)
+
+    def test_nested_spans(self):
+        with tracing('search', make='Honda') as trace:
+            with span('source', source='Craigslist'):
+                with span('parse'):
+                    pass
+            with span('filter_listings'):
+                pass
+        self.assertIsNone(current_trace())
+
+        tree = trace.to_dict()
+        root, = tree['spans']
+        self.assertEqual(root['attrs'], {'make': 'Honda'})
+        source, filtered = root['children']
+        self.assertEqual(source['attrs'], {'source': 'Craigslist'})
+        self.assertEqual([c['name'] for c in source['children']], ['parse'])
+        self.assertEqual(filtered['name'], 'filter_listings')
+        self.assertLessEqual(source['start_ms'], source['children'][0]['start_ms'])
+        self.assertGreaterEqual(root['duration_ms'], source['duration_ms'])
+        self.assertEqual(tree['totals']['parse']['count'], 1)
+
+    def test_bound_functions_record_on_other_threads(self):
+        def work(n):
+            with span('page', page=n):
+                return threading.current_thread().name
+
+        with tracing('search') as trace:
+            with span('source'):
+                with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                    threads = set(executor.map(bind(work), range(4)))
+            # Unbound work on another thread isn't recorded
+            thread = threading.Thread(target=work, args=(99,))
+            thread.start()
+            thread.join()
+
+        source, = find(trace.to_dict()['spans'], 'source')
+        self.assertEqual(sorted(c['attrs']['page'] for c in source['children']), [0, 1, 2, 3])
+        self.assertEqual({c['thread'] for c in source['children']}, threads)
+
+    def test_scraper_stages_nest_under_pages(self):
+        scraper = CraigslistScraper(use_selenium=False)
+
+        def fetch(page):
+            with scraper.timed('parse'):
+                return [make_listing(page)]
+
+        with tracing('search') as trace:
+            scraper._collect_pages(fetch, max_results=3, page_size=1, concurrency=3)
+        pages = find(trace.to_dict()['spans'], 'page')
+        self.assertEqual(len(pages), 3)
+        for page in pages:
+            self.assertEqual(page['attrs']['source'], 'Craigslist')
+            self.assertEqual([c['name'] for c in page['children']], ['parse'])
+
+    def test_span_limit(self):
+        with tracing('search') as trace:
+            for _ in range(MAX_SPANS + 10):
+                with span('parse'):
+                    pass
+        tree = trace.to_dict()
+        self.assertEqual(tree['totals']['parse']['count'], MAX_SPANS - 1)
+        self.assertEqual(tree['dropped'], 11)
+
+    def test_chrome_trace(self):
+        with tracing('search') as trace:
+            with span('page_load', source='Cars.com'):
+                pass
+            bind(lambda: None)()
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            trace.write_chrome_trace(path)
+            with open(path) as f:
+                data = json.load(f)
+        finally:
+            os.unlink(path)
+        complete = [e for e in data['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in complete], ['search', 'page_load'])
+        self.assertEqual(complete[1]['args'], {'source': 'Cars.com'})
+        self.assertGreaterEqual(complete[1]['ts'], complete[0]['ts'])
+        names = [e for e in data['traceEvents'] if e['ph'] == 'M']
+        self.assertEqual(names[0]['args']['name'], threading.current_thread().name)
+
+
+if __name__ == '__main__':
+    unittest.main()